@@ -0,0 +1,691 @@
+
+import numpy
+import pandas
+import pytest
+from scipy.optimize import approx_fprime
+import scipy.spatial
+from functools import partial
+
+seed = 123456789
+
+
+def random_translocations(n=200, k=10, dt=.05, sigma=.1):
+    """Brownian trajectories in the unit square; faster than `random_walk`."""
+    numpy.random.seed(seed)
+    start = numpy.random.rand(n, 2)
+    xy = start[:,numpy.newaxis,:] + numpy.cumsum(sigma * numpy.random.randn(n, k, 2), axis=1)
+    return pandas.DataFrame(dict(
+            n=numpy.repeat(numpy.arange(1, n+1), k),
+            x=xy[...,0].ravel(),
+            y=xy[...,1].ravel(),
+            t=numpy.tile(numpy.arange(k) * dt, n),
+        ), columns=list('nxyt'))
+
+def grid_cells(avg_location_count=40, **kwargs):
+    from tramway.helper import tessellate
+    from tramway.inference import distributed
+    partition = tessellate(random_translocations(**kwargs), 'grid',
+            avg_location_count=avg_location_count, min_location_count=0)
+    return distributed(partition)
+
+
+class Minimization(Exception):
+    """Raised in place of :func:`scipy.optimize.minimize` to capture its arguments."""
+    def __init__(self, fun, x0, args=(), jac=None, **kwargs):
+        Exception.__init__(self)
+        self.fun, self.x0, self.args, self.jac, self.kwargs = fun, x0, args, jac, kwargs
+
+    def __call__(self, x):
+        return self.fun(x, *self.args)
+
+    def grad(self, x):
+        return self.jac(x, *self.args)
+
+def capture_minimize(*args, **kwargs):
+    raise Minimization(*args, **kwargs)
+
+def capture(monkeypatch, module, infer, cells, **kwargs):
+    monkeypatch.setattr(module, 'minimize', capture_minimize)
+    with pytest.raises(Minimization) as info:
+        infer(cells, **kwargs)
+    return info.value
+
+
+from tramway.inference import standard_d, standard_df, standard_ddrift, dv
+modes = dict(
+        D=(standard_d, standard_d.infer_smooth_D, dict(diffusivity_prior=1.)),
+        DF=(standard_df, standard_df.infer_smooth_DF, dict(diffusivity_prior=1., force_prior=1.)),
+        DD=(standard_ddrift, standard_ddrift.infer_smooth_DD, dict(diffusivity_prior=1., drift_prior=1.)),
+        DV=(dv, dv.inferDV, dict(diffusivity_prior=1., potential_prior=1., verbose=False)),
+        )
+
+class TestPosteriorGradient(object):
+
+    cells = None
+
+    def setup_method(self, method):
+        if TestPosteriorGradient.cells is None:
+            TestPosteriorGradient.cells = grid_cells()
+
+    def _test_gradient(self, monkeypatch, mode, **kwargs):
+        module, infer, _kwargs = modes[mode]
+        _kwargs = dict(_kwargs)
+        _kwargs.update(kwargs)
+        problem = capture(monkeypatch, module, infer, self.cells, **_kwargs)
+        assert callable(problem.jac)
+        numpy.random.seed(seed)
+        x = problem.x0 * numpy.exp(.1 * numpy.random.randn(problem.x0.size))
+        grad = problem.grad(x)
+        numeric_grad = approx_fprime(x, problem, 1e-6)
+        scale = numpy.max(numpy.abs(numeric_grad))
+        assert numpy.allclose(grad, numeric_grad, rtol=1e-3, atol=1e-4 * scale)
+
+    @pytest.mark.parametrize('mode', sorted(modes))
+    def test_gradient(self, monkeypatch, mode):
+        self._test_gradient(monkeypatch, mode)
+
+    @pytest.mark.parametrize('mode', sorted(modes))
+    def test_gradient_with_jeffreys_prior(self, monkeypatch, mode):
+        self._test_gradient(monkeypatch, mode, jeffreys_prior=True)
+
+    def test_gradient_with_delta0(self, monkeypatch):
+        self._test_gradient(monkeypatch, 'D', rgrad='delta0')
+
+    def test_numeric_gradient(self, monkeypatch):
+        module, infer, kwargs = modes['D']
+        problem = capture(monkeypatch, module, infer, self.cells,
+                posterior_gradient='numeric', **kwargs)
+        assert problem.jac is None
+
+
+from tramway.inference.flat import *
+class TestFlatEngine(object):
+
+    cells = None
+
+    def setup_method(self, method):
+        if TestFlatEngine.cells is None:
+            TestFlatEngine.cells = grid_cells()
+
+    def test_flat_translocations(self):
+        index = numpy.array(list(self.cells.keys()))
+        flat = FlatTranslocations(self.cells, index)
+        assert flat.cell_count == index.size
+        assert flat.dim == 2
+        dt_sum = flat.sum(flat.dt)
+        dr_sum = flat.sum(flat.dr)
+        for k, i in enumerate(index):
+            cell = self.cells[i]
+            assert flat.count[k] == cell.dt.size
+            assert numpy.isclose(dt_sum[k], numpy.sum(cell.dt))
+            assert numpy.allclose(dr_sum[k], numpy.sum(cell.dr, axis=0))
+        assert numpy.array_equal(flat.expand(index), index[flat.cell_id])
+
+    @pytest.mark.parametrize('mode', sorted(modes))
+    @pytest.mark.parametrize('jeffreys_prior', [False, True])
+    def test_flat_vs_loop(self, monkeypatch, mode, jeffreys_prior):
+        module, infer, kwargs = modes[mode]
+        flat = capture(monkeypatch, module, infer, self.cells,
+                posterior_engine='flat', jeffreys_prior=jeffreys_prior, **kwargs)
+        loop = capture(monkeypatch, module, infer, self.cells,
+                posterior_engine='loop', jeffreys_prior=jeffreys_prior, **kwargs)
+        assert numpy.allclose(flat.x0, loop.x0)
+        numpy.random.seed(seed)
+        x = flat.x0 * numpy.exp(.1 * numpy.random.randn(flat.x0.size))
+        assert numpy.isclose(flat(x), loop(x))
+        assert numpy.allclose(flat.grad(x), loop.grad(x))
+
+    def test_unknown_engine(self):
+        with pytest.raises(ValueError):
+            standard_d.infer_smooth_D(self.cells, posterior_engine='unknown')
+
+
+from tramway.inference.base import Distributed
+from tramway.inference.gradient import *
+class TestLinearOperator(object):
+
+    def operator_matrix(self, cells, function, index, index_map, form=None):
+        def operator(i, X, index_map=None):
+            return function(cells, i, X, index_map)
+        forms = local_linear_forms(cells, operator, index, index_map, form=form)
+        return LocalLinearOperator(forms, index.size)
+
+    @pytest.mark.parametrize('function', [grad1, gradn, delta0, delta0_without_scaling, delta1])
+    def test_explicit_forms(self, function):
+        cells = grid_cells()
+        index = numpy.array(list(cells.keys()))
+        reverse_index = numpy.full(cells.adjacency.shape[0], -1, dtype=int)
+        reverse_index[index] = numpy.arange(index.size)
+        probed = self.operator_matrix(cells, function, index, reverse_index)
+        explicit = self.operator_matrix(cells, function, index, reverse_index,
+                linear_forms[function])
+        assert numpy.array_equal(probed.defined, explicit.defined)
+        assert numpy.array_equal(probed.na_rows, explicit.na_rows)
+        assert numpy.allclose(probed.matrix.toarray(), explicit.matrix.toarray())
+        # evaluate the operator on a random vector
+        numpy.random.seed(seed)
+        X = numpy.random.randn(index.size)
+        Y = explicit.dot(X)
+        y = numpy.concatenate([ numpy.ravel(function(cells, i, X, reverse_index))
+            for i in index if function(cells, i, X, reverse_index) is not None ])
+        assert numpy.allclose(Y, y, equal_nan=True)
+
+    def test_memoization(self):
+        cells = grid_cells()
+        index = numpy.array(list(cells.keys()))
+        G = cells.linear_operator('grad', index)
+        assert cells.linear_operator('grad', index) is G
+        assert cells.linear_operator('local_variation', index) is not G
+        cells.adjacency = cells.adjacency # invalidates the operators
+        assert cells.linear_operator('grad', index) is not G
+
+    def test_overridden_operator(self):
+        class ScaledGrad(Distributed):
+            __slots__ = ()
+            def grad(self, i, X, index_map=None, scale=None):
+                return numpy.asarray(scale) * grad1(self, i, X, index_map)
+        cells = grid_cells()
+        index = numpy.array(list(cells.keys()))
+        G = cells.linear_operator('grad', index)
+        cells.__class__ = ScaledGrad
+        assert cells._operator_function('grad') is None
+        assert cells._operator_function('local_variation') is delta0
+        # unhashable keyword arguments; not memoized
+        scale = [2., -1.]
+        H = cells.linear_operator('grad', index, scale=scale)
+        assert cells.linear_operator('grad', index, scale=scale) is not H
+        numpy.random.seed(seed)
+        X = numpy.random.randn(cells.adjacency.shape[0])
+        g, h = G.per_cell(X, 2), H.per_cell(X, 2)
+        assert numpy.allclose(h, g * numpy.array(scale), equal_nan=True)
+
+
+def _square(x):
+    return x * x
+
+from tramway.inference.base import map_cells
+class TestMapCells(object):
+
+    def test_order(self):
+        items = list(range(30))
+        for share_data in (None, False, True):
+            assert map_cells(_square, items, worker_count=2, chunksize=4,
+                    share_data=share_data) == [ x * x for x in items ]
+
+    def test_reentrancy(self):
+        # nested calls from the parent process, while the workers of the outer call
+        # hold a copy of the outer items
+        outer, inner = list(range(20)), list(range(100, 110))
+        nested = []
+        def progress(n, total):
+            if n == 1:
+                nested.append(map_cells(_square, inner, worker_count=2, share_data=True))
+        assert map_cells(_square, outer, worker_count=2, progress=progress,
+                share_data=True) == [ x * x for x in outer ]
+        assert nested == [[ x * x for x in inner ]]
+
+    def test_distributed_run(self):
+        cells = grid_cells()
+        groups = cells.group(ngroups=4)
+        total = groups.run(_cell_count, worker_count=2)
+        assert set(total.index) == set(cells.keys())
+
+def _cell_count(cells):
+    import pandas
+    return pandas.DataFrame(numpy.ones((len(cells), 1)), index=list(cells.keys()), columns=['one'])
+
+
+from tramway.inference.base import CellRows
+class TestDistributed(object):
+
+    def test_cell_rows(self):
+        numpy.random.seed(seed)
+        rows = numpy.random.randint(-1, 100, size=300)
+        cells = numpy.random.randint(-1, 10, size=300)
+        index = CellRows(rows, cells, 100)
+        assert index.cell_count == 10
+        for j in range(-1, 12):
+            expected = numpy.unique(rows[(cells == j) & (0 <= rows)]) if 0 <= j else []
+            assert numpy.array_equal(index.get(j), expected)
+            mask = numpy.zeros(100, dtype=bool)
+            mask[expected] = True
+            assert numpy.array_equal(index(j), mask)
+
+    def test_index_formats(self):
+        import copy
+        import scipy.sparse as sparse
+        from tramway.helper import tessellate
+        from tramway.inference import distributed
+        partition = tessellate(random_translocations(), 'grid', avg_location_count=40,
+                min_location_count=0)
+        reference = distributed(partition)
+        cell_index = partition.cell_index
+        n = cell_index.size
+        pair = copy.copy(partition)
+        pair.cell_index = (numpy.arange(n), cell_index)
+        csr = copy.copy(partition)
+        csr.cell_index = sparse.csr_matrix((numpy.ones(n, dtype=bool),
+                (numpy.arange(n), cell_index)), shape=(n, cell_index.max() + 1))
+        for other in (pair, csr):
+            cells = distributed(other)
+            assert set(cells.keys()) == set(reference.keys())
+            for i in reference.keys():
+                assert numpy.array_equal(cells[i].dr, reference[i].dr)
+                assert numpy.array_equal(cells[i].dt, reference[i].dt)
+                assert numpy.array_equal(cells[i].n, reference[i].n)
+
+
+class TestPerCellInference(object):
+
+    partition = None
+
+    def setup_method(self, method):
+        if TestPerCellInference.partition is None:
+            from tramway.helper import tessellate
+            TestPerCellInference.partition = tessellate(random_translocations(), 'grid',
+                    avg_location_count=40, min_location_count=0)
+
+    @pytest.mark.parametrize('mode, kwargs', [
+        ('degraded.d', dict(jeffreys_prior=True)), ('degraded.df', {}), ('degraded.dd', {}),
+        ])
+    def test_parallel_vs_sequential(self, mode, kwargs):
+        from tramway.helper import infer
+        sequential = infer(self.partition, mode, worker_count=1, localization_error=.01, **kwargs)
+        calls = []
+        parallel = infer(self.partition, mode, worker_count=2, chunksize=3,
+                progress=lambda n, total: calls.append(n), localization_error=.01, **kwargs)
+        assert sequential.maps.equals(parallel.maps)
+        assert calls and calls == list(range(1, len(calls) + 1))
+
+    def test_bayes_factor_per_cell(self):
+        from types import SimpleNamespace
+        from tramway.inference.bayes_factors import _bayes_factor_for_one_cell, _input_vars
+        from tramway.inference.bayes_factors.calculate_bayes_factors import \
+                calculate_bayes_factors_for_one_cell
+        numpy.random.seed(seed)
+        inputs = [ dict(zeta_total=numpy.random.randn(2), zeta_spurious=.1 * numpy.random.randn(2),
+                n=numpy.random.randint(5, 50), V=.01 * numpy.random.rand() + .001,
+                V_prior=.01 * numpy.random.rand() + .001) for _ in range(20) ]
+        inputs[3]['V'] = numpy.nan
+        assert set(inputs[0]) == set(_input_vars)
+        kwargs = dict(B_threshold=10, verbose=False)
+        results = map_cells(partial(_bayes_factor_for_one_cell, .001, kwargs), inputs,
+                worker_count=2)
+        assert results[3] is None
+        for k, cell in enumerate(inputs):
+            if k == 3:
+                continue
+            expected = calculate_bayes_factors_for_one_cell(SimpleNamespace(**cell), .001, **kwargs)
+            assert numpy.allclose(results[k], expected)
+
+
+from tramway.inference import degraded_d
+class TestBatchD(object):
+
+    cells = None
+
+    def setup_method(self, method):
+        if TestBatchD.cells is None:
+            TestBatchD.cells = grid_cells()
+
+    @pytest.mark.parametrize('min_diffusivity', [None, .05])
+    def test_batch_vs_scalar(self, min_diffusivity):
+        index = list(self.cells.keys())
+        cells = [ self.cells[i] for i in index ]
+        D, converged = degraded_d.batch_infer_D(cells, .0001, min_diffusivity)
+        assert numpy.all(converged)
+        expected = [ degraded_d.infer_D(cell, .0001, False, min_diffusivity) for cell in cells ]
+        assert numpy.allclose(D, expected, rtol=1e-5)
+        if min_diffusivity is not None:
+            assert numpy.all(min_diffusivity <= D)
+
+    def test_dispatch(self, monkeypatch):
+        calls = []
+        minimize = degraded_d.minimize
+        def counting_minimize(*args, **kwargs):
+            calls.append(kwargs)
+            return minimize(*args, **kwargs)
+        monkeypatch.setattr(degraded_d, 'minimize', counting_minimize)
+        batch = degraded_d.infer_D(self.cells, localization_error=.01, worker_count=1)
+        assert not calls
+        # options to the scalar procedure disable the batch solver
+        scalar = degraded_d.infer_D(self.cells, localization_error=.01, worker_count=1, tol=1e-10)
+        assert len(calls) == len(list(self.cells.keys()))
+        assert numpy.allclose(batch.values, scalar.values, rtol=1e-4)
+        del calls[:]
+        degraded_d.infer_D(self.cells, localization_error=.01, worker_count=1, jeffreys_prior=True)
+        assert len(calls) == len(list(self.cells.keys()))
+
+
+from tramway.inference.base import CellCache
+class TestCellCache(object):
+
+    def test_dependencies(self):
+        cache = CellCache()
+        cache.set('a', 1, ('dr',))
+        cache.set('b', 2, ('a',))
+        cache.set('c', 3, ('dt',))
+        cache['d'] = 4 # depends on 'run'
+        assert cache.invalidate('dr') == {'a', 'b'}
+        assert set(cache) == {'c', 'd'}
+        assert cache.invalidate('run') == {'d'}
+        assert cache.cached('c', lambda: 0) == 3
+        assert cache.cached('e', lambda: 5, ('c',)) == 5
+        del cache['c']
+        assert not cache
+
+    def test_pickle(self):
+        import pickle
+        cache = CellCache()
+        cache.set('a', 1, ('dr',))
+        cache['b'] = 2
+        copy = pickle.loads(pickle.dumps(cache))
+        assert isinstance(copy, CellCache)
+        assert dict(copy) == dict(cache)
+        assert copy.dependencies == cache.dependencies
+
+    def test_cell_attributes(self):
+        cells = grid_cells()
+        i = next(iter(cells.keys()))
+        cell = cells[i]
+        cell.cache = {'legacy': 0}
+        dt_mean = cell.cached('dt_mean', lambda: numpy.mean(cell.dt), ('dt',))
+        assert isinstance(cell.cache, CellCache)
+        assert cell.cache['legacy'] == 0 and numpy.isclose(dt_mean, numpy.mean(cell.dt))
+        cell.dt = 2. * cell.dt
+        assert 'dt_mean' not in cell.cache
+        assert numpy.isclose(cell.cached('dt_mean', lambda: numpy.mean(cell.dt), ('dt',)),
+                2. * dt_mean)
+
+    def test_run(self):
+        cells = grid_cells()
+        index = list(cells.keys())
+        X = numpy.ones(cells.adjacency.shape[0])
+        for i in index:
+            cells.grad(i, X)
+            cells[i].cached('dr2', lambda: numpy.sum(cells[i].dr ** 2, axis=1), ('dr',))
+        degraded_d.infer_D(cells, localization_error=.01, jeffreys_prior=True, worker_count=1)
+        assert all( 'dt_mean' in cells[i].cache for i in index )
+        cells.run(lambda cells: None)
+        for i in index:
+            # the group-relative entries are dropped; the others persist
+            assert 'grad1' not in cells[i].cache
+            assert 'dr2' in cells[i].cache and 'dt_mean' in cells[i].cache
+
+
+from tramway.inference import stochastic_dv
+class TestStochasticDVGradient(object):
+
+    def capture(self, monkeypatch, cells, **kwargs):
+        def capture_sbfgs(fun, x0, component, covariate, gradient_subspace, descent_subspace,
+                args=(), jac=None, **kwargs):
+            raise Minimization(fun, x0, args, jac)
+        monkeypatch.setattr(stochastic_dv, 'minimize_sparse_bfgs', capture_sbfgs)
+        with pytest.raises(Minimization) as info:
+            stochastic_dv.infer_stochastic_DV(cells, verbose=False, **kwargs)
+        return info.value
+
+    def test_forms(self):
+        cells = grid_cells()
+        index = numpy.array(list(cells.keys()))
+        reverse_index = numpy.full(cells.adjacency.shape[0], -1, dtype=int)
+        reverse_index[index] = numpy.arange(index.size)
+        for name in ('grad', 'local_variation'):
+            G = cells.linear_operator(name, index, reverse_index)
+            forms = G.forms()
+            assert G.forms() is forms
+            numpy.random.seed(seed)
+            X = numpy.random.randn(index.size)
+            for j, form in enumerate(local_linear_forms(cells, getattr(cells, name), index,
+                    reverse_index)):
+                if forms[j] is None:
+                    assert form is None or numpy.all(numpy.isnan(form[1].dot(X[form[0]])))
+                    continue
+                cols, A = forms[j]
+                assert numpy.allclose(A.dot(X[cols]), form[1].dot(X[form[0]]), equal_nan=True)
+
+    @pytest.mark.parametrize('priors', [dict(), dict(diffusivity_prior=1., potential_prior=1.)])
+    def test_gradient(self, monkeypatch, priors):
+        cells = grid_cells()
+        m = self.capture(monkeypatch, cells, localization_error=.01, jeffreys_prior=True,
+                **priors)
+        numpy.random.seed(seed)
+        x = m.x0 * numpy.exp(.1 * numpy.random.randn(m.x0.size))
+        fun = lambda x: sum( m.fun(j, x, *m.args) for j in range(m.x0.size // 2) )
+        grad = numpy.zeros_like(x)
+        for j in range(m.x0.size // 2):
+            indices, partial_grad = m.jac(j, x, *m.args)
+            numpy.add.at(grad, indices, partial_grad)
+        # centered differences; the posterior sums many cells
+        h = 1e-6
+        fd = numpy.array([ (fun(x + h * e) - fun(x - h * e)) / (2 * h)
+            for e in numpy.eye(x.size) ])
+        assert numpy.allclose(grad, fd, rtol=1e-4, atol=1e-4)
+
+
+from tramway.inference.stochastic_dv import make_regions, lookup_space_cells
+class TestRegions(object):
+
+    def dynamic_cells(self):
+        from tramway.helper import tessellate
+        from tramway.inference import distributed
+        from tramway.inference.time import DynamicCells, DynamicTranslocations
+        partition = tessellate(random_translocations(), 'grid', avg_location_count=80,
+                min_location_count=0, time_window_duration=.2, time_window_shift=.2,
+                enable_time_regularization=True)
+        return distributed(partition, new_cell=DynamicTranslocations, new_group=DynamicCells)
+
+    @pytest.mark.parametrize('size', [0, 1, 2])
+    def test_make_regions(self, size):
+        cells = grid_cells()
+        A = cells.adjacency
+        # leave some cells out of the index
+        index = numpy.array(list(cells.keys()))[::2]
+        reverse_index = numpy.full(A.shape[0], -1, dtype=int)
+        reverse_index[index] = numpy.arange(index.size)
+        regions = make_regions(cells, index, reverse_index, size)
+        assert regions.shape == (index.size, index.size)
+        for j, i in enumerate(index):
+            region = {i}
+            for _ in range(size):
+                region |= { k for l in region for k in A.indices[A.indptr[l]:A.indptr[l+1]] }
+            expected = sorted( reverse_index[k] for k in region if 0 <= reverse_index[k] )
+            assert list(regions.indices[regions.indptr[j]:regions.indptr[j+1]]) == expected
+
+    def test_lookup_space_cells(self):
+        cells = self.dynamic_cells()
+        A = cells.temporal_adjacency
+        space_cells = lookup_space_cells(cells)
+        groups = { frozenset(space_cells.indices[space_cells.indptr[k]:space_cells.indptr[k+1]])
+            for k in range(space_cells.shape[0]) }
+        assert len(groups) == space_cells.shape[0]
+        # breadth-first search
+        expected, available = set(), set(cells.keys())
+        while available:
+            group, front = set(), { available.pop() }
+            while front:
+                group |= front
+                front = { k for l in front for k in A.indices[A.indptr[l]:A.indptr[l+1]] } - group
+            available -= group
+            expected.add(frozenset(group))
+        assert groups == expected
+
+
+from tramway.inference.base import initial_values, interpolate_maps, cell_centers
+class TestWarmStart(object):
+
+    def test_initial_values(self):
+        index = numpy.array([3, 1, 4])
+        default = numpy.array([1., 2., 3.])
+        x0 = pandas.Series([10., numpy.nan], index=[4, 1])
+        assert numpy.array_equal(initial_values(x0, index, default), [1., 2., 10.])
+        assert numpy.array_equal(initial_values(5., index, default), [5., 5., 5.])
+        assert initial_values(None, index, default) is default
+        with pytest.raises(ValueError):
+            initial_values(numpy.ones(4), index, default)
+        # vector features
+        default = numpy.zeros((3, 2))
+        x0 = pandas.DataFrame([[1., 2.]], index=[1], columns=['force x', 'force y'])
+        assert numpy.array_equal(initial_values(x0, index, default), [[0., 0.], [1., 2.], [0., 0.]])
+
+    def test_interpolate_maps(self):
+        numpy.random.seed(seed)
+        source = numpy.random.rand(50, 2)
+        target = numpy.random.rand(30, 2)
+        slope = numpy.array([2., -1.])
+        maps = pandas.DataFrame(dict(v=source.dot(slope)))
+        nearest = interpolate_maps(maps, source, target)
+        brute_force = numpy.argmin(((target[:,None,:] - source[None,:,:]) ** 2).sum(axis=2), axis=1)
+        assert numpy.array_equal(nearest['v'].values, maps['v'].values[brute_force])
+        # linear maps are exactly interpolated within the convex hull
+        barycentric = interpolate_maps(maps, source, target, method='barycentric')
+        inside = 0 <= scipy.spatial.Delaunay(source).find_simplex(target)
+        assert numpy.any(inside)
+        assert numpy.allclose(barycentric['v'].values[inside], target[inside].dot(slope))
+        assert numpy.array_equal(barycentric['v'].values[~inside], nearest['v'].values[~inside])
+        # undefined source values are ignored
+        maps.iloc[brute_force[0]] = numpy.nan
+        assert not numpy.any(numpy.isnan(interpolate_maps(maps, source, target).values))
+        with pytest.raises(ValueError):
+            interpolate_maps(maps, source, target, method='cubic')
+
+    def test_cell_centers(self):
+        cells = grid_cells()
+        index, centers = cell_centers(cells)
+        assert set(index) == set(cells.keys())
+        assert numpy.array_equal(centers[0], cells[index[0]].center)
+
+    def test_x0_from(self, monkeypatch):
+        from tramway.helper import tessellate, infer
+        partition = tessellate(random_translocations(), 'grid', avg_location_count=40,
+                min_location_count=0)
+        maps = infer(partition, 'degraded.d', localization_error=.01, worker_count=1)
+        D = maps.maps['diffusivity']
+        monkeypatch.setattr(standard_d, 'minimize', capture_minimize)
+        for x0_from in (maps, (maps, partition)):
+            with pytest.raises(Minimization) as info:
+                infer(partition, 'standard.d', localization_error=.01, diffusivity_prior=1.,
+                        x0_from=x0_from)
+            assert numpy.allclose(numpy.sort(info.value.x0), numpy.sort(D.values))
+        # explicit initial values are not overridden
+        with pytest.raises(Minimization) as info:
+            infer(partition, 'standard.d', localization_error=.01, diffusivity_prior=1.,
+                    x0_from=maps, D0=.5)
+        assert numpy.all(info.value.x0 == .5)
+
+
+from tramway.inference import multigrid
+class TestMultigrid(object):
+
+    def partitions(self):
+        from tramway.helper import tessellate
+        translocations = random_translocations()
+        fine = tessellate(translocations, 'grid', avg_location_count=40, min_location_count=0)
+        coarse = tessellate(translocations, 'grid', avg_location_count=160, min_location_count=0)
+        return fine, coarse
+
+    def test_transfer(self):
+        parent_index = numpy.array([0, 0, 1, 1, 1])
+        coarse = pandas.DataFrame(dict(diffusivity=[1., 2.]))
+        fine = multigrid.prolongate(coarse, parent_index)
+        assert numpy.array_equal(fine['diffusivity'].values, [1., 1., 2., 2., 2.])
+
+    @pytest.mark.parametrize('verbose', [False, True])
+    def test_levels(self, monkeypatch, verbose):
+        fine, coarse = self.partitions()
+        fine_size = fine.tessellation.cell_adjacency.shape[0]
+        calls = []
+        def _run(mode, partition, x0=None, **kwargs):
+            calls.append((partition is fine, x0 is not None, kwargs))
+            n = partition.tessellation.cell_adjacency.shape[0]
+            return pandas.DataFrame(dict(diffusivity=numpy.full(n, float(len(calls)))))
+        monkeypatch.setattr(multigrid, '_run', _run)
+        maps = multigrid.infer_multigrid(fine, 'standard.d', coarse=coarse, max_iter=100,
+                verbose=verbose)
+        assert maps.shape[0] == fine_size
+        # coarse, then fine warm-started from the coarse maps
+        assert [ (is_fine, has_x0) for is_fine, has_x0, _ in calls ] == [(False, False), (True, True)]
+        assert [ kwargs['max_iter'] for _, _, kwargs in calls ] == [100, 100]
+        assert all( kwargs['verbose'] is verbose for _, _, kwargs in calls )
+
+    def test_infer(self):
+        fine, coarse = self.partitions()
+        maps = multigrid.infer_multigrid(fine, 'standard.d', coarse=coarse,
+                max_iter=20, localization_error=.01, diffusivity_prior=1.)
+        assert 'diffusivity' in maps.columns
+        assert numpy.all(0 < maps['diffusivity'].values)
+
+
+class TestRegularizationPath(object):
+
+    def partition(self):
+        from tramway.helper import tessellate
+        return tessellate(random_translocations(), 'grid', avg_location_count=40,
+                min_location_count=0)
+
+    def test_cold_start(self):
+        from tramway.helper import infer, infer_path, path_step
+        partition = self.partition()
+        priors = [1., dict(diffusivity_prior=10.)]
+        maps = infer_path(partition, 'standard.d', priors, warm_start=False, worker_count=2,
+                localization_error=.01, max_iter=20)
+        assert maps.priors == [dict(diffusivity_prior=1.), dict(diffusivity_prior=10.)]
+        assert maps.path.shape == (2, maps.maps.shape[0], maps.maps.shape[1])
+        for k, prior in enumerate((1., 10.)):
+            reference = infer(partition, 'standard.d', localization_error=.01, max_iter=20,
+                    diffusivity_prior=prior)
+            step = path_step(maps, k)
+            assert step.diffusivity_prior == prior
+            assert numpy.allclose(step.maps.reindex(reference.maps.index).values,
+                    reference.maps.values)
+        assert numpy.array_equal(maps.maps.values, maps.path[-1])
+
+    def test_warm_start(self):
+        from tramway.helper import infer, infer_path
+        partition = self.partition()
+        maps = infer_path(partition, 'standard.d', [1., 10.], localization_error=.01,
+                max_iter=20, criterion='nll')
+        reference = infer(partition, 'standard.d', localization_error=.01, max_iter=20,
+                diffusivity_prior=1.)
+        # the first value is not warm-started
+        assert numpy.allclose(maps.path[0], reference.maps.reindex(maps.maps.index).values)
+        assert maps.criterion.shape == (2,) and numpy.all(numpy.isfinite(maps.criterion))
+        with pytest.raises(ValueError):
+            infer_path(partition, 'standard.d', [1.], criterion='aic')
+
+
+from tramway.inference.base import frozen_bounds
+class TestSchwarz(object):
+
+    kwargs = dict(localization_error=.01, diffusivity_prior=1., potential_prior=1.,
+            verbose=False, worker_count=1)
+
+    def test_frozen_bounds(self):
+        index = numpy.array([2, 0, 1])
+        frozen = numpy.array([True, False, True])
+        D, V = numpy.array([1., 2., 3.]), numpy.array([4., 5., 6.])
+        bounds = frozen_bounds([(0., None)] * 6, frozen, index, D, V)
+        # `frozen` is indexed by cell index; the values by position in `index`
+        assert bounds == [(1., 1.), (2., 2.), (0., None), (4., 4.), (5., 5.), (0., None)]
+        assert frozen_bounds(None, frozen, index, D) == [(1., 1.), (2., 2.), (None, None)]
+        assert frozen_bounds(bounds, None, index, D) is bounds
+
+    def test_errors(self):
+        cells = grid_cells()
+        with pytest.raises(TypeError):
+            cells.run_schwarz(dv.inferDV, **self.kwargs)
+        with pytest.raises(ValueError):
+            cells.group(ngroups=4).run_schwarz(standard_d.infer_smooth_D, **self.kwargs)
+
+    def test_halo_exchange(self):
+        cells = grid_cells()
+        reference = cells.run(dv.inferDV, **self.kwargs)
+        if isinstance(reference, tuple):
+            reference = reference[0]
+        groups = cells.group(ngroups=4)
+        independent = groups.run_schwarz(dv.inferDV, halo_exchange=0, **self.kwargs)
+        exchanged = groups.run_schwarz(dv.inferDV, halo_exchange=4, **self.kwargs)
+        error = lambda maps: numpy.max(numpy.abs(
+            maps.reindex(reference.index).values - reference.values), axis=0)
+        # the seams fade away
+        assert numpy.all(error(exchanged) < .5 * error(independent))
@@ -0,0 +1,132 @@
+
+import numpy
+import pytest
+
+seed = 123456789
+
+
+def chain_fun(i, x, c):
+    """Component of :math:`\\sum_i (x_i - c_i)^2 + \\sum_i (x_i - x_{i+1})^2`."""
+    f = (x[i] - c[i]) ** 2
+    if i + 1 < x.size:
+        f += (x[i] - x[i+1]) ** 2
+    return f
+
+def chain_grad(x, c):
+    g = 2. * (x - c)
+    dx = x[:-1] - x[1:]
+    g[:-1] += 2. * dx
+    g[1:] -= 2. * dx
+    return g
+
+class ChainProblem(object):
+
+    def __init__(self, n=20):
+        numpy.random.seed(seed)
+        self.n = n
+        self.c = numpy.random.randn(n)
+
+    def covariate(self, i):
+        return numpy.arange(max(0, i - 1), min(self.n, i + 2))
+
+    def gradient_subspace(self, i):
+        return numpy.array([i])
+
+    def minimize(self, fun=chain_fun, **kwargs):
+        from tramway.inference.optimization import minimize_sparse_bfgs
+        options = dict(max_iter=1000, ftol=1e-12, independent_components=True, memory=None, eps=1.,
+                ls_step_max=2., ls_wolfe=(.5, None), worker_count=0)
+        options.update(kwargs)
+        numpy.random.seed(seed) # component order
+        return minimize_sparse_bfgs(fun, numpy.zeros(self.n), self.n, self.covariate,
+                self.gradient_subspace, None, (self.c,), **options)
+
+
+class TestThreadBackend(object):
+
+    def test_minimize(self):
+        problem = ChainProblem()
+        result = problem.minimize(worker_count=2, backend='thread')
+        assert numpy.max(numpy.abs(chain_grad(result.x, problem.c))) < 1e-3
+        reference = problem.minimize()
+        assert numpy.allclose(result.x, reference.x, atol=1e-3)
+
+    def test_overlapping_components(self):
+        # the components covary with their neighbours, so that simultaneous components
+        # read the parameters that other components modify
+        problem = ChainProblem()
+        calls = []
+        def fun(i, x, c):
+            calls.append(i)
+            return chain_fun(i, x, c)
+        records = []
+        result = problem.minimize(fun, worker_count=4, backend='thread',
+                telemetry=records.append)
+        assert numpy.max(numpy.abs(chain_grad(result.x, problem.c))) < 1e-3
+        assert 1 < len({ record['worker'] for record in records })
+        # the workers count the calls of their own job steps only
+        ncalls = [ record['ncalls'] for record in records ]
+        assert sum(ncalls) <= len(calls)
+        assert all( 0 < n for n in ncalls )
+
+
+class TestTelemetry(object):
+
+    keys = {'iter', 'component', 'worker', 'time', 'elapsed', 'utilisation', 'ncalls',
+            'f', 'df', 'dg', 'ls_failure', 'ls_resolution', 'active', 'paused',
+            'pending_tasks', 'pending_results'}
+
+    def test_callable(self):
+        problem = ChainProblem()
+        records = []
+        result = problem.minimize(max_iter=50, telemetry=records.append)
+        assert records
+        assert all( set(record) == self.keys for record in records )
+        iters = [ record['iter'] for record in records ]
+        assert iters == sorted(iters) and len(set(iters)) == len(iters)
+        assert iters[-1] < result.niter
+        assert all( 0 <= record['component'] < problem.n for record in records )
+
+    def test_json_lines(self, tmpdir):
+        import io, json
+        problem = ChainProblem()
+        path = str(tmpdir.join('telemetry.jsonl'))
+        records = []
+        problem.minimize(max_iter=50, telemetry=records.append)
+        problem.minimize(max_iter=50, telemetry=path)
+        with open(path) as f:
+            lines = [ json.loads(line) for line in f ]
+        assert [ line['iter'] for line in lines ] == [ record['iter'] for record in records ]
+        assert [ line['f'] for line in lines ] == [ record['f'] for record in records ]
+        # records are appended; a file object is left open
+        stream = io.StringIO()
+        problem.minimize(max_iter=50, telemetry=stream)
+        assert not stream.closed
+        assert len(stream.getvalue().splitlines()) == len(lines)
+
+
+class TestCheckpoint(object):
+
+    def test_resume(self, tmpdir):
+        problem = ChainProblem()
+        path = str(tmpdir.join('checkpoint.rwa'))
+        uninterrupted = problem.minimize(max_iter=60)
+        assert uninterrupted.niter == 60
+        interrupted = problem.minimize(max_iter=30, checkpoint=path, checkpoint_interval=7)
+        assert not numpy.array_equal(interrupted.x, uninterrupted.x)
+        resumed = problem.minimize(max_iter=60, resume_from=path)
+        assert resumed.niter == 60
+        assert numpy.array_equal(resumed.x, uninterrupted.x)
+
+    def test_interval(self, monkeypatch):
+        from tramway.inference.optimization import SBFGSScheduler
+        problem = ChainProblem()
+        states = []
+        def save_checkpoint(self, path=None):
+            states.append(self.get_checkpoint())
+            self.iter_since_checkpoint = 0
+        monkeypatch.setattr(SBFGSScheduler, 'save_checkpoint', save_checkpoint)
+        result = problem.minimize(max_iter=30, checkpoint='unused', checkpoint_interval=10)
+        # every `checkpoint_interval` iterations, plus on completion
+        assert [ state['k'] for state in states ] == [10, 20, 30, 30]
+        assert numpy.array_equal(states[-1]['x'], result.x)
@@ -0,0 +1,230 @@
+
+import numpy
+import pytest
+import multiprocessing
+
+seed = 123456789
+
+
+def square(x):
+    return x * x
+
+def pid(x):
+    import os
+    return os.getpid()
+
+def fail(x):
+    raise ValueError(x)
+
+def read_shared(shared_array):
+    return numpy.array(shared_array.data)
+
+
+from tramway.core.parallel import *
+class TestItemPool(object):
+
+    def test_order(self):
+        items = list(range(50))
+        for share_data in (False, True):
+            with ItemPool(items, 2, share_data=share_data) as pool:
+                assert pool.worker_count == 2
+                assert pool.map(square, chunksize=3) == [ x * x for x in items ]
+                # several maps with the same workers
+                assert pool.map(square) == [ x * x for x in items ]
+            assert pool.pool is None
+
+    def test_sequential(self):
+        import os
+        with ItemPool(list(range(10)), 1) as pool:
+            assert pool.pool is None
+            assert pool.map(pid) == [os.getpid()] * 10
+
+    def test_concurrent_pools(self):
+        # each pool holds its own copy of the items
+        a, b = list(range(20)), list(range(100, 120))
+        with ItemPool(a, 2, share_data=True) as p:
+            with ItemPool(b, 2, share_data=True) as q:
+                assert q.map(square) == [ x * x for x in b ]
+                assert p.map(square) == [ x * x for x in a ]
+
+    def test_progress(self):
+        calls = []
+        with ItemPool(list(range(10)), 2) as pool:
+            pool.map(square, progress=lambda n, total: calls.append((n, total)))
+        assert calls == [ (n, 10) for n in range(1, 11) ]
+
+    def test_error(self):
+        with pytest.raises(ValueError):
+            with ItemPool(list(range(10)), 2) as pool:
+                pool.map(fail)
+        assert pool.pool is None
+
+    def test_start_method(self):
+        unset = multiprocessing.get_start_method(allow_none=True) is None
+        assert start_method() in multiprocessing.get_all_start_methods()
+        if unset:
+            # the start method is not fixed as a side effect
+            assert multiprocessing.get_start_method(allow_none=True) is None
+
+
+class Increment(JobStep):
+    """Increments the workspace element of the same index."""
+    __slots__ = ('value',)
+    @property
+    def resources(self):
+        return numpy.array([self._id])
+
+class IncrementWorker(Worker):
+    def target(self):
+        while True:
+            k, task = self.get_task()
+            data = self.workspace.data_array
+            data[task._id] += 1
+            task.value = data[task._id]
+            self.push_update(task, dict(value=task.value))
+
+class IncrementScheduler(Scheduler):
+    def __init__(self, workspace, **kwargs):
+        n = len(workspace)
+        Scheduler.__init__(self, workspace, [ Increment(i) for i in range(n) ], **kwargs)
+        self.values = { i: [] for i in range(n) }
+    @property
+    def worker(self):
+        return IncrementWorker
+    def draw(self, k):
+        return k % len(self.workspace)
+    def stop(self, k, i, status):
+        self.values[i].append(status['value'])
+        return False
+
+class FailingScheduler(IncrementScheduler):
+    def stop(self, k, i, status):
+        raise RuntimeError
+
+class NeighbourWorker(Worker):
+    """Increments an element and checks that the next element does not change meanwhile;
+    the next element is read but is not a resource of the job step."""
+    def target(self):
+        import time
+        while True:
+            k, task = self.get_task()
+            data = self.workspace.data_array
+            i = task._id
+            j = (i + 1) % data.size
+            before = data[j]
+            data[i] += 1
+            time.sleep(.01) # let the concurrent job steps complete
+            task.value = data[j] == before
+            self.push_update(task, dict(value=task.value))
+
+class NeighbourScheduler(IncrementScheduler):
+    @property
+    def worker(self):
+        return NeighbourWorker
+
+
+class TestSharedWorkspace(object):
+
+    def test_shared_array(self):
+        import pickle
+        array = SharedArray(numpy.arange(5, dtype=float))
+        try:
+            # attached by name
+            copy = pickle.loads(pickle.dumps(array))
+            copy.write(numpy.array([10., 20.]), numpy.array([1, 3]))
+            # the elements that were never written are not read
+            out, seen = numpy.zeros(5), numpy.zeros(5, dtype=numpy.int64)
+            array.read(out, seen)
+            assert numpy.array_equal(out, [0., 10., 0., 20., 0.])
+            assert numpy.array_equal(seen, [0, 2, 0, 2, 0])
+            # only the changed elements are read again
+            out[...] = -1.
+            copy.write(numpy.array([30.]), numpy.array([0]))
+            array.read(out, seen)
+            assert numpy.array_equal(out, [30., -1., -1., -1., -1.])
+            copy.close()
+            with multiprocessing.Pool(1) as pool:
+                assert numpy.array_equal(pool.apply(read_shared, (array,)),
+                        [30., 10., 2., 20., 4.])
+        finally:
+            array.unlink()
+
+    def test_push_pull(self):
+        a = Workspace(numpy.zeros(4))
+        a.share()
+        try:
+            b = Workspace(numpy.zeros(4))
+            b._shared_array, b._seen = a._shared_array, numpy.zeros(4, dtype=numpy.int64)
+            a.data_array[[0, 2]] = [1., 2.]
+            a.push([0, 2])
+            a.data_array[1] = 3. # not published
+            b.pull()
+            assert numpy.array_equal(b.data_array, [1., 0., 2., 0.])
+        finally:
+            a.unshare()
+        assert not a.shared
+
+    @pytest.mark.parametrize('shared_memory', [True, False])
+    def test_scheduler(self, shared_memory):
+        n = 6
+        workspace = Workspace(numpy.zeros(n))
+        scheduler = IncrementScheduler(workspace, worker_count=2, iter_max=3*n,
+                shared_memory=shared_memory, daemon=True)
+        assert scheduler.shared_memory is shared_memory
+        # the workspace is shared only while the scheduler runs
+        assert not workspace.shared
+        assert scheduler.run()
+        assert not workspace.shared
+        if shared_memory:
+            # the workers see the increments of each other
+            for values in scheduler.values.values():
+                assert values == list(range(1, len(values)+1))
+            assert 3*n - 2 <= sum( len(values) for values in scheduler.values.values() )
+
+    def test_scheduler_failure(self):
+        workspace = Workspace(numpy.zeros(4))
+        scheduler = FailingScheduler(workspace, worker_count=2, iter_max=8,
+                shared_memory=True, daemon=True)
+        workers = list(scheduler.workers.values())
+        try:
+            with pytest.raises(RuntimeError):
+                scheduler.run()
+            assert not workspace.shared
+        finally:
+            for w in workers:
+                w.terminate()
+
+    def test_thread_backend(self):
+        assert isinstance(get_backend('thread'), ThreadBackend)
+        assert isinstance(get_backend(), ProcessBackend) and not get_backend().threads
+        with pytest.raises(ValueError):
+            get_backend('mpi')
+        n = 6
+        workspace = Workspace(numpy.zeros(n))
+        scheduler = IncrementScheduler(workspace, worker_count=2, iter_max=3*n,
+                shared_memory=True, backend='thread')
+        # the threads operate on the scheduler's workspace
+        assert not scheduler.shared_memory
+        assert scheduler.run()
+        assert not workspace.shared
+        # the active job steps complete before `run` returns
+        assert numpy.array_equal(workspace.data_array, numpy.full(n, 3.))
+        for values in scheduler.values.values():
+            assert values == list(range(1, len(values)+1))
+
+    def test_thread_snapshot(self):
+        n = 6
+        workspace = Workspace(numpy.zeros(n))
+        # consecutive job steps run simultaneously and read the resources of each other
+        scheduler = NeighbourScheduler(workspace, worker_count=3, iter_max=5*n,
+                backend='thread')
+        assert scheduler.run()
+        assert all( all(values) for values in scheduler.values.values() )
+        # the workers have counters of their own
+        workers = list(scheduler.workers.values())
+        assert all( w.workspace is not workspace for w in workers )
+        assert len({ id(w.workspace.data_array) for w in workers }) == len(workers)
+        # the increments are published, including those of the last job steps
+        assert numpy.sum(workspace.data_array) == 5*n
+        for i, values in scheduler.values.items():
+            assert len(values) <= workspace.data_array[i]
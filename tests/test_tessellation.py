@@ -0,0 +1,426 @@
+
+import numpy
+import pandas
+import pytest
+import warnings
+from scipy.spatial.distance import cdist
+
+seed = 123456789
+
+
+def random_points(n=2000, dim=2):
+    numpy.random.seed(seed)
+    return pandas.DataFrame(numpy.random.rand(n, dim), columns=list('xyz')[:dim])
+
+def as_pairs(cell_index):
+    """Sorted (point, cell) pairs of any cell index format."""
+    import scipy.sparse as sparse
+    if isinstance(cell_index, tuple):
+        points, cells = cell_index
+    elif sparse.issparse(cell_index):
+        points, cells = cell_index.nonzero()
+    else:
+        cell_index = numpy.asarray(cell_index)
+        points, = (0 <= cell_index).nonzero()
+        cells = cell_index[points]
+    points, cells = numpy.asarray(points), numpy.asarray(cells)
+    ok = 0 <= cells
+    points, cells = points[ok], cells[ok]
+    order = numpy.lexsort((cells, points))
+    return points[order], cells[order]
+
+
+from tramway.tessellation.base import *
+class TestDelaunay(object):
+
+    def tessellation(self, points, ncells=50):
+        tessellation = Delaunay()
+        tessellation.tessellate(points.iloc[:ncells])
+        return tessellation
+
+    def test_nearest_cell(self):
+        points = random_points()
+        tessellation = self.tessellation(points)
+        expected = numpy.argmin(cdist(points.values, tessellation.cell_centers), axis=1)
+        assert numpy.array_equal(tessellation.cell_index(points), expected)
+
+    @pytest.mark.parametrize('kwargs', [
+        dict(knn=10), dict(knn=(5, 20)), dict(knn=(None, 30)), dict(radius=(None, .1)),
+        dict(knn=10, radius=(None, .1)), dict(min_location_count=40),
+        dict(radius=.1, exact_radius=True), dict(radius=.1, exact_radius=False),
+        ])
+    def test_spatial_index_vs_distance_matrix(self, kwargs):
+        # the minkowski metric with p=2 is euclidean, but the distances are calculated by cdist
+        points = random_points()
+        tessellation = self.tessellation(points)
+        indexed = tessellation.cell_index(points, format='pair', **kwargs)
+        dense = tessellation.cell_index(points, format='pair', metric='minkowski', p=2, **kwargs)
+        indexed, dense = as_pairs(indexed), as_pairs(dense)
+        assert numpy.array_equal(indexed[0], dense[0])
+        assert numpy.array_equal(indexed[1], dense[1])
+
+    def test_radius(self):
+        points = random_points()
+        tessellation = self.tessellation(points)
+        D = cdist(points.values, tessellation.cell_centers)
+        radius = .2
+        # the former behaviour compares the distances against radius**2
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            legacy = tessellation.cell_index(points, format='pair', radius=radius)
+        assert any( issubclass(w.category, DeprecationWarning) for w in caught )
+        assert numpy.array_equal(numpy.vstack(as_pairs(legacy)),
+                numpy.vstack((D <= radius * radius).nonzero()))
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            exact = tessellation.cell_index(points, format='pair', radius=radius,
+                    exact_radius=True)
+            assert numpy.array_equal(numpy.vstack(as_pairs(exact)),
+                    numpy.vstack((D <= radius).nonzero()))
+            tessellation.cell_index(points, format='pair', radius=radius, exact_radius=False)
+
+    def test_cell_tree(self):
+        points = random_points()
+        tessellation = self.tessellation(points)
+        tree = tessellation.cell_tree
+        assert tessellation.cell_tree is tree
+        # in-place modification of the centers
+        tessellation.cell_centers[0] = [2., 2.]
+        assert tessellation.cell_tree is not tree
+        assert numpy.array_equal(tessellation.cell_index(pandas.DataFrame([[1.9, 1.9]], columns=['x', 'y'])), [0])
+
+
+def random_locations(n=3000):
+    numpy.random.seed(seed)
+    points = pandas.DataFrame(numpy.random.rand(n, 2), columns=['x', 'y'])
+    points['t'] = 10. * numpy.random.rand(n)
+    return points
+
+def grid_mesh(points, count_per_dim=5):
+    from tramway.tessellation.grid import RegularMesh
+    mesh = RegularMesh(count_per_dim=count_per_dim)
+    mesh.tessellate(points[['x', 'y']])
+    return mesh
+
+def time_segment_brute_force(ts, candidates, segment, min_n=None, max_n=None):
+    t0, t1 = segment
+    inside = candidates[(t0 <= ts[candidates]) & (ts[candidates] < t1)]
+    center = .5 * (t0 + t1)
+    if max_n and max_n < inside.size:
+        inside = inside[numpy.argsort(numpy.abs(ts[inside] - center))[:max_n]]
+    elif min_n and inside.size < min_n:
+        inside = candidates[numpy.argsort(numpy.abs(ts[candidates] - center))[:min_n]]
+    return numpy.sort(inside)
+
+
+from tramway.tessellation.time import TimeLattice
+class TestTimeLattice(object):
+
+    segments = numpy.array([ [t, t + 2.] for t in numpy.arange(0., 9., .5) ])
+
+    def compare(self, cell_index, expected):
+        points, cells = as_pairs(cell_index)
+        expected = as_pairs((numpy.concatenate([ p for p, _ in expected ]),
+            numpy.concatenate([ numpy.full(len(p), c, dtype=int) for p, c in expected ])))
+        assert numpy.array_equal(points, expected[0])
+        assert numpy.array_equal(cells, expected[1])
+
+    def test_time_only(self):
+        points = random_locations()
+        ts = points['t'].values
+        lattice = TimeLattice(segments=self.segments)
+        everything = numpy.arange(ts.size)
+        self.compare(lattice.cell_index(points), [
+            (time_segment_brute_force(ts, everything, s), t)
+            for t, s in enumerate(self.segments) ])
+
+    def test_space_time(self):
+        points = random_locations()
+        ts = points['t'].values
+        mesh = grid_mesh(points)
+        space_index = mesh.cell_index(points)
+        ncells = mesh.cell_adjacency.shape[0]
+        lattice = TimeLattice(segments=self.segments, mesh=mesh)
+        expected = []
+        for t, s in enumerate(self.segments):
+            inside = time_segment_brute_force(ts, numpy.arange(ts.size), s)
+            for i in range(ncells):
+                expected.append((inside[space_index[inside] == i], t * ncells + i))
+        self.compare(lattice.cell_index(points), expected)
+
+    @pytest.mark.parametrize('time_knn', [(20, None), (None, 30), (50, 60)])
+    def test_time_knn(self, time_knn):
+        points = random_locations()
+        ts = points['t'].values
+        min_n, max_n = time_knn
+        lattice = TimeLattice(segments=self.segments)
+        everything = numpy.arange(ts.size)
+        self.compare(lattice.cell_index(points, time_knn=time_knn), [
+            (time_segment_brute_force(ts, everything, s, min_n, max_n), t)
+            for t, s in enumerate(self.segments) ])
+        # with a spatial mesh, the nearest neighbours in time are taken in the same space cell
+        mesh = grid_mesh(points)
+        space_index = mesh.cell_index(points)
+        ncells = mesh.cell_adjacency.shape[0]
+        lattice = TimeLattice(segments=self.segments, mesh=mesh)
+        expected = []
+        for i in range(ncells):
+            cell = (space_index == i).nonzero()[0]
+            for t, s in enumerate(self.segments):
+                expected.append((time_segment_brute_force(ts, cell, s, min_n, max_n),
+                    t * ncells + i))
+        self.compare(lattice.cell_index(points, time_knn=time_knn), expected)
+
+
+from tramway.tessellation.grid import RegularMesh
+from tramway.tessellation.hexagon import HexagonalMesh
+class TestRegularStructures(object):
+
+    def points(self, n=5000):
+        # include points beyond the bounds of the mesh
+        numpy.random.seed(seed)
+        return pandas.DataFrame(numpy.random.rand(n, 2) * [2.4, 1.4] - .2, columns=['x', 'y'])
+
+    def brute_force(self, mesh, points):
+        return numpy.argmin(cdist(points.values, mesh.cell_centers), axis=1)
+
+    def tree_queries(self, monkeypatch):
+        # record the number of points the default implementation is called with
+        queries = []
+        tree_query = Delaunay._nearest_cell
+        def _nearest_cell(self, X):
+            queries.append(X.shape[0])
+            return tree_query(self, X)
+        monkeypatch.setattr(Delaunay, '_nearest_cell', _nearest_cell)
+        return queries
+
+    @pytest.mark.parametrize('count_per_dim', [5, 12])
+    def test_grid(self, monkeypatch, count_per_dim):
+        points = self.points()
+        mesh = RegularMesh(count_per_dim=count_per_dim)
+        mesh.tessellate(points[(0 <= points['x']) & (points['x'] <= 2) &
+            (0 <= points['y']) & (points['y'] <= 1)])
+        queries = self.tree_queries(monkeypatch)
+        assert numpy.array_equal(mesh.cell_index(points), self.brute_force(mesh, points))
+        assert not queries
+
+    @pytest.mark.parametrize('tilt', [0., .7, 1.])
+    def test_hexagon(self, monkeypatch, tilt):
+        points = self.points()
+        mesh = HexagonalMesh(tilt=tilt, avg_probability=.01)
+        mesh.tessellate(points[(0 <= points['x']) & (points['x'] <= 2) &
+            (0 <= points['y']) & (points['y'] <= 1)])
+        queries = self.tree_queries(monkeypatch)
+        assert numpy.array_equal(mesh.cell_index(points), self.brute_force(mesh, points))
+        # only the points beyond the mesh fall back to the tree
+        assert sum(queries) < .5 * points.shape[0]
+
+
+from tramway.tessellation.kdtree import KDTreeMesh
+class TestKDTreeMesh(object):
+
+    def mesh(self, dim=2):
+        numpy.random.seed(seed)
+        points = pandas.DataFrame(numpy.random.randn(3000, dim), columns=list('xyz')[:dim])
+        mesh = KDTreeMesh(min_probability=.005)
+        mesh.tessellate(points)
+        # query points, partly beyond the bounds
+        queries = pandas.DataFrame(1.5 * numpy.random.randn(5000, dim), columns=points.columns)
+        return mesh, queries
+
+    def brute_force(self, mesh, points):
+        X = mesh.scaler.scale_point(points, inplace=False).values
+        D = cdist(X, mesh.cell_centers, 'chebyshev')
+        inside = D <= mesh.reference_length
+        assert numpy.all(inside.sum(axis=1) <= 1)
+        return numpy.where(numpy.any(inside, axis=1), numpy.argmax(inside, axis=1), -1), D
+
+    @pytest.mark.parametrize('dim', [2, 3])
+    def test_locate(self, dim):
+        mesh, queries = self.mesh(dim)
+        expected, _ = self.brute_force(mesh, queries)
+        assert numpy.any(expected < 0)
+        assert numpy.array_equal(mesh.cell_index(queries), expected)
+        # tessellations without a tree
+        mesh.tree_children = None
+        assert numpy.array_equal(mesh.cell_index(queries), expected)
+
+    def test_options(self):
+        mesh, queries = self.mesh()
+        expected, D = self.brute_force(mesh, queries)
+        ncells = mesh.cell_centers.shape[0]
+        count = numpy.bincount(expected[0 <= expected], minlength=ncells)
+        # min_location_count
+        K = mesh.cell_index(queries, min_location_count=20)
+        assert numpy.array_equal(K, numpy.where((0 <= expected) & (20 <= count[expected]), expected, -1))
+        # max_nn; the points beyond `max_nn` are the farthest from the cell center
+        K = mesh.cell_index(queries, knn=(None, 30))
+        for c in range(ncells):
+            members, = (expected == c).nonzero()
+            kept = numpy.sort(members[numpy.argsort(D[members, c])[:30]])
+            assert numpy.array_equal((K == c).nonzero()[0], kept)
+        # min_nn; the small cells take their nearest points
+        points, cells = as_pairs(mesh.cell_index(queries, knn=(40, None), format='pair'))
+        for c in range(ncells):
+            members = points[cells == c]
+            if count[c] < 40:
+                assert numpy.array_equal(numpy.sort(members), numpy.sort(numpy.argsort(D[:, c])[:40]))
+            else:
+                assert numpy.array_equal(members, (expected == c).nonzero()[0])
+
+
+from tramway.tessellation.gwr.gas import NodeGrid, Gas
+class TestNodeGrid(object):
+
+    def exhaustive(self, weights, eta, k=2):
+        nodes = list(weights)
+        W = numpy.array([ weights[n] for n in nodes ])
+        d2 = numpy.sum((W - eta) ** 2, axis=1)
+        order = numpy.argsort(d2, kind='mergesort')[:k]
+        return [ nodes[i] for i in order ], d2[order]
+
+    def check(self, index, weights, queries, k=2):
+        for eta in queries:
+            nodes, d2 = index.nearest(eta, k)
+            expected_nodes, expected_d2 = self.exhaustive(weights, eta, k)
+            assert nodes == expected_nodes
+            assert numpy.allclose(d2, expected_d2)
+
+    @pytest.mark.parametrize('dim,edge', [(2, .05), (2, .5), (3, .1)])
+    def test_nearest(self, dim, edge):
+        numpy.random.seed(seed)
+        W = numpy.random.rand(500, dim) - .5
+        index = NodeGrid(edge)
+        weights = {}
+        for n, w in enumerate(W):
+            index.insert(n, w)
+            weights[n] = w
+        # queries inside and far beyond the nodes (exhaustive fallback)
+        queries = numpy.r_[numpy.random.rand(200, dim) - .5, 10. * numpy.random.randn(20, dim)]
+        self.check(index, weights, queries)
+        self.check(index, weights, queries[:20], k=5)
+        # incremental updates
+        for n in range(0, 500, 3):
+            weights[n] = W[n] + .1 * numpy.random.randn(dim)
+            index.move(n, weights[n])
+        for n in range(1, 500, 7):
+            index.remove(n)
+            del weights[n]
+        assert index.size == len(weights)
+        self.check(index, weights, queries)
+
+    def test_batch_train(self):
+        # the gas grows the same with and without the index
+        numpy.random.seed(seed)
+        sample = numpy.random.rand(3000, 2)
+        def grow(index):
+            gas = Gas(sample[:2])
+            gas.insertion_threshold = .05
+            gas.batch_train(sample[:1000])
+            if index:
+                gas.index_nodes(min_node_count=0)
+                assert gas.node_index is not None
+            gas.batch_train(sample[1000:])
+            return gas, numpy.array([ gas.get_weight(n) for n in gas.iter_nodes() ])
+        gas, weights = grow(True)
+        assert gas.node_index.size == gas.size
+        _, expected = grow(False)
+        assert numpy.array_equal(weights, expected)
+
+class TestMinibatchGas(object):
+
+    def grow(self, sample, batch_mode, **kwargs):
+        numpy.random.seed(seed)
+        gas = Gas(sample[:2])
+        gas.insertion_threshold = .03
+        gas.batch_size = 2000
+        gas.train(sample, pass_count=(None, 2), batch_mode=batch_mode, **kwargs)
+        weights = numpy.array([ gas.get_weight(n) for n in gas.iter_nodes() ])
+        quantization_error = numpy.mean(numpy.min(cdist(sample, weights), axis=1))
+        return gas, quantization_error
+
+    def test_errors(self):
+        numpy.random.seed(seed)
+        sample = numpy.random.rand(3000, 2)
+        gas = Gas(sample[:2])
+        gas.insertion_threshold = .05
+        errors = gas.minibatch_train(sample, block_size=100)
+        assert len(errors) == sample.shape[0]
+        assert numpy.all(0 <= numpy.asarray(errors))
+        assert 2 < gas.size
+        # the errors are computed with the node weights at the beginning of each block
+        assert numpy.allclose(errors[:2], 0)
+
+    def test_vs_sequential(self):
+        numpy.random.seed(seed)
+        sample = numpy.random.rand(10000, 2)
+        gas, error = self.grow(sample, 'minibatch', block_size=200)
+        expected_gas, expected_error = self.grow(sample, 'sequential')
+        assert abs(gas.size - expected_gas.size) < .1 * expected_gas.size
+        assert error < 1.1 * expected_error
+
+    def test_errors_in_train(self):
+        numpy.random.seed(seed)
+        sample = numpy.random.rand(100, 2)
+        gas = Gas(sample[:2])
+        with pytest.raises(ValueError):
+            gas.train(sample, batch_mode='bogus')
+        with pytest.raises(ValueError):
+            gas.train(sample, batch_mode='minibatch', grab=lambda *args: None)
+
+
+from tramway.tessellation.kmeans import lloyd_kmeans, minibatch_kmeans, KMeansMesh
+class TestKMeans(object):
+
+    def data(self):
+        numpy.random.seed(seed)
+        centers = numpy.random.rand(20, 2)
+        points = centers[numpy.random.randint(20, size=5000)] + .02 * numpy.random.randn(5000, 2)
+        return points, numpy.random.rand(30, 2)
+
+    def check_fixed_point(self, points, centers, distortion):
+        # the centers are the means of the points they are the nearest to
+        D = cdist(points, centers)
+        labels = numpy.argmin(D, axis=1)
+        assert numpy.isclose(distortion, numpy.mean(numpy.min(D, axis=1)), rtol=1e-2)
+        for k in range(centers.shape[0]):
+            if numpy.any(labels == k):
+                assert numpy.allclose(points[labels == k].mean(axis=0), centers[k], atol=1e-3)
+
+    def test_lloyd(self):
+        points, initial = self.data()
+        centers, distortion = lloyd_kmeans(points, initial, shift_tol=1e-6, worker_count=1,
+            chunk_size=700)
+        self.check_fixed_point(points, centers, distortion)
+
+    def test_lloyd_parallel(self):
+        # chunks processed in worker processes or sequentially give the same centers
+        points, initial = self.data()
+        expected, expected_distortion = lloyd_kmeans(points, initial, worker_count=1,
+            chunk_size=1000)
+        centers, distortion = lloyd_kmeans(points, initial, worker_count=2, chunk_size=1000)
+        assert numpy.array_equal(centers, expected)
+        assert distortion == expected_distortion
+        # a single chunk
+        centers, distortion = lloyd_kmeans(points, initial, worker_count=2)
+        assert numpy.allclose(centers, expected)
+
+    def test_minibatch(self):
+        points, initial = self.data()
+        expected, expected_distortion = lloyd_kmeans(points, initial, worker_count=1)
+        numpy.random.seed(seed)
+        centers, distortion = minibatch_kmeans(points, initial, shift_tol=1e-4)
+        assert centers.shape[1] == 2
+        D = cdist(points, centers)
+        assert numpy.mean(numpy.min(D, axis=1)) < 1.2 * expected_distortion
+
+    @pytest.mark.parametrize('engine', ['lloyd', 'minibatch'])
+    def test_engine(self, engine):
+        points, _ = self.data()
+        points = pandas.DataFrame(points, columns=['x', 'y'])
+        numpy.random.seed(seed)
+        mesh = KMeansMesh(avg_probability=.05)
+        mesh.tessellate(points, engine=engine, worker_count=1)
+        assert mesh.cell_centers.shape[1] == 2
+        with pytest.raises(ValueError):
+            KMeansMesh(avg_probability=.05).tessellate(points, engine='bogus')
@@ -77,8 +77,7 @@ class MapperPlugin(AnalyzerNode):
                 self._kwargs[attrname] = val
                 if attrname.endswith('time_prior'):
                     self.time.enable_regularization()
-    @analysis
-    def infer(self, sampling):
+    def _prepare(self, sampling):
         helper = Infer()
         helper.prepare_data(sampling)
         distr_kwargs, infer_kwargs = {}, {}
@@ -90,8 +89,24 @@ class MapperPlugin(AnalyzerNode):
         infer_kwargs['sigma'] = self._parent.spt_data.localization_precision
         cells = helper.distribute(**distr_kwargs)
         helper.name, helper.setup, helper._infer = self.name, self.setup, self._mapper
+        return helper, cells, infer_kwargs
+    @analysis
+    def infer(self, sampling):
+        helper, cells, infer_kwargs = self._prepare(sampling)
         maps = helper.infer(cells, **infer_kwargs)
         return maps
+    @analysis
+    def infer_path(self, sampling, priors, warm_start=True, criterion=None):
+        """
+        Regularization path; distributes the data once and infers maps for each of the
+        `priors` values.
+
+        See also :meth:`~tramway.helper.inference.Infer.infer_path`.
+        """
+        helper, cells, infer_kwargs = self._prepare(sampling)
+        maps = helper.infer_path(cells, priors, warm_start=warm_start, criterion=criterion,
+                **infer_kwargs)
+        return maps
     @property
     def time(self):
         return self._parent.time
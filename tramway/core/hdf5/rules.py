@@ -64,7 +64,8 @@ except ImportError:
         pass
 else:
         kdtree_mesh_exposes = voronoi_exposes + ['_min_distance', '_avg_distance', \
-                'min_probability', 'max_probability', 'max_level', 'dichotomy', 'reference_length']
+                'min_probability', 'max_probability', 'max_level', 'dichotomy', 'reference_length', \
+                'tree_origin', 'tree_unit', 'tree_depth', 'tree_children']
         __all__.append('kdtree_mesh_exposes')
         try:
                 hdf5_storable(default_storable(KDTreeMesh, exposes=kdtree_mesh_exposes), agnostic=True)
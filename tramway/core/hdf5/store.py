@@ -88,10 +88,20 @@ class RWAStore(HDF5Store):
         return obj
 
     def special_unload(self, obj):
+        import tramway.tessellation.base as tessellation
+        import tramway.inference.base as inference
+        import copy
+        if isinstance(obj, tessellation.Delaunay) and getattr(obj, '_cell_tree', None) is not None:
+            # spatial indices are not storable; they are rebuilt on demand
+            obj = copy.copy(obj)
+            obj._cell_tree = None
+        if isinstance(obj, inference.Local) and \
+                isinstance(getattr(obj, 'cache', None), inference.CellCache):
+            # so are the inference caches
+            obj = copy.copy(obj)
+            obj.cache = None
         if 'data0' in self.__special__:
-            import tramway.tessellation.base as tessellation
             if isinstance(obj, tessellation.Partition) and obj.points is self.__special__['data0']:
-                import copy
                 obj = copy.copy(obj)
                 obj._points = None
         else:
@@ -13,18 +13,25 @@
 
 
 import multiprocessing
+import threading
 try:
     import queue
 except ImportError:
     import Queue as queue
 import time
+import copy
 import numpy as np
 from warnings import warn
+try:
+    from multiprocessing import shared_memory
+except ImportError: # Py<3.8
+    shared_memory = None
 try:
     from . import abc
 except SyntaxError: # Py2
     import abc_py2 as abc
 from traceback import format_exc
+from functools import partial
 
 #import logging # DEBUG
 #module_logger = logging.getLogger(__name__)
@@ -188,6 +195,8 @@ class Worker(multiprocessing.Process):
         """
         if isinstance(update, abc.VehicleJobStep):
             update.push_updates(self.workspace.pop_extension_updates())
+        if self.workspace.shared:
+            self.workspace.push(update.resources)
         update.unset_workspace() # free memory space
         if self.update is not None:
             self.update.put(update)
@@ -195,6 +204,8 @@ class Worker(multiprocessing.Process):
         self.feedback.put((update, status))
         #module_logger.debug('push_update: sent') # DEBUG
     def pull_updates(self):
+        if self.workspace.shared:
+            self.workspace.pull()
         if self.update is None:
             return
         while True:
@@ -216,6 +227,106 @@ class Worker(multiprocessing.Process):
 class NormalTermination(Exception):
     pass
 
+def _thread_worker(worker):
+    class ThreadWorker(worker):
+        """ Runs the worker in a thread of the scheduler process.
+
+        The worker operates on a copy of the scheduler's workspace with a private data array
+        (see :meth:`Workspace.thread_copy`).
+        """
+        def __init__(self, *args, **kwargs):
+            worker.__init__(self, *args, **kwargs)
+            self._thread = threading.Thread(target=self.run, name=self.name)
+            self._thread.daemon = True
+        def start(self):
+            # copy the workspace as late as possible, so that the copy reflects any change
+            # made to the scheduler's workspace after the workers were instanciated
+            if isinstance(self.workspace, Workspace):
+                self.workspace = self.workspace.thread_copy()
+            self._thread.start()
+        def is_alive(self):
+            return self._thread.is_alive()
+        def join(self, timeout=None):
+            self._thread.join(timeout)
+        def terminate(self):
+            # threads cannot be killed; the worker exits as soon as it listens to the scheduler
+            self.tasks.put((None, None))
+        def get_task(self):
+            k, task = self.tasks.get()
+            if task is None:
+                raise SystemExit
+            task.set_workspace(self.workspace)
+            self.pull_updates()
+            return k, task
+        def run(self):
+            try:
+                worker.run(self)
+            except SystemExit:
+                pass
+    return ThreadWorker
+
+
+class ProcessBackend(object):
+    """ Default execution backend; workers are processes.
+
+    Each worker operates on its own copy of the workspace.
+    """
+    __slots__ = ()
+    threads = False
+    def queue(self):
+        return multiprocessing.Queue()
+    def star_queue(self, n):
+        return StarQueue(n)
+    def worker(self, worker):
+        return worker
+
+class ThreadBackend(ProcessBackend):
+    """ Execution backend with workers as threads.
+
+    The job steps are not pickled and the workers do not exchange messages.
+    This is efficient when most of the computation releases the GIL (e.g. in NumPy),
+    or where *fork* is not available.
+
+    Each worker operates on its own copy of the workspace, with attributes such as counters
+    of its own and a private working copy of the data array.
+    Like with a shared workspace, the private data array is loaded from the scheduler's data
+    array when a job step begins, and the elements designated by :attr:`JobStep.resources`
+    are published when the job step completes (see :class:`ThreadSharedArray`).
+    As a consequence, the data a job step reads do not change in the middle of the job step,
+    even if they are not part of its resources.
+    """
+    __slots__ = ()
+    threads = True
+    def queue(self):
+        return queue.Queue()
+    def star_queue(self, n):
+        return None
+    def worker(self, worker):
+        return _thread_worker(worker)
+
+backends = {'process': ProcessBackend, 'multiprocessing': ProcessBackend,
+        'thread': ThreadBackend, 'threading': ThreadBackend}
+
+def get_backend(backend=None):
+    """
+    Arguments:
+
+        backend (str or ProcessBackend): any of 'process' (default), 'multiprocessing',
+            'thread' or 'threading', or backend object.
+
+    Returns:
+
+        ProcessBackend: execution backend.
+    """
+    if backend is None:
+        backend = 'process'
+    if isinstance(backend, ProcessBackend):
+        return backend
+    try:
+        return backends[backend]()
+    except KeyError:
+        raise ValueError('unsupported backend: {}'.format(backend))
+
 def _pseudo_worker(worker):
     class PseudoWorker(worker):
         def __init__(self, scheduler, args=(), kwargs={}, _id=0, name=None):
@@ -223,7 +334,10 @@ def _pseudo_worker(worker):
                 None, None, None, name=name, args=args, kwargs=kwargs)
             self._scheduler = scheduler
         def get_task(self):
-            return self._scheduler.next_task()
+            k, task = self._scheduler.next_task()
+            if task is None: # iter_max reached
+                raise NormalTermination
+            return k, task
         def push_update(self, update, status=None):
             i = update.resource_id
             self._scheduler.task[i] = update
@@ -243,13 +357,27 @@ class Scheduler(object):
 
     The :meth:`stop` method should be overloaded so that the distributed computation
     may complete on termination criteria.
+
+    With `shared_memory=True`, the workspace data array is placed in shared memory
+    (see :meth:`Workspace.share`) instead of being synchronized by broadcasting the
+    completed job steps to all the other workers.
+    The job steps still return to the scheduler.
+
+    With `backend='thread'`, the workers are threads and operate on copies of the workspace
+    that share the data array (see :class:`ThreadBackend`).
     """
     def __init__(self, workspace, tasks, worker_count=None, iter_max=None,
-            name=None, args=(), kwargs={}, daemon=None, **_kwargs):
+            name=None, args=(), kwargs={}, daemon=None, shared_memory=False, backend=None,
+            **_kwargs):
         """
         Arguments:
 
             workspace (Workspace): workspace to be replicated
+
+            shared_memory (bool): share the workspace data array between the workers
+                instead of passing messages; ignored with threads
+
+            backend (str or ProcessBackend): execution backend; see :func:`get_backend`
         """
         self.workspace = workspace
         self.task = tasks
@@ -258,24 +386,34 @@ class Scheduler(object):
         self.dead_workers = dict()
         self.k_eff = 0
         self.k_max = iter_max
+        self.backend = get_backend(backend)
         if worker_count is None:
             worker_count = multiprocessing.cpu_count() - 1
         elif worker_count < 0:
             worker_count = multiprocessing.cpu_count() + worker_count
         kwargs.update(_kwargs)
+        # the workspace is placed in shared memory by :meth:`run` only
+        self.shared_memory = False
         if worker_count:
-            self.task_queue = multiprocessing.Queue()
-            self.return_queue = multiprocessing.Queue()
+            worker = self.backend.worker(self.worker)
+            self.task_queue = self.backend.queue()
+            self.return_queue = self.backend.queue()
             if worker_count == 1:
-                self.workers = { 0: self.worker(0, self.workspace,
+                self.workers = { 0: worker(0, self.workspace,
                             self.task_queue, self.return_queue, None,
                             name=name, args=args, kwargs=kwargs, daemon=daemon) }
             else:
                 def _name(w):
                     return '{}-{:d}'.format(name, w) if w else None
-                update_queue = StarQueue(worker_count)
-                self.workers = { i: self.worker(i, self.workspace,
-                            self.task_queue, self.return_queue, update_queue.deal(),
+                star_queue = None if shared_memory else self.backend.star_queue(worker_count)
+                if star_queue is None:
+                    self.shared_memory = shared_memory and not self.backend.threads
+                    def update_queue():
+                        return None
+                else:
+                    update_queue = star_queue.deal
+                self.workers = { i: worker(i, self.workspace,
+                            self.task_queue, self.return_queue, update_queue(),
                             name=_name(i), args=args, kwargs=kwargs, daemon=daemon)
                         for i in range(worker_count) }
         else:
@@ -428,42 +566,53 @@ class Scheduler(object):
                 ret = False
             return ret
 
-        for w in self.workers.values():
-            w.start()
-        self.init_resource_lock()
-        k = 0
-        postponed = dict()
+        if self.shared_memory:
+            # the workers inherit the shared workspace when they are started
+            self.workspace.share()
         try:
-            k = self.fill_slots(k, postponed)
-            while not self.iter_max_reached():
-                if not self.workers_alive():
-                    break
-                if not self.get_processed_step():
-                    break
-                if postponed:
-                    for i in list(postponed):
-                        task = self.task[i]
-                        if not self.locked(task):
-                            self.send_task(postponed.pop(i), task)
-                            if self.available_slots == 0:
-                                break
-                            else:
-                                assert 0 < self.available_slots
-                if not postponed:
-                    k = self.fill_slots(k, postponed)
-            ret = True
-        except (SystemExit, KeyboardInterrupt):
-            ret = False
-        for w in self.workers.values():
-            try:
-                w.terminate()
-            except:
-                pass
-        for w in self.dead_workers.values():
+            for w in self.workers.values():
+                w.start()
+            self.init_resource_lock()
+            k = self.k_eff # non-zero if resumed
+            postponed = dict()
             try:
-                w.terminate()
-            except:
-                pass
+                k = self.fill_slots(k, postponed)
+                while not self.iter_max_reached():
+                    if not self.workers_alive():
+                        break
+                    if not self.get_processed_step():
+                        break
+                    if postponed:
+                        for i in list(postponed):
+                            task = self.task[i]
+                            if not self.locked(task):
+                                self.send_task(postponed.pop(i), task)
+                                if self.available_slots == 0:
+                                    break
+                                else:
+                                    assert 0 < self.available_slots
+                    if not postponed:
+                        k = self.fill_slots(k, postponed)
+                ret = True
+            except (SystemExit, KeyboardInterrupt):
+                ret = False
+            for w in self.workers.values():
+                try:
+                    w.terminate()
+                except:
+                    pass
+            for w in self.dead_workers.values():
+                try:
+                    w.terminate()
+                except:
+                    pass
+            if self.backend.threads:
+                # let the active job steps complete before the workspace is handed back
+                for w in self.workers.values():
+                    w.join()
+        finally:
+            if self.shared_memory:
+                self.workspace.unshare()
         return ret
     def stop(self, k, i, status):
         """
@@ -490,12 +639,14 @@ class Scheduler(object):
 
 class EpochScheduler(Scheduler):
     def __init__(self, workspace, tasks, epoch_length=None, soft_epochs=False, worker_count=None,
-            iter_max=None, name=None, args=(), kwargs={}, daemon=None, **_kwargs):
+            iter_max=None, name=None, args=(), kwargs={}, daemon=None, shared_memory=False,
+            backend=None, **_kwargs):
         epoch_length = len(tasks) if epoch_length is None else epoch_length
         if not soft_epochs and not worker_count:
             worker_count = min(epoch_length, multiprocessing.cpu_count() - 1)
         Scheduler.__init__(self, workspace, tasks, worker_count=worker_count, iter_max=iter_max,
-            name=name, args=args, kwargs=kwargs, daemon=daemon, **_kwargs)
+            name=name, args=args, kwargs=kwargs, daemon=daemon, shared_memory=shared_memory,
+            backend=backend, **_kwargs)
         self.soft_epochs = soft_epochs
         self._task_epoch = np.arange(epoch_length)
 
@@ -524,6 +675,9 @@ class ProtoWorkspace(object):
         step.set_workspace(self)
         if isinstance(step, abc.VehicleJobStep):
             self.push_extension_updates(step.pop_updates())
+    @property
+    def shared(self):
+        return False
     def resources(self, step):
         return step.resources
     def identify_extensions(self, args):
@@ -552,13 +706,170 @@ class Workspace(ProtoWorkspace):
 
         data_array (array-like): working copy of the parameter vector.
 
+    The working copy can be backed by a :class:`SharedArray` (see :meth:`share`),
+    or by the data array of another workspace in the same process (see :meth:`thread_copy`).
+    Each process or thread still reads and modifies its own working copy, so that the data
+    do not change in the middle of a job step;
+    :meth:`push` publishes the modified elements and :meth:`pull` loads the elements
+    that other processes or threads have published.
     """
-    __slots__ = 'data_array',
+    __slots__ = 'data_array', '_shared_array', '_seen', '_thread_array'
     def __init__(self, data_array, *args):
         ProtoWorkspace.__init__(self, args)
         self.data_array = data_array
+        self._shared_array = None
+        self._seen = None
+        self._thread_array = None
     def __len__(self):
         return len(self.data_array)
+    @property
+    def shared(self):
+        return getattr(self, '_shared_array', None) is not None
+    def share(self):
+        """ Copy the data array into shared memory.
+
+        Should be called by the parent process before the workers are started.
+        """
+        if not self.shared:
+            self._shared_array = SharedArray(self.data_array)
+            self._seen = np.zeros(self._shared_array.size, dtype=self._shared_array.versions.dtype)
+    def unshare(self):
+        """ Release the shared memory; the working copy is left unchanged. """
+        if self.shared:
+            self._shared_array.unlink()
+            self._shared_array = self._seen = None
+    def push(self, index=None):
+        """ Publish the elements of the working copy designated by `index` (default: all). """
+        shared_array = self._shared_array
+        if index is None:
+            shared_array.write(self.data_array)
+            self._seen[...] = shared_array.versions
+        else:
+            index = np.asarray(index)
+            shared_array.write(self.data_array[index], index)
+            self._seen[index] = shared_array.versions[index]
+    def pull(self):
+        """ Load into the working copy the elements published since the last call. """
+        self._shared_array.read(self.data_array, self._seen)
+    def thread_copy(self):
+        """ Copy of the workspace for a worker thread (see :class:`ThreadBackend`).
+
+        The copy has a private working copy of the data array, that is synchronized with the
+        data array of the present workspace by :meth:`push` and :meth:`pull`.
+        The other attributes are shallow copies.
+        """
+        thread_array = self._thread_array
+        if thread_array is None or thread_array.data is not self.data_array:
+            thread_array = self._thread_array = ThreadSharedArray(self.data_array)
+        ws = copy.copy(self)
+        ws.data_array = np.array(self.data_array)
+        ws._shared_array = thread_array
+        ws._seen = np.array(thread_array.versions)
+        ws._thread_array = None
+        return ws
+
+
+class SharedArray(object):
+    """ One-dimensional array in shared memory, with a version counter per element.
+
+    The counters implement a sequence lock: a counter is odd while the corresponding element
+    is being written, and each write increments it twice.
+    Readers retry the elements that were being written or that changed while they were read.
+
+    There should be no more than one writer per element at a time; the :class:`Scheduler`
+    guarantees this for the elements designated by :attr:`JobStep.resources`.
+
+    A :class:`SharedArray` object can be passed to child processes, either inherited at fork
+    time or pickled (in the latter case the shared memory block is attached by name).
+    """
+    __slots__ = '_shm', '_owner', '_dtype', 'size', 'data', 'versions'
+    def __init__(self, array):
+        if shared_memory is None:
+            raise NotImplementedError('shared memory requires Python>=3.8')
+        array = np.asarray(array)
+        self._dtype = array.dtype
+        self.size = array.size
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, self._nbytes))
+        self._owner = True
+        self._attach()
+        self.data[...] = array.ravel()
+        self.versions[...] = 0
+    @property
+    def _nbytes(self):
+        return self.size * (self._dtype.itemsize + np.dtype(np.int64).itemsize)
+    def _attach(self):
+        buf = self._shm.buf
+        offset = self.size * self._dtype.itemsize
+        self.data = np.ndarray(self.size, dtype=self._dtype, buffer=buf)
+        self.versions = np.ndarray(self.size, dtype=np.int64, buffer=buf, offset=offset)
+    def __getstate__(self):
+        return self._shm.name, self._dtype, self.size
+    def __setstate__(self, state):
+        name, self._dtype, self.size = state
+        self._shm = shared_memory.SharedMemory(name=name)
+        self._owner = False
+        self._attach()
+    def write(self, values, index=None):
+        """ Write `values` at `index` (default: all the elements). """
+        if index is None:
+            index = slice(None)
+        versions = self.versions
+        versions[index] += 1
+        self.data[index] = values
+        versions[index] += 1
+    def read(self, out, seen):
+        """ Copy into `out` the elements whose version differs from `seen`;
+        `seen` is updated inplace. """
+        while True:
+            versions = np.array(self.versions)
+            changed, = np.nonzero(versions != seen)
+            if changed.size == 0:
+                break
+            out[changed] = self.data[changed]
+            before = versions[changed]
+            ok = (before % 2 == 0) & (before == self.versions[changed])
+            seen[changed[ok]] = before[ok]
+            if np.all(ok):
+                break
+    def close(self):
+        self.data = self.versions = None
+        self._shm.close()
+    def unlink(self):
+        """ Release the shared memory block; only the creating process effectively unlinks. """
+        owner = self._owner
+        self.close()
+        if owner:
+            self._shm.unlink()
+
+
+class ThreadSharedArray(object):
+    """ Array shared between threads, with a version counter per element.
+
+    Counterpart of :class:`SharedArray` for :meth:`Workspace.thread_copy`.
+    The original array is not copied, and the accesses are serialized with a lock.
+
+    The version counters account for the writes through :meth:`write` only.
+    """
+    __slots__ = 'data', 'versions', 'size', '_lock'
+    def __init__(self, array):
+        self.data = array
+        self.size = array.size
+        self.versions = np.zeros(self.size, dtype=np.int64)
+        self._lock = threading.Lock()
+    def write(self, values, index=None):
+        """ Write `values` at `index` (default: all the elements). """
+        if index is None:
+            index = slice(None)
+        with self._lock:
+            self.data[index] = values
+            self.versions[index] += 1
+    def read(self, out, seen):
+        """ Copy into `out` the elements whose version differs from `seen`;
+        `seen` is updated inplace. """
+        with self._lock:
+            changed, = np.nonzero(self.versions != seen)
+            out[changed] = self.data[changed]
+            seen[changed] = self.versions[changed]
 
 
 class JobStep(object):
@@ -644,5 +955,139 @@ class VehicleJobStep(JobStep, UpdateVehicle):
 abc.VehicleJobStep.register(VehicleJobStep)
 
 
-__all__ = [ 'StarConn', 'StarQueue', 'ProtoWorkspace', 'Workspace', 'JobStep', 'UpdateVehicle', 'VehicleJobStep', 'Worker', 'Scheduler', 'EpochScheduler', 'abc' ]
+def start_method():
+    """
+    Start method of the child processes, without fixing it if not set yet.
+    """
+    try:
+        method = multiprocessing.get_start_method(allow_none=True)
+    except AttributeError: # Py2
+        return 'fork'
+    if method is None:
+        # the first method is the default one on the current platform
+        method = multiprocessing.get_all_start_methods()[0]
+    return method
+
+
+_pool_items = None
+
+def _set_pool_items(items):
+    global _pool_items
+    _pool_items = items
+
+def _call_pool_item(function, k):
+    return function(_pool_items[k])
+
+
+class ItemPool(object):
+    """
+    Process pool that maps functions on a fixed sequence of items.
+
+    If `share_data` is ``True``, the items are handed over to each worker process once,
+    when the process starts, and the workers receive only indices afterwards.
+    With the *fork* start method, the items are inherited and never pickled.
+    Because the items are stored in the worker processes only, several pools can be
+    used at the same time, including nested in the functions mapped by another pool.
+
+    The items are processed sequentially in the current process if `worker_count` is ``1``,
+    if there is a single item, or if the current process is itself a pool worker (pool
+    workers cannot spawn processes of their own).
+
+    :class:`ItemPool` is a context manager; the worker processes are terminated on exit.
+
+    Arguments:
+
+        items (sequence): items the mapped functions are applied to.
+
+        worker_count (int): number of worker processes;
+            default is :func:`multiprocessing.cpu_count`.
+
+        share_data (bool): whether the worker processes hold a copy of the items;
+            if ``False``, the items are pickled and sent with each chunk of tasks;
+            default is ``True`` if the *fork* start method is in use.
+
+    """
+    __slots__ = ('items', 'pool', 'worker_count', 'share_data')
+
+    def __init__(self, items, worker_count=None, share_data=None):
+        self.items = items
+        self.pool = None
+        if (worker_count is not None and worker_count <= 1) or len(items) < 2 or \
+                multiprocessing.current_process().daemon:
+            self.worker_count = 1
+            self.share_data = False
+            return
+        if worker_count is None:
+            worker_count = multiprocessing.cpu_count()
+        self.worker_count = min(worker_count, len(items))
+        if share_data is None:
+            share_data = start_method() == 'fork'
+        self.share_data = share_data
+        if share_data:
+            self.pool = multiprocessing.Pool(self.worker_count, _set_pool_items, (items,))
+        else:
+            self.pool = multiprocessing.Pool(self.worker_count)
+
+    def map(self, function, chunksize=None, progress=None):
+        """
+        Apply a function to each item.
+
+        Arguments:
+
+            function (callable): picklable function that takes a single item.
+
+            chunksize (int): number of items sent at once to a worker process;
+                default is the same as for :meth:`multiprocessing.pool.Pool.map`.
+
+            progress (callable): called in the current process with the number of
+                processed items and the total number of items, each time an item is completed.
+
+        Returns:
+
+            list: the values returned by `function`, in the order of the items.
+
+        """
+        total = len(self.items)
+        results = []
+        if self.pool is None:
+            for item in self.items:
+                results.append(function(item))
+                if progress is not None:
+                    progress(len(results), total)
+            return results
+        if chunksize is None:
+            chunksize, extra = divmod(total, self.worker_count * 4)
+            if extra:
+                chunksize += 1
+        if self.share_data:
+            function, items = partial(_call_pool_item, function), range(total)
+        else:
+            items = self.items
+        for result in self.pool.imap(function, items, chunksize):
+            results.append(result)
+            if progress is not None:
+                progress(len(results), total)
+        return results
+
+    def close(self, terminate=False):
+        """
+        Stop the worker processes.
+        """
+        if self.pool is not None:
+            if terminate:
+                self.pool.terminate()
+            else:
+                self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(exc_type is not None)
+
+
+__all__ = [ 'StarConn', 'StarQueue', 'ProtoWorkspace', 'Workspace', 'SharedArray', 'ThreadSharedArray', 'JobStep', 'UpdateVehicle', 'VehicleJobStep', 'Worker', 'Scheduler', 'EpochScheduler',
+        'ProcessBackend', 'ThreadBackend', 'get_backend', 'start_method', 'ItemPool', 'abc' ]
 
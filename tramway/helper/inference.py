@@ -25,6 +25,7 @@ from warnings import warn
 import os
 import time
 import collections
+from functools import partial
 import traceback
 # no module-wide matplotlib import for head-less usage of `infer`
 # in the case matplotlib's backend is interactive
@@ -109,14 +110,17 @@ class Infer(Helper):
                         rgrad = None
                 if grad is None:
                     class Distr(new_group):
+                        _operator_functions = dict(local_variation=rgrad)
                         def local_variation(self, *args, **kwargs):
                             return rgrad(self, *args, **kwargs)
                 elif rgrad is None:
                     class Distr(new_group):
+                        _operator_functions = dict(grad=grad)
                         def grad(self, *args, **kwargs):
                             return grad(self, *args, **kwargs)
                 else:
                     class Distr(new_group):
+                        _operator_functions = dict(grad=grad, local_variation=rgrad)
                         def grad(self, *args, **kwargs):
                             return grad(self, *args, **kwargs)
                         def local_variation(self, *args, **kwargs):
@@ -223,7 +227,31 @@ class Infer(Helper):
     def infer(self, cells, worker_count=None, profile=None, min_diffusivity=None, \
             localization_error=None, sigma=None, sigma2=None, \
             diffusivity_prior=None, potential_prior=None, jeffreys_prior=None, rgrad=None, \
-            comment=None, verbose=None, snr_extensions=False, **kwargs):
+            comment=None, verbose=None, snr_extensions=False, x0_from=None,
+            x0_interpolation='nearest', halo_exchange=None, halo_tol=None, **kwargs):
+        """
+        Run the inference plugin.
+
+        Argument `x0_from` warm-starts the inference from existing maps.
+        It admits a :class:`~tramway.inference.base.Maps` object inferred on the same
+        cells, or a ``(maps, cells)`` pair with `cells` the
+        :class:`~tramway.tessellation.base.Partition`,
+        :class:`~tramway.tessellation.base.Tessellation` or
+        :class:`~tramway.inference.base.Distributed` object the maps were inferred on.
+        In the latter case, the maps are interpolated onto the new cell centers with method
+        `x0_interpolation` (see :func:`~tramway.inference.base.interpolate_maps`).
+        The *diffusivity*, *potential* and *force* maps are passed as initial values
+        `D0`, `V0` and `F0` respectively, to the plugins that admit these arguments,
+        unless explicitly defined.
+
+        If the cells are grouped with an adjacency margin (see `max_cell_count` and
+        `dilation`), argument `halo_exchange` sets a maximum number of halo-exchange passes
+        so that the groups are no longer inferred independently; the plugin should then
+        admit argument `frozen` (e.g. *dv*, *stochastic.dv*).
+        The passes stop earlier once the maps change by less than `halo_tol`, relative to
+        their largest absolute value.
+        See also :meth:`~tramway.inference.base.Distributed.run_schwarz`.
+        """
         if verbose is None:
             verbose = self.verbose
         mode = self.name
@@ -256,15 +284,27 @@ class Infer(Helper):
         except KeyError:
             _fun = self._infer
 
+        if self.input_is_partition and cells is None:
+            cells = self.cells
+
+        fun_kwargs = kwargs
+        if x0_from is not None:
+            fun_kwargs = dict(kwargs)
+            fun_kwargs.update(self.initial_values(_fun, cells, x0_from, x0_interpolation, kwargs))
+
         if self.input_is_partition:
 
-            if cells is None:
-                cells = self.cells
-            x = _fun(cells, **kwargs)
+            x = _fun(cells, **fun_kwargs)
+
+        elif halo_exchange:
+
+            if halo_tol is not None:
+                fun_kwargs = dict(fun_kwargs, halo_tol=halo_tol)
+            x = cells.run_schwarz(_fun, halo_exchange=halo_exchange, **fun_kwargs)
 
         else:
 
-            x = cells.run(_fun, **kwargs)
+            x = cells.run(_fun, **fun_kwargs)
 
         ret = {}
         if isinstance(x, tuple):
@@ -286,7 +326,7 @@ class Infer(Helper):
             maps = Maps(x, mode=mode)
 
         for p in kwargs:
-            if p not in ['worker_count', 'profile', 'returns']:
+            if p not in ['worker_count', 'profile', 'returns', 'chunksize', 'progress']:
                 setattr(maps, p, kwargs[p])
 
         runtime = time.time() - runtime
@@ -307,6 +347,141 @@ class Infer(Helper):
 
         return maps
 
+    def infer_path(self, cells, priors, warm_start=True, worker_count=None, criterion=None,
+            comment=None, verbose=None, **kwargs):
+        """
+        Run the inference for several values of the regularization priors on the same cells.
+
+        Arguments:
+
+            cells (Distributed or Partition): as in :meth:`infer`.
+
+            priors (list): values of the priors; each element is either a `dict` of keyword
+                arguments (e.g. ``dict(diffusivity_prior=1., potential_prior=10.)``) or a
+                scalar that applies to every *diffusivity_prior*, *potential_prior* or
+                *force_prior* argument of the plugin.
+
+            warm_start (bool): run the values in sequence, each one initialized with the maps
+                of the previous one (see *x0_from* in :meth:`infer`); if ``False``, the values
+                are run in parallel instead.
+
+            worker_count (int): number of parallel processes, per value if `warm_start` is
+                ``True``, or across values otherwise.
+
+            criterion (str or callable): ``'nll'`` for the negative log-likelihood of the
+                translocations (see :func:`~tramway.inference.base.neg_log_likelihood`), or
+                function that takes the cells and the maps (:class:`~pandas.DataFrame`) and
+                returns a `float`.
+
+        Other keyword arguments are passed to the plugin.
+
+        Returns:
+
+            Maps: maps for the last value, with the shared cell index of all the maps, and
+            additional attributes *priors* (`list` of `dict`), *path* (array of shape
+            values x cells x columns, the maps for all the values; see also :func:`path_step`)
+            and *criterion* (array, if `criterion` is defined).
+        """
+        if verbose is None:
+            verbose = self.verbose
+        runtime = time.time()
+
+        prior_args = [ arg for arg in ('diffusivity_prior', 'potential_prior', 'force_prior')
+                if arg in self.setup.get('arguments', {}) ]
+        path = []
+        for prior in priors:
+            if isinstance(prior, dict):
+                path.append(dict(prior))
+            elif prior_args:
+                path.append({ arg: prior for arg in prior_args })
+            else:
+                raise ValueError("mode '{}' admits no prior argument".format(self.name))
+
+        if self.input_is_partition and cells is None:
+            cells = self.cells
+
+        analyses, self.analyses = self.analyses, None # insert only the final maps
+        try:
+            if warm_start:
+                steps, x0 = [], None
+                for prior in path:
+                    step_kwargs = dict(kwargs)
+                    step_kwargs.update(prior)
+                    maps = self.infer(cells, worker_count=worker_count, verbose=verbose,
+                            x0_from=x0, **step_kwargs)
+                    steps.append(maps)
+                    x0 = maps
+            else:
+                try:
+                    _fun = getattr(self.module, self.setup['infer'])
+                except KeyError:
+                    _fun = self._infer
+                if 'returns' in self.setup:
+                    kwargs['returns'] = self.setup['returns']
+                step = partial(_infer_path_step, _fun, cells, self.input_is_partition, kwargs)
+                steps = []
+                for prior, x in zip(path, map_cells(step, path, worker_count=worker_count,
+                        chunksize=1)):
+                    maps = Maps(x[0] if isinstance(x, tuple) else x, mode=self.name)
+                    for p in prior:
+                        setattr(maps, p, prior[p])
+                    steps.append(maps)
+        finally:
+            self.analyses = analyses
+
+        index = steps[0].maps.index
+        columns = steps[0].maps.columns
+        for maps in steps[1:]:
+            index = index.union(maps.maps.index)
+        maps = steps[-1]
+        maps.maps = maps.maps.reindex(index)
+        maps.priors = path
+        maps.path = np.stack([ step.maps.reindex(index=index, columns=columns).values
+                for step in steps ])
+
+        if criterion is not None:
+            if criterion == 'nll':
+                if self.input_is_partition:
+                    raise ValueError("criterion 'nll' requires distributed cells")
+                sigma2 = cells.get_localization_error(dict(kwargs), 0.03, True)
+                criterion = partial(_nll, sigma2=sigma2)
+            elif not callable(criterion):
+                raise ValueError("unsupported criterion: '{}'".format(criterion))
+            maps.criterion = np.array([ criterion(cells, step.maps) for step in steps ])
+
+        runtime = time.time() - runtime
+        if verbose:
+            print('{} mode: {} prior values: elapsed time: {}ms'.format(
+                self.name, len(path), int(round(runtime*1e3))))
+        maps.runtime = runtime
+
+        if self.analyses is not None:
+            self.insert_analysis(maps, comment=comment)
+
+        return maps
+
+    def initial_values(self, _fun, cells, x0_from, interpolation='nearest', kwargs={}):
+        """
+        Initial values `D0`, `V0` and/or `F0` for function `_fun` from maps `x0_from`;
+        see also :meth:`infer`.
+        """
+        if isinstance(x0_from, tuple):
+            x0_from, source = x0_from
+        else:
+            source = None
+        if isinstance(x0_from, Maps):
+            maps = x0_from
+        else:
+            maps = Maps(x0_from)
+        if source is None:
+            x0 = maps.maps
+        else:
+            x0 = interpolate_maps(maps, source, cells, method=interpolation)
+        init_kwargs = initial_arguments(_fun, x0, kwargs)
+        if not init_kwargs:
+            warn('no initial values could be derived from `x0_from`', RuntimeWarning)
+        return init_kwargs
+
     def plugin(self, name, plugins=None, verbose=None, func=None, **kwargs):
         if func is not None:
             if plugins is None:
@@ -326,6 +501,80 @@ class Infer(Helper):
         return input_type and input_type.lower().endswith('partition')
 
 
+def _infer_path_step(fun, cells, input_is_partition, kwargs, prior):
+    kwargs = dict(kwargs)
+    kwargs.update(prior)
+    if input_is_partition:
+        return fun(cells, **kwargs)
+    else:
+        return cells.run(fun, **kwargs)
+
+
+def _nll(cells, maps, sigma2=None):
+    return neg_log_likelihood(cells, maps, sigma2)
+
+
+def path_step(maps, k):
+    """
+    Maps for the `k`-th prior value of a regularization path.
+
+    Arguments:
+
+        maps (Maps): output of :func:`infer_path`.
+
+        k (int): index in `maps.priors`.
+
+    Returns:
+
+        Maps: maps with the prior arguments for the `k`-th value.
+
+    """
+    step = Maps(pd.DataFrame(maps.path[k], index=maps.maps.index, columns=maps.maps.columns),
+            mode=maps.mode)
+    for p in maps.priors[k]:
+        setattr(step, p, maps.priors[k][p])
+    return step
+
+
+def infer_path(cells, mode, priors, warm_start=True, worker_count=None, criterion=None,
+    output_file=None, input_label=None, output_label=None, comment=None, verbose=False,
+    new_cell=None, new_group=None, include_empty_cells=False, cell_sampling=None,
+    max_cell_count=None, dilation=None, grad=None, rgrad=None,
+    overwrite=None, inplace=False, **kwargs):
+    """
+    Regularization path helper.
+
+    Distributes the data once and runs the inference for several values of the priors;
+    see :meth:`Infer.infer_path` for arguments `priors`, `warm_start`, `worker_count` and
+    `criterion`, and :func:`infer1` for the other arguments.
+
+    Returns:
+
+        Maps: maps for the last prior value, with the maps for all the values in
+        attribute *path*; see also :func:`path_step`.
+    """
+    helper = Infer()
+    helper.verbose = verbose
+    helper.labels(input_label=input_label, output_label=output_label, inplace=inplace, comment=comment)
+    cells = helper.prepare_data(cells, labels=input_label)
+    helper.plugin(mode)
+
+    if helper.input_is_partition:
+        _map = None
+    else:
+        _map = helper.distribute(new_cell=new_cell, new_group=new_group,
+                cell_sampling=cell_sampling, include_empty_cells=include_empty_cells,
+                max_cell_count=max_cell_count, dilation=dilation, grad=grad, rgrad=rgrad)
+        _map = helper.overload_cells(_map)
+
+    maps = helper.infer_path(_map, priors, warm_start=warm_start, worker_count=worker_count,
+            criterion=criterion, rgrad=rgrad, **kwargs)
+
+    helper.save_analyses(output_file, force=overwrite)
+
+    return maps
+
+
 def infer1(cells, mode='degraded.d', output_file=None, partition={}, verbose=False, \
     localization_error=None, diffusivity_prior=None, potential_prior=None, jeffreys_prior=None, \
     max_cell_count=None, dilation=None, worker_count=None, min_diffusivity=None, \
@@ -366,6 +615,10 @@ def infer1(cells, mode='degraded.d', output_file=None, partition={}, verbose=Fal
 
         dilation (int): overlap of side cells if `max_cell_count` is defined
 
+        halo_exchange (int): maximum number of halo-exchange passes between the subsets of
+            cells if `max_cell_count` and `dilation` are defined, with `cell_sampling`
+            ``'group'``; see also :meth:`Infer.infer`
+
         worker_count (int): number of parallel processes to be spawned
 
         min_diffusivity (float): (possibly negative) lower bound on local diffusivities
@@ -672,6 +925,7 @@ def infer0(cells, mode='D', output_file=None, partition={}, verbose=False, \
                     grad = None
             if grad is not None:
                 class Distr(new_group):
+                    _operator_functions = dict(grad=grad)
                     def grad(self, *args, **kwargs):
                         return grad(self, *args, **kwargs)
                 new_group = Distr
@@ -741,7 +995,7 @@ def infer0(cells, mode='D', output_file=None, partition={}, verbose=False, \
         maps = Maps(x, mode=mode)
 
     for p in kwargs:
-        if p not in ['worker_count']:
+        if p not in ['worker_count', 'chunksize', 'progress']:
             setattr(maps, p, kwargs[p])
     analysis.add(Analyses(maps), label=output_label, comment=comment)
 
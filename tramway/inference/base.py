@@ -14,23 +14,136 @@
 
 from tramway.core import *
 from tramway.core.exceptions import *
+from tramway.core.parallel import ItemPool
 from tramway.tessellation import format_cell_index, nearest_cell
 import tramway.tessellation as tessellation
-from .gradient import grad1, delta0
+from .gradient import grad1, delta0, local_linear_forms, linear_forms, LocalLinearOperator
 import numpy as np
 import pandas as pd
 import scipy.sparse as sparse
 import scipy.spatial.qhull
 from copy import copy
 from collections import OrderedDict
-from multiprocessing import Pool, Lock
+from multiprocessing import Pool, Lock, cpu_count, current_process
 import six
 from functools import partial
 from warnings import warn
 import traceback
+import inspect
 
 
 
+class CellCache(dict):
+    """
+    Keyed cache of intermediate results, with dependency tracking.
+
+    Each entry is named and may depend on other names, either entries of the same cache
+    or attributes of the owner (e.g. ``'dr'``).
+    Invalidating a name removes the entries that depend on it, recursively.
+
+    Entries set by plain item assignment depend on ``'run'``; they are invalidated at
+    each call to :meth:`Distributed.run`, just like entries that refer to group-relative
+    cell indices should be.
+    Entries registered with :meth:`cached` or :meth:`set` and that do not depend on
+    ``'run'`` survive successive calls to :meth:`Distributed.run`.
+
+    The neighbour-related entries of the spatial operators (*grad1*, *delta0*, *poly*)
+    are relative to the group of cells and to the index map the operator is called with,
+    while the cells may be shared by several overlapping groups.
+    These entries are set by item assignment and are therefore bound to ``'run'``;
+    for the smooth modes, :meth:`Distributed.linear_operator` keeps the operators across
+    runs instead.
+
+    Example::
+
+        dr2 = cell.cached('dr2', lambda: np.sum(cell.dr * cell.dr, axis=1), depends_on=('dr',))
+
+    """
+    __slots__ = ('dependencies',)
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.dependencies = { key: frozenset(('run',)) for key in self }
+
+    def __setitem__(self, key, value):
+        self.set(key, value, ('run',))
+
+    def __reduce__(self):
+        return (_cell_cache, (dict(self), self.dependencies))
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.invalidate(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            value = dict.__getitem__(self, key)
+            self.invalidate(key)
+            return value
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def set(self, key, value, depends_on=()):
+        """
+        Store a value and the names it depends on.
+
+        The entries that depend on `key` are invalidated.
+        """
+        self.invalidate(key)
+        dict.__setitem__(self, key, value)
+        self.dependencies[key] = frozenset(depends_on)
+
+    def cached(self, key, compute, depends_on=()):
+        """
+        Get an entry, computing it with `compute` (no input arguments) if missing.
+        """
+        try:
+            return dict.__getitem__(self, key)
+        except KeyError:
+            value = compute()
+            self.set(key, value, depends_on)
+            return value
+
+    def invalidate(self, *keys):
+        """
+        Remove the entries named `keys` and the entries that depend on them.
+
+        Returns:
+
+            set: names of the removed entries.
+        """
+        stale, removed = set(keys), set()
+        while stale:
+            removed |= stale
+            stale = { key for key, deps in self.dependencies.items()
+                    if key not in removed and not deps.isdisjoint(removed) }
+        removed = { key for key in removed if key in self.dependencies }
+        for key in removed:
+            dict.pop(self, key, None)
+            del self.dependencies[key]
+        return removed
+
+    def clear(self):
+        dict.clear(self)
+        self.dependencies.clear()
+
+
+def _cell_cache(entries, dependencies):
+    cache = CellCache()
+    dict.update(cache, entries)
+    cache.dependencies.update(dependencies)
+    return cache
+
+
 class Local(Lazy):
     """
     Spatially local subset of elements (e.g. translocations). Abstract class.
@@ -149,6 +262,47 @@ class Local(Lazy):
     def tcount(self, c):
         self.__assertlazy__('tcount', c, related_attribute='data')
 
+    def cached(self, key, compute, depends_on=()):
+        """
+        Get a named entry from the cache, computing it if missing.
+
+        See also :class:`CellCache`.
+
+        Arguments:
+
+            key (str): entry name.
+
+            compute (callable): function with no input arguments that returns the value.
+
+            depends_on (sequence of str):
+                names of the attributes or cache entries the value depends on;
+                include ``'run'`` if the entry should not persist across calls to
+                :meth:`Distributed.run`.
+
+        Returns:
+
+            any: cached value.
+
+        """
+        cache = getattr(self, 'cache', None)
+        if not isinstance(cache, CellCache):
+            cache = CellCache(cache) if isinstance(cache, dict) else CellCache()
+            self.cache = cache
+        return cache.cached(key, compute, depends_on)
+
+    def invalidate_cache(self, *keys):
+        """
+        Remove the named entries from the cache, together with the entries that depend on
+        these names.
+
+        A cache that is not a :class:`CellCache` is entirely cleared.
+        """
+        cache = getattr(self, 'cache', None)
+        if isinstance(cache, CellCache):
+            cache.invalidate(*keys)
+        elif cache is not None:
+            self.cache = None
+
     def get_localization_error(self, _kwargs=None, _default_value=None, _localization_error_is_sigma=False, **kwargs):
         """
         Return the localization error as :math:`sigma^2`.
@@ -236,12 +390,18 @@ class Distributed(Local):
             margin cells are not central.
 
     """
-    __slots__ = ('_reverse', '_adjacency', 'central', '_degree', '_ccount', '_tcount')
+    __slots__ = ('_reverse', '_adjacency', 'central', '_degree', '_ccount', '_tcount', '_operators',
+        'cache')
     __lazy__  = Local.__lazy__ + ('reverse', 'degree', 'ccount', 'tcount')
 
+    # functions that implement the methods of this class, for :meth:`linear_operator`;
+    # sub-classes that override any of these methods should define this attribute as well
+    _operator_functions = dict(grad=grad1, local_variation=delta0)
+
     def __init__(self, cells, adjacency, index=None, center=None, span=None, central=None, \
         boundary=None):
         Local.__init__(self, index, OrderedDict(), center, span, boundary)
+        self.cache = None
         self.cells = cells # let's `cells` setter perform the necessary checks
         self.adjacency = adjacency
         self.central = central
@@ -278,6 +438,7 @@ class Distributed(Local):
         #       pass
         self.reverse = None
         self.ccount = None
+        self._operators = None
         self.data = cells
 
     @property
@@ -372,6 +533,7 @@ class Distributed(Local):
             a = a.tocsr()
         self._adjacency = a
         self._degree = None # `degree` is ro, hence set `_degree` instead
+        self._operators = None
 
     @property
     def degree(self):
@@ -475,6 +637,70 @@ class Distributed(Local):
         """
         return delta0(self, i, X, index_map, **kwargs)
 
+    def linear_operator(self, name, index, index_map=None, **kwargs):
+        """
+        Sparse matrix representation of a local linear operator, typically :meth:`grad` or
+        :meth:`local_variation`.
+
+        The operator is built once and memoized; it is discarded if the cells or the adjacency
+        matrix are modified.
+        It is not memoized if any keyword argument is not hashable.
+
+        The local matrices are built directly for the operators of module
+        :mod:`~tramway.inference.gradient`; other implementations of the method are probed
+        (see :func:`~tramway.inference.gradient.local_linear_forms`).
+
+        Arguments:
+
+            name (str):
+                name of the method that implements the operator.
+
+            index (numpy.ndarray):
+                indices of the cells at which the operator is evaluated; the columns of
+                the operator are ordered the same way.
+
+            index_map (numpy.ndarray):
+                index map that converts cell indices to indices in the input vectors.
+
+        Other keyword arguments are passed to the method designated by `name`.
+
+        Returns:
+
+            tramway.inference.gradient.LocalLinearOperator: sparse operator.
+
+        """
+        index = np.asarray(index)
+        key = (name, index.tobytes(), None if index_map is None else np.asarray(index_map).tobytes(),
+                tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            # unhashable keyword arguments; do not memoize
+            key = None
+        try:
+            operators = self._operators
+        except AttributeError:
+            operators = None
+        if operators is None:
+            operators = self._operators = {}
+        try:
+            operator = operators[key]
+        except KeyError:
+            forms = local_linear_forms(self, getattr(self, name), index, index_map,
+                    form=linear_forms.get(self._operator_function(name)), **kwargs)
+            size = self.adjacency.shape[0] if index_map is None else index.size
+            operator = LocalLinearOperator(forms, size)
+            if key is not None:
+                operators[key] = operator
+        return operator
+
+    def _operator_function(self, name):
+        # function that implements method `name`, provided that the class that defines
+        # the method also declares it in `_operator_functions`
+        for cls in type(self).__mro__:
+            if name in cls.__dict__:
+                return cls.__dict__.get('_operator_functions', {}).get(name)
+
     def flatten(self):
         def concat(arrays):
             if isinstance(arrays[0], tuple):
@@ -702,12 +928,26 @@ class Distributed(Local):
             worker_count (int):
                 number of simultaneously working processing units.
 
+            chunksize (int):
+                number of groups sent at once to a worker process;
+                see also :func:`map_cells`.
+
+            progress (callable):
+                called in the parent process with the number of processed groups and the
+                total number of groups, each time a group is completed.
+
             profile (bool or str or tuple):
                 profile each child job if any;
                 if `str`, dump the output stats into *.prof* files;
                 if `tuple`, print a report with :func:`~pstats.Stats.print_stats` and
                 tuple elements as input arguments.
 
+            share_data (bool):
+                if ``True``, the child processes inherit the groups of cells from the parent
+                process, and only receive group indices instead of pickled copies of the groups;
+                requires the *fork* start method, which is the default on Linux;
+                default is ``True`` if the *fork* start method is in use.
+
         Returns:
 
             pandas.DataFrame:
@@ -716,8 +956,8 @@ class Distributed(Local):
                 returns a second merged array of posteriors.
 
         """
-        # clear the caches
-        self.clear_caches()
+        # clear the caches, except the entries that are not specific to a single run
+        self.clear_caches('run')
 
         returns = kwargs.pop('returns', None)
 
@@ -725,8 +965,10 @@ class Distributed(Local):
             # parallel for-loop over the subsets of cells
             # if `worker_count` is `None`, `Pool` will use `multiprocessing.cpu_count()`
             worker_count = kwargs.pop('worker_count', None)
+            chunksize = kwargs.pop('chunksize', None)
+            progress = kwargs.pop('progress', None)
             profile = kwargs.pop('profile', False)
-            pool = Pool(worker_count)
+            share_data = kwargs.pop('share_data', None)
             fargs = (function, args, kwargs)
             if profile:
                 fargs = (profile, fargs)
@@ -738,9 +980,11 @@ class Distributed(Local):
                     _run = __profile_run__
                 else:
                     _run = __run__
-                ys = pool.map(partial(_run, fargs), cells)
+                ys = map_cells(partial(_run, fargs), cells, worker_count=worker_count,
+                        chunksize=chunksize, progress=progress, share_data=share_data)
             elif six.PY2:
                 import itertools
+                pool = Pool(worker_count)
                 if profile:
                     _run = __profile_run_star__
                 else:
@@ -748,20 +992,7 @@ class Distributed(Local):
                 ys = pool.map(_run,
                     itertools.izip(itertools.repeat(fargs), cells))
             if returns is None:
-                ys = [ y for y in ys if y is not None ]
-                if ys:
-                    if ys[1:]:
-                        if isinstance(ys[0], tuple):
-                            ys = zip(*ys)
-                            result = tuple([
-                                pd.concat(_ys, axis=0).sort_index()
-                                for _ys in ys ])
-                        else:
-                            result = pd.concat(ys, axis=0).sort_index()
-                    else:
-                        result = ys[0]
-                else:
-                    result = None
+                result = __merge__(ys)
 
         else:
             # direct function application
@@ -793,6 +1024,119 @@ class Distributed(Local):
 
         return result
 
+    def run_schwarz(self, function, *args, **kwargs):
+        """
+        Apply a function to overlapping groups of cells, as :meth:`run` does, and repeat
+        with halo exchange until the merged maps converge.
+
+        This implements a multiplicative Schwarz scheme.
+        Each group owns its central cells, and the cells in its adjacency margin form its
+        halo.
+        A first pass is the same as :meth:`run`, with the groups processed independently.
+        At each subsequent pass, the groups are warm-started from the merged maps, and
+        their halo cells are frozen at the values owned by the neighbouring groups.
+        The groups are colored so that groups of a same color do not overlap each
+        other's central cells; groups of a same color are processed in parallel, and the
+        merged maps are updated between colors.
+        As a consequence, information propagates across the group boundaries and the seams
+        fade away.
+        With an adjacency margin of at least 2 cells, each group minimizes the exact
+        global objective with respect to its central cells, provided that the cost
+        function involves first-order neighbours only.
+
+        `function` should admit argument `frozen`, a boolean array indexed by
+        group-relative cell index, and initial values `D0`, `V0` and/or `F0`;
+        see also :func:`initial_arguments` and :func:`frozen_bounds`.
+
+        Arguments:
+
+            function (callable):
+                the function to be called on each group of cells; see :meth:`run`.
+
+            args (list):
+                positional arguments for `function` after the first one.
+
+            kwargs (dict):
+                keyword arguments for `function` from which are removed the ones below,
+                and the ones :meth:`run` handles.
+
+            halo_exchange (int):
+                maximum number of halo-exchange passes after the first pass;
+                default is 10.
+
+            halo_tol (float):
+                stop once the largest change in the maps between two passes is lower than
+                `halo_tol` times the largest absolute value in the maps;
+                default is 1e-3.
+
+        Returns:
+
+            pandas.DataFrame:
+                single merged array of maps; unlike :meth:`run`, any extra value
+                returned by `function` (e.g. posteriors) is discarded.
+
+        """
+        iterations = kwargs.pop('halo_exchange', 10)
+        tol = kwargs.pop('halo_tol', 1e-3)
+        verbose = kwargs.get('verbose', False)
+
+        groups = [ self.cells[j] for j in self.cells ]
+        if not all(isinstance(group, Distributed) for group in groups):
+            raise TypeError('not a `Distributed` of `Distributed`; call `group` first')
+        if any(group.central is None for group in groups):
+            raise ValueError('halo exchange requires groups with an adjacency margin')
+        try:
+            params = inspect.signature(function).parameters
+        except (TypeError, ValueError):
+            params = {}
+        if 'frozen' not in params:
+            raise ValueError('the function does not admit argument `frozen`')
+
+        # greedy coloring of the groups
+        owned = [ set(group.indices[group.central].tolist()) for group in groups ]
+        covered = [ set(group.indices.tolist()) for group in groups ]
+        colors = []
+        for a in range(len(groups)):
+            for color in colors:
+                if not any(owned[a] & covered[b] or owned[b] & covered[a] for b in color):
+                    color.append(a)
+                    break
+            else:
+                colors.append([a])
+
+        map_kwargs = {}
+        for arg in ('worker_count', 'chunksize', 'progress', 'share_data'):
+            if arg in kwargs:
+                map_kwargs[arg] = kwargs.pop(arg)
+
+        self.clear_caches('run')
+        ys = map_cells(partial(__run__, (function, args, kwargs)), groups, **map_kwargs)
+        maps = __merge__([ y[0] if isinstance(y, tuple) else y for y in ys ])
+        for k in range(iterations):
+            previous = maps
+            for color in colors:
+                tasks = []
+                for a in color:
+                    group = groups[a]
+                    x0 = maps.reindex(group.indices)
+                    x0.index = list(group.keys())
+                    tasks.append((group, initial_arguments(function, x0, kwargs)))
+                self.clear_caches('run')
+                ys = map_cells(partial(__run_halo__, (function, args, kwargs)), tasks,
+                        **map_kwargs)
+                update = __merge__([ y[0] if isinstance(y, tuple) else y for y in ys ])
+                if update is not None:
+                    maps = pd.concat((maps.drop(update.index, errors='ignore'), update),
+                            sort=False).sort_index()
+            change = np.nanmax(np.abs((maps - previous).values))
+            scale = np.nanmax(np.abs(previous.values))
+            if verbose:
+                print('halo exchange {:d}: max change= {}'.format(k + 1, change))
+            if change <= tol * scale:
+                break
+
+        return maps
+
     # `dict` interface
     def __len__(self):
         return self.adjacency.shape[0]
@@ -848,18 +1192,28 @@ class Distributed(Local):
         """
         return self.adjacency.indices[self.adjacency.indptr[i]:self.adjacency.indptr[i+1]]
 
-    def clear_caches(self):
+    def clear_caches(self, *keys):
+        """
+        Clear the caches of the group and of all the cells, or invalidate the named
+        entries only if any.
+
+        See also :meth:`Cell.clear_cache` and :class:`CellCache`.
+        """
+        if keys:
+            self.invalidate_cache(*keys)
+        else:
+            self.cache = None
         try:
             first = True
             for c in self.values():
-                c.clear_cache()
+                c.clear_cache(*keys)
                 first = False
         except AttributeError as e:
             if first:
                 try:
                     first = True
                     for c in self.values():
-                        c.clear_caches()
+                        c.clear_caches(*keys)
                         first = False
                     return
                 except:
@@ -869,6 +1223,24 @@ class Distributed(Local):
                 raise
 
 
+def __merge__(ys):
+    ys = [ y for y in ys if y is not None ]
+    if ys:
+        if ys[1:]:
+            if isinstance(ys[0], tuple):
+                ys = zip(*ys)
+                result = tuple([
+                    pd.concat(_ys, axis=0).sort_index()
+                    for _ys in ys ])
+            else:
+                result = pd.concat(ys, axis=0).sort_index()
+        else:
+            result = ys[0]
+    else:
+        result = None
+    return result
+
+
 def __run__(func, cell):
     function, args, kwargs = func
     try:
@@ -906,6 +1278,12 @@ def __run__(func, cell):
         else:
             return x
 
+def __run_halo__(func, task):
+    function, args, kwargs = func
+    cell, init_kwargs = task
+    kwargs = dict(kwargs, frozen=~cell.central, **init_kwargs)
+    return __run__((function, args, kwargs), cell)
+
 def __run_star__(args):
     return __run__(*args)
 
@@ -936,6 +1314,54 @@ def __profile_run_star__(args):
     return __profile_run__(*args)
 
 
+def map_cells(function, cells, worker_count=None, chunksize=None, progress=None,
+        share_data=None):
+    """
+    Apply a function to each element of a sequence of cells or groups of cells,
+    in parallel.
+
+    The elements are sent to the worker processes by chunks of `chunksize` elements.
+    The results are returned in the order of `cells`, whatever the order in which the
+    chunks are completed.
+
+    Arguments:
+
+        function (callable): picklable function that takes a single element of `cells`.
+
+        cells (list): cells, groups of cells (:class:`Distributed`) or any picklable items.
+
+        worker_count (int):
+            number of simultaneously working processing units;
+            if `worker_count` is `None`, :class:`~multiprocessing.Pool` will use
+            :func:`multiprocessing.cpu_count`;
+            if ``1``, or if called from a worker process, the elements are processed
+            sequentially in the current process.
+
+        chunksize (int):
+            number of elements sent at once to a worker process;
+            default is the same as for :meth:`multiprocessing.pool.Pool.map`.
+
+        progress (callable):
+            called in the current process with the number of processed elements and the
+            total number of elements, each time an element is completed.
+
+        share_data (bool):
+            if ``True``, each worker process receives `cells` once, at start-up, and
+            only receives indices afterwards, instead of pickled copies of the elements;
+            with the *fork* start method (default on Linux), `cells` are not even pickled;
+            default is ``True`` if the *fork* start method is in use.
+
+    See also :class:`~tramway.core.parallel.ItemPool`.
+
+    Returns:
+
+        list: the values returned by `function`, in the order of `cells`.
+
+    """
+    with ItemPool(cells, worker_count, share_data) as pool:
+        return pool.map(function, chunksize, progress)
+
+
 FiniteElements = Distributed
 
 
@@ -946,10 +1372,11 @@ class Cell(Local):
 
     Attributes:
 
-        cache (any):
+        cache (CellCache):
             Depending on the inference approach and objective, caching an intermediate
-            result may avoid repeating many times a same computation. Usage of this cache
-            is totally free and comes without support for concurrency.
+            result may avoid repeating many times a same computation.
+            Entries should be preferably accessed with :meth:`~Local.cached`.
+            The cache comes without support for concurrency.
 
     """
     __slots__ = ('_time_col', '_space_cols', 'cache', 'fuzzy')
@@ -1061,6 +1488,7 @@ class Cell(Local):
     @time_data.setter
     def time_data(self, t):
         self.data = (self.space_data, t)
+        self.invalidate_cache('dt')
 
     def _extract_time(self):
         if isstructured(self.data):
@@ -1077,6 +1505,7 @@ class Cell(Local):
     @space_data.setter
     def space_data(self, xy):
         self.data = (xy, self.time_data)
+        self.invalidate_cache('dr')
 
     def _extract_space(self):
         if isstructured(self.data):
@@ -1093,8 +1522,14 @@ class Cell(Local):
         else:
             return 0 < int(self.data.size)
 
-    def clear_cache(self):
-        self.cache = None
+    def clear_cache(self, *keys):
+        """
+        Clear the cache, or invalidate the named entries only if any.
+        """
+        if keys:
+            self.invalidate_cache(*keys)
+        else:
+            self.cache = None
 
 
 FiniteElement = Cell
@@ -1343,6 +1778,72 @@ def identify_columns(points, trajectory_col=True):
     return coord_cols, trajectory_col, get_var, get_point
 
 
+class CellRows(object):
+    """
+    (Trans-)location-cell association, with the (trans-)location rows sorted by cell.
+
+    The association is built once with a single sort, so that the rows of a cell
+    are found in constant time as a contiguous range (*indptr* is similar to the
+    index pointer of a CSR matrix).
+
+    Calling a `CellRows` object with a cell index returns a boolean array with Trues
+    for the (trans-)locations associated with the cell, as expected from the
+    *location_cell*, *initial_cell* and *final_cell* callables.
+
+    Attributes:
+
+        rows (numpy.ndarray):
+            (trans-)location row indices, sorted by cell and then by row.
+
+        indptr (numpy.ndarray):
+            for cell *j*, the associated rows are ``rows[indptr[j]:indptr[j+1]]``.
+
+        size (int):
+            total number of (trans-)locations.
+
+    """
+    __slots__ = ('rows', 'indptr', 'size')
+
+    def __init__(self, rows, cells, size, cell_count=None):
+        rows, cells = np.asarray(rows), np.asarray(cells)
+        ok = np.logical_and(0 <= rows, 0 <= cells)
+        rows, cells = rows[ok], cells[ok]
+        order = np.lexsort((rows, cells))
+        rows, cells = rows[order], cells[order]
+        if rows.size:
+            # a (trans-)location is associated at most once with a cell
+            unique = np.r_[True, np.logical_or(np.diff(rows) != 0, np.diff(cells) != 0)]
+            rows, cells = rows[unique], cells[unique]
+        if cell_count is None:
+            cell_count = cells[-1] + 1 if cells.size else 0
+        self.rows = rows
+        self.indptr = np.searchsorted(cells, np.arange(cell_count + 1))
+        self.size = size
+
+    @property
+    def cell_count(self):
+        return self.indptr.size - 1
+
+    def get(self, cell):
+        """
+        Arguments:
+
+            cell (int): cell index.
+
+        Returns:
+
+            numpy.ndarray: sorted row indices of the (trans-)locations associated with cell `cell`.
+        """
+        if cell < 0 or self.cell_count <= cell:
+            return self.rows[:0]
+        return self.rows[self.indptr[cell]:self.indptr[cell+1]]
+
+    def __call__(self, cell):
+        _in = np.zeros(self.size, dtype=bool)
+        _in[self.get(cell)] = True
+        return _in
+
+
 def get_locations(points, index=None, coord_cols=None, get_var=None, get_point=None):
     """
     Make helpers for manipulating the point data.
@@ -1383,26 +1884,7 @@ def get_locations(points, index=None, coord_cols=None, get_var=None, get_point=N
         _point, _cell = index
         loc_count = locations.shape[0]
 
-        def __associated__(cell):
-            """
-            Location-cell association.
-
-            Arguments:
-
-                cell (int):
-                    cell index.
-
-            Returns:
-
-                bool or ndarray:
-                    True for locations associated to cell `cell`,
-                    False otherwise.
-            """
-            _in = np.zeros(loc_count, dtype=bool)
-            _in[_point[_cell == cell]] = True
-            return _in
-
-        location_cell = __associated__
+        location_cell = CellRows(_point, _cell, loc_count)
 
     else:#if sparse.issparse(index):
         assert sparse.issparse(index)
@@ -1519,26 +2001,7 @@ def get_translocations(points, index=None, coord_cols=None, trajectory_col=True,
             _loc = _loc[_point]
             if not np.any(_transloc_ok):
                 raise ValueError('no translocations available')
-            def __associated__(cell):
-                """
-                Translocation-cell association.
-
-                Arguments:
-
-                    cell (int):
-                        cell index.
-
-                Returns:
-
-                    bool or numpy.ndarray:
-                        True for translocations associated to cell `cell`,
-                        False otherwise.
-                """
-                _in = np.zeros(transloc_count, dtype=bool)
-                _ok = _loc[_cell == cell]
-                _in[_ok[0<=_ok]] = True
-                return _in
-            return __associated__
+            return CellRows(_loc, _cell, transloc_count)
 
         initial_cell = __f__(initial)
         final_cell = __f__(final)
@@ -1565,27 +2028,9 @@ def get_translocations(points, index=None, coord_cols=None, trajectory_col=True,
             _transloc[termination] = np.arange(transloc_count)
             if np.all(_transloc==-1):
                 raise ValueError('no translocations available')
-            def __association__(cell):
-                """
-                Translocation-cell association.
-
-                Arguments:
-
-                    cell (int):
-                        cell index.
-
-                Returns:
-
-                    any:
-                        scalar value or ndarray which elements evaluate to
-                        True for translocations associated to cell `cell`,
-                        False otherwise.
-                """
-                _in = np.zeros(transloc_count, dtype=bool)
-                _ok = _transloc[index.indices[index.indptr[cell]:index.indptr[cell+1]]]
-                _in[_ok[0<=_ok]] = True
-                return _in
-            return __association__
+            cell_count = index.shape[1]
+            _cell = np.repeat(np.arange(cell_count), np.diff(index.indptr))
+            return CellRows(_transloc[index.indices], _cell, transloc_count, cell_count)
 
         initial_cell = __f__(initial)
         final_cell = __f__(final)
@@ -1689,7 +2134,7 @@ def distributed(cells, new_cell=None, new_group=Distributed, fuzzy=None,
         are_translocations = trajectory_col is not None or has_precomputed_deltas
     else:
         if issubclass(new_cell, Locations):
-            are_translocations = False
+            are_translocations = are_tracked_molecules = False
         elif issubclass(new_cell, Translocations):
             are_translocations = True
             are_tracked_molecules = issubclass(new_cell, TrackedMolecules)
@@ -1716,7 +2161,14 @@ def distributed(cells, new_cell=None, new_group=Distributed, fuzzy=None,
             new_cell = Locations
 
     # assign/weight (trans-)locations to cells
+    cell_rows = None
     if fuzzy is None:
+        # sort the (trans-)locations by cell once for all
+        _index = initial_cell if are_translocations else location_index
+        if isinstance(_index, CellRows):
+            cell_rows = _index
+        elif isinstance(_index, np.ndarray):
+            cell_rows = CellRows(np.arange(_index.size), _index, _index.size)
         if are_translocations:
             def f(tessellation, cell, translocations, translocation_cell, get_point):
                 initial_point, final_point = translocations
@@ -1780,54 +2232,75 @@ def distributed(cells, new_cell=None, new_group=Distributed, fuzzy=None,
             J = np.logical_and(0 < cells.location_count, 0 < cells.tessellation.cell_label)
 
     # select (with the fuzzy filter) and pre-build cells
+    if isinstance(cells.points, pd.DataFrame):
+        def get_rows(a, i):
+            return a.iloc[i]
+    else:
+        get_rows = get_point
     _fuzzy, data, hull = {}, {}, {}
     if are_translocations:
         extra = {}
+        if not has_precomputed_deltas:
+            # labels of the origins, shifted so that they match those of the destinations
+            origin_label = np.asarray(initial_point.index + 1)
+            destination_label = np.asarray(final_point.index)
+        trajectory_index = None
+        if are_tracked_molecules:
+            trajectory_index = cells.points['n'][initial_point.index].values
+            if trajectory_index.size != initial_point.shape[0]:
+                # duplicate labels; look the trajectories up cell by cell instead
+                trajectory_index = None
     for j, ok in enumerate(J): # for each cell
         if not ok:
             continue
 
-        # find (trans-)locations for cell j
-        i = fuzzy(cells.tessellation, j, *fuzzy_args, **fuzzy_kwargs)
-        if i.dtype in (bool, np.bool, np.bool8, np.bool_):
-            _fuzzy[j] = None
+        # find (trans-)locations for cell j, as row indices
+        if cell_rows is None:
+            i = fuzzy(cells.tessellation, j, *fuzzy_args, **fuzzy_kwargs)
+            if i.dtype in (bool, np.bool, np.bool8, np.bool_):
+                _fuzzy[j] = None
+            else:
+                _fuzzy[j] = i[i != 0]
+                i = i != 0
+            i = np.flatnonzero(i)
         else:
-            _fuzzy[j] = i[i != 0]
-            i = i != 0
+            i = cell_rows.get(j)
+            _fuzzy[j] = None
 
         if are_translocations:
-            _origin = get_point(initial_point, i)
-            _destination = get_point(final_point, i)
+            if not has_precomputed_deltas:
+                # keep the translocations whose both ends are found in cell j
+                _o, _d = origin_label[i], destination_label[i]
+                try:
+                    _ok = np.isin(_o, _d)
+                    _ok &= np.isin(_d, _o)
+                except TypeError:
+                    J[j] = False
+                    continue
+                i = i[_ok]
+            _origin = get_rows(initial_point, i)
+            _destination = get_rows(final_point, i)
             if has_precomputed_deltas:
                 assert np.all(_origin.index == _destination.index)
                 __origin = _origin
             else:
                 __origin = _origin.copy() # make copy
-                __origin.index += 1
-                try:
-                    _ok = np.array([i in _destination.index for i in __origin.index])
-                    _ok &= np.array([i in __origin.index for i in _destination.index])
-                except TypeError:
-                    J[j] = False
-                    continue
-                _origin = get_point(_origin, _ok)
-                __origin = get_point(__origin, _ok)
-                _destination = get_point(_destination, _ok)
+                __origin.index = origin_label[i]
             _points = _origin # for convex hull; ideally not only origins
             points = _destination - __origin # translocations
         else:
-            points = _points = get_point(locations, i) # locations
+            points = _points = get_rows(locations, i) # locations
 
         assert not np.any(np.isnan(np.asarray(points)))
 
         # convex hull
-        _points = np.asarray(get_var(_points, space_cols))
         try:
             hull[j] = cells.tessellation.cell_volume[j]
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception as e:
             #try:
+            #    _points = np.asarray(get_var(_points, space_cols))
             #    hull[j] = scipy.spatial.qhull.ConvexHull(_points)
             #except (KeyboardInterrupt, SystemExit):
             #    raise
@@ -1839,7 +2312,10 @@ def distributed(cells, new_cell=None, new_group=Distributed, fuzzy=None,
             J[j] = False
         else:
             if are_tracked_molecules:
-                _trajectory_index = cells.points['n'][_origin.index].values
+                if trajectory_index is None:
+                    _trajectory_index = cells.points['n'][_origin.index].values
+                else:
+                    _trajectory_index = trajectory_index[i]
                 extra[j] = (_origin, _destination, _trajectory_index)
             elif are_translocations:
                 extra[j] = (_origin, _destination)
@@ -1864,7 +2340,7 @@ def distributed(cells, new_cell=None, new_group=Distributed, fuzzy=None,
         except AttributeError:
             center = span = None
         else:
-            adj = _adjacency[j].indices
+            adj = _adjacency.indices[_adjacency.indptr[j]:_adjacency.indptr[j+1]]
             span = cells.tessellation.cell_centers[adj] - center
 
         # make cell object
@@ -2247,6 +2723,7 @@ def smooth_infer_init(cells, min_diffusivity=None, jeffreys_prior=None, **kwargs
             warn('translocation dts are not all positive', RuntimeWarning)
             cell.dr[cell.dt < 0] *= -1.
             cell.dt[cell.dt < 0] *= -1.
+            cell.clear_cache('dr', 'dt')
 
         # check cell i has neighbours
         try:
@@ -2259,7 +2736,7 @@ def smooth_infer_init(cells, min_diffusivity=None, jeffreys_prior=None, **kwargs
 
         # initialize the local diffusivity parameter
         dt_max_i = np.max(cell.dt)
-        dt_mean_i = np.mean(cell.dt)
+        dt_mean_i = cell.cached('dt_mean', lambda: np.mean(cell.dt), ('dt',))
         D_initial_i = np.mean(cell.dr * cell.dr) / (2. * dt_mean_i)
         #
 
@@ -2304,9 +2781,275 @@ def smooth_infer_init(cells, min_diffusivity=None, jeffreys_prior=None, **kwargs
     return index, reverse_index, n, dt_mean, D_initial, min_diffusivity, D_bounds, border
 
 
-__all__ = ['Local', 'Distributed', 'Cell', 'Locations', 'Translocations', 'Maps',
+def neg_log_likelihood(cells, maps, sigma2):
+    """
+    Negative log-likelihood of the translocations given inferred maps.
+
+    The translocations in each cell are modelled as Gaussian with mean :math:`D F \\Delta t`
+    and variance :math:`2 (D \\Delta t + \\sigma^2)` per space dimension.
+    The drift term is ignored if the maps do not include a *force* feature.
+
+    Arguments:
+
+        cells (Distributed): cells, or groups of cells, the maps were inferred on.
+
+        maps (Maps or pandas.DataFrame): maps with a *diffusivity* feature.
+
+        sigma2 (float): localization error :math:`\\sigma^2`.
+
+    Returns:
+
+        float: negative log-likelihood, summed over the cells with defined map values.
+
+    """
+    if isinstance(maps, Maps):
+        maps = maps.maps
+    features = splitcoord(maps.columns)
+    D = maps['diffusivity']
+    F = maps[features['force']] if 'force' in features else None
+    # collect the individual cells, once each even if groups overlap
+    def flatten(cells, flat):
+        for i in cells:
+            cell = cells[i]
+            if isinstance(cell, Distributed):
+                flatten(cell, flat)
+            else:
+                flat[i] = cell
+        return flat
+    nll = 0.
+    for i, cell in flatten(cells, OrderedDict()).items():
+        try:
+            D_i = D[i]
+        except KeyError:
+            continue
+        if np.isnan(D_i) or not bool(cell):
+            continue
+        dt = cell.dt.reshape((-1, 1))
+        var = 2. * (D_i * dt + sigma2)
+        dr = cell.dr
+        if F is not None:
+            F_i = F.loc[i].values
+            if not np.any(np.isnan(F_i)):
+                dr = dr - D_i * F_i[np.newaxis,:] * dt
+        nll += .5 * np.sum(np.log(2. * np.pi * var) * dr.shape[1]) + np.sum(dr * dr / (2. * var))
+    return nll
+
+
+def initial_values(x0, index, default, name='x0'):
+    """
+    Align user-supplied initial parameter values with the cells of an inference.
+
+    Arguments:
+
+        x0 (float or numpy.ndarray or pandas.Series or pandas.DataFrame):
+            initial values; *pandas* objects are indexed by cell index and the cells
+            they do not cover (or with NaN values) keep their `default` value.
+
+        index (sequence): cell indices, as returned by :func:`smooth_infer_init`.
+
+        default (numpy.ndarray): default initial values; one row per element of `index`.
+
+        name (str): argument name for error messages.
+
+    Returns:
+
+        numpy.ndarray: initial values, with the shape and dtype of `default`.
+
+    """
+    if x0 is None:
+        return default
+    if isinstance(x0, (pd.Series, pd.DataFrame)):
+        values = x0.reindex(index).values
+        if values.size != default.size:
+            raise ValueError('wrong number of columns for {}'.format(name))
+        values = values.reshape(default.shape).astype(default.dtype)
+        missing = np.isnan(values)
+        values[missing] = default[missing]
+    elif np.isscalar(x0):
+        values = np.full_like(default, x0)
+    else:
+        values = np.asarray(x0)
+        if values.size != default.size:
+            raise ValueError('wrong size for {}'.format(name))
+        values = values.reshape(default.shape)
+    return values
+
+
+def frozen_bounds(bounds, frozen, index, *values):
+    """
+    Pin the parameters of frozen cells to their initial values.
+
+    Arguments:
+
+        bounds (list): (lower bound, upper bound) couples for the concatenated parameter
+            vectors, as in :func:`smooth_infer_init`; ``None`` if unbounded.
+
+        frozen (array-like): boolean array indexed by cell index, with ``True`` for the
+            cells the parameters of which should not change; may be ``None``.
+
+        index (sequence): cell indices, as returned by :func:`smooth_infer_init`.
+
+        values (numpy.ndarray): initial values of each type of parameter
+            (e.g. diffusivity, potential), one element per element of `index`.
+
+    Returns:
+
+        list: bounds with equal lower and upper bounds for the frozen parameters;
+        `bounds` if `frozen` is ``None``.
+
+    """
+    if frozen is None:
+        return bounds
+    frozen = np.asarray(frozen, dtype=bool)[index].nonzero()[0]
+    n = len(index)
+    if bounds is None:
+        bounds = [(None, None)] * (n * len(values))
+    else:
+        bounds = list(bounds)
+    for k, x in enumerate(values):
+        for i in frozen:
+            bounds[k * n + i] = (x[i], x[i])
+    return bounds
+
+
+def initial_arguments(fun, maps, kwargs={}):
+    """
+    Initial values `D0`, `V0` and/or `F0` for an *infer* function, from existing maps.
+
+    Arguments:
+
+        fun (callable): *infer* function; only the arguments in its signature are returned.
+
+        maps (Maps or pandas.DataFrame): maps indexed by cell index, with features
+            *diffusivity*, *potential* and/or *force*.
+
+        kwargs (dict): keyword arguments to `fun`; the initial values explicitly defined
+            in `kwargs` are not overridden.
+
+    Returns:
+
+        dict: keyword arguments, with :class:`~pandas.Series` (scalar features) or
+        :class:`~pandas.DataFrame` (vector features) values;
+        see also :func:`initial_values`.
+
+    """
+    if isinstance(maps, Maps):
+        maps = maps.maps
+    try:
+        params = inspect.signature(fun).parameters
+    except (TypeError, ValueError):
+        params = {}
+    features = splitcoord(maps.columns)
+    init_kwargs = {}
+    for arg, feature in (('D0', 'diffusivity'), ('V0', 'potential'), ('F0', 'force')):
+        if arg in params and kwargs.get(arg, None) is None and feature in features:
+            columns = features[feature]
+            init_kwargs[arg] = maps[columns[0]] if len(columns) == 1 else maps[columns]
+    return init_kwargs
+
+
+def cell_centers(cells):
+    """
+    Cell indices and center coordinates.
+
+    Arguments:
+
+        cells (Distributed or Partition or Tessellation or numpy.ndarray):
+            cells, or array of cell centers with one row per cell.
+
+    Returns:
+
+        tuple: array of cell indices and matching array of cell centers.
+
+    """
+    if isinstance(cells, Distributed):
+        centers = OrderedDict()
+        for i in cells:
+            cell = cells[i]
+            if isinstance(cell, Distributed): # group of cells
+                centers.update(zip(*cell_centers(cell)))
+            elif cell.center is not None:
+                centers[i] = cell.center
+        if not centers:
+            raise ValueError('missing cell centers')
+        return np.array(list(centers.keys())), np.vstack(list(centers.values()))
+    try:
+        cells = cells.tessellation # Partition
+    except AttributeError:
+        pass
+    try:
+        centers = cells.cell_centers # Tessellation
+    except AttributeError:
+        centers = cells
+    centers = np.asarray(centers)
+    if centers.ndim != 2:
+        raise TypeError('cell centers expected as a 2D array')
+    return np.arange(centers.shape[0]), centers
+
+
+def interpolate_maps(maps, source, target, method='nearest'):
+    """
+    Interpolate maps onto the centers of another set of cells.
+
+    Arguments:
+
+        maps (Maps or pandas.DataFrame): maps indexed by cell index.
+
+        source (Distributed or Partition or Tessellation or numpy.ndarray):
+            cells the maps were inferred on; see :func:`cell_centers`.
+
+        target (Distributed or Partition or Tessellation or numpy.ndarray):
+            cells to interpolate the maps onto.
+
+        method (str): either ``'nearest'`` (value of the nearest source cell) or
+            ``'barycentric'`` (linear interpolation in the Delaunay triangulation of
+            the source cell centers; target cells outside the convex hull take the
+            value of the nearest source cell).
+
+    Returns:
+
+        pandas.DataFrame: interpolated maps indexed by the target cell indices.
+
+    """
+    if isinstance(maps, Maps):
+        maps = maps.maps
+    src_index, src_centers = cell_centers(source)
+    tgt_index, tgt_centers = cell_centers(target)
+    if src_centers.shape[1] != tgt_centers.shape[1]:
+        raise ValueError('source and target cells have different dimensions')
+    # keep the source cells with defined values only
+    ok = np.isin(src_index, maps.index)
+    src_index, src_centers = src_index[ok], src_centers[ok]
+    values = maps.loc[src_index]
+    ok = ~np.any(np.isnan(values.values), axis=1)
+    src_centers, values = src_centers[ok], values.values[ok]
+    if values.shape[0] == 0:
+        raise ValueError('no source cells with defined values')
+    _, nearest = scipy.spatial.cKDTree(src_centers).query(tgt_centers)
+    interpolated = values[nearest]
+    if method == 'barycentric':
+        if values.shape[0] <= src_centers.shape[1]:
+            raise ValueError('not enough source cells for barycentric interpolation')
+        triangulation = scipy.spatial.Delaunay(src_centers)
+        simplex = triangulation.find_simplex(tgt_centers)
+        inside = 0 <= simplex
+        T = triangulation.transform[simplex[inside]]
+        dim = src_centers.shape[1]
+        b = np.einsum('ijk,ik->ij', T[:,:dim], tgt_centers[inside] - T[:,dim])
+        weights = np.c_[b, 1. - b.sum(axis=1)]
+        vertices = triangulation.simplices[simplex[inside]]
+        interpolated[inside] = np.einsum('ij,ijk->ik', weights, values[vertices])
+    elif method != 'nearest':
+        raise ValueError("unsupported interpolation method: '{}'".format(method))
+    return pd.DataFrame(interpolated, index=tgt_index, columns=maps.columns)
+
+
+__all__ = ['CellCache', 'Local', 'Distributed', 'Cell', 'Locations', 'Translocations', 'Maps',
     'FiniteElement', 'FiniteElements',
-    'identify_columns', 'get_locations', 'get_translocations', 'distributed',
+    'identify_columns', 'CellRows', 'get_locations', 'get_translocations', 'distributed',
+    'map_cells',
     'TrackedMolecules', 'DistributeMerge',
-    'DiffusivityWarning', 'OptimizationWarning', 'smooth_infer_init']
+    'DiffusivityWarning', 'OptimizationWarning', 'smooth_infer_init',
+    'initial_values', 'initial_arguments', 'frozen_bounds', 'cell_centers', 'interpolate_maps',
+    'neg_log_likelihood']
 
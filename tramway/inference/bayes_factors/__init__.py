@@ -2,9 +2,12 @@
 import logging
 import sys
 from collections import OrderedDict
+from functools import partial
+from types import SimpleNamespace
 
 import numpy as np
 
+from tramway.inference.base import map_cells
 from tramway.tessellation.base import point_adjacency_matrix
 
 from .calculate_bayes_factors import (NaNInputError, calculate_bayes_factors,
@@ -19,7 +22,20 @@ if sys.version_info < (3, 5):
     raise RuntimeError("Python 3.5+ is required for calculating Bayes factors")
 
 
-def _bayes_factor(cells, B_threshold=None, verbose=True, **kwargs):
+_input_vars = ('zeta_total', 'zeta_spurious', 'n', 'V', 'V_prior')
+
+
+def _bayes_factor_for_one_cell(localization_error, kwargs, inputs):
+    # the cells may not be picklable; the workers receive the input variables only
+    cell = SimpleNamespace(**inputs)
+    try:
+        return calculate_bayes_factors_for_one_cell(cell, localization_error, **kwargs)
+    except NaNInputError:
+        return None
+
+
+def _bayes_factor(cells, B_threshold=None, verbose=True, worker_count=None, chunksize=None,
+                  progress=None, **kwargs):
     if verbose:
         try:
             from tqdm import tqdm
@@ -27,9 +43,9 @@ def _bayes_factor(cells, B_threshold=None, verbose=True, **kwargs):
             logging.warning(
                 "Consider installing `tqdm` package (`pip install tqdm`) to see Bayes factors calculation progress.")
 
-            def tqdm(x, desc=None): return x
+            def tqdm(x=None, desc=None, total=None): return x
     else:
-        def tqdm(x, desc=None): return x
+        def tqdm(x=None, desc=None, total=None): return x
 
     # TODO: use the same localization error as for inference
     # input arguments
@@ -44,13 +60,27 @@ def _bayes_factor(cells, B_threshold=None, verbose=True, **kwargs):
     if verbose is not None:
         kwargs['verbose'] = verbose
 
-    # iterate over the cells
+    # iterate over the cells, in parallel;
+    # the workers return the per-cell values that are set here on the cells of the parent process
+    keys = list(cells)
+    progress_bar = tqdm(total=len(keys))
+    if progress is None and progress_bar is not None:
+        def progress(done, total):
+            progress_bar.update(done - progress_bar.n)
+    try:
+        results = map_cells(
+            partial(_bayes_factor_for_one_cell, localization_error, kwargs),
+            [{var: getattr(cells[key], var) for var in _input_vars} for key in keys],
+            worker_count=worker_count, chunksize=chunksize, progress=progress)
+    finally:
+        if progress_bar is not None:
+            progress_bar.close()
     nan_cells_list = []
-    for key in tqdm(cells):
-        try:
-            calculate_bayes_factors_for_one_cell(cells[key], localization_error, **kwargs)
-        except NaNInputError:
+    for key, result in zip(keys, results):
+        if result is None:
             nan_cells_list.append(key)
+            result = [np.nan] * 3
+        cells[key].lg_B, cells[key].force, cells[key].min_n = result
 
     # Report error if any
     if len(nan_cells_list) > 0:
@@ -68,6 +98,7 @@ setup = {
         ('localization_error', ('-e', dict(type=float, help='localization error (same units as the variance)'))),
         ('B_threshold', ('-b', dict(type=float, help='values of Bayes factor for thresholding'))),
         ('verbose', ()),
+        ('worker_count', ('-w', dict(type=int, help='number of parallel processes to spawn'))),
     )),
     # List of variables that the module returns as cell properties, e.g. cell.lg_B
     'returns': ['lg_B', 'force', 'min_n', 'groups', 'group_lg_B', 'group_forces'],
@@ -23,12 +23,14 @@ setup['infer'] = 'infer_D'
 
 
 def infer_D(cells, diffusivity_prior=None, jeffreys_prior=None, min_diffusivity=None,
-        max_iter=None, epsilon=None, rgrad=None, **kwargs):
+        max_iter=None, epsilon=None, rgrad=None, posterior_gradient=None,
+        posterior_engine=None, **kwargs):
 
     if diffusivity_prior is None:
         return degraded_d.infer_D(cells, jeffreys_prior=jeffreys_prior,
                 min_diffusivity=min_diffusivity, **kwargs)
     else:
         return standard_d.infer_smooth_D(cells, diffusivity_prior, jeffreys_prior,
-                min_diffusivity, max_iter, epsilon, rgrad, **kwargs)
+                min_diffusivity, max_iter, epsilon, rgrad,
+                posterior_gradient=posterior_gradient, posterior_engine=posterior_engine, **kwargs)
 
@@ -23,12 +23,14 @@ setup['infer'] = 'infer_DD'
 
 
 def infer_DD(cells, diffusivity_prior=None, drift_prior=None, jeffreys_prior=False,
-        min_diffusivity=None, max_iter=None, epsilon=None, rgrad=None, **kwargs):
+        min_diffusivity=None, max_iter=None, epsilon=None, rgrad=None,
+        posterior_gradient=None, posterior_engine=None, **kwargs):
 
     if diffusivity_prior is None and drift_prior is None:
         return degraded_dd.infer_DD(cells, jeffreys_prior=jeffreys_prior,
                 min_diffusivity=min_diffusivity, **kwargs)
     else:
         return standard_dd.infer_smooth_DD(cells, diffusivity_prior, drift_prior, jeffreys_prior,
-                min_diffusivity, max_iter, epsilon, rgrad, **kwargs)
+                min_diffusivity, max_iter, epsilon, rgrad,
+                posterior_gradient=posterior_gradient, posterior_engine=posterior_engine, **kwargs)
 
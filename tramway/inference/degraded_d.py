@@ -19,15 +19,19 @@ import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
 from collections import OrderedDict
+from functools import partial
 
 
+# unlike the other degraded modes, degraded.d does not declare 'individual' cell sampling:
+# the cells are passed all at once to infer_D, so that batch_infer_D can solve them together;
+# `worker_count` applies to the cells that are processed with the scalar procedure
 setup = {'name':    'degraded.d',
         'provides': 'd',
         'arguments': OrderedDict((
         ('localization_error',  ('-e', dict(type=float, help='localization precision (see also sigma; default is 0.03)'))),
         ('jeffreys_prior',      ('-j', dict(action='store_true', help="Jeffreys' prior"))),
-        ('min_diffusivity',     dict(type=float, help='minimum diffusivity value allowed')))),
-        'cell_sampling':    'individual'}
+        ('min_diffusivity',     dict(type=float, help='minimum diffusivity value allowed')),
+        ('worker_count',        ('-w', dict(type=int, help='number of parallel processes to spawn')))))}
 
 
 def d_neg_posterior(diffusivity, cell, sigma2, jeffreys_prior, dt_mean, \
@@ -56,26 +60,152 @@ def d_neg_posterior(diffusivity, cell, sigma2, jeffreys_prior, dt_mean, \
     if diffusivity < min_diffusivity:# and not np.isclose(diffusivity, min_diffusivity):
         warn(DiffusivityWarning(diffusivity, min_diffusivity))
     noise_dt = sigma2
-    if cell.cache is None:
-        cell.cache = np.sum(cell.dr * cell.dr, axis=1) # dx**2 + dy**2 + ..
+    dr2 = cell.cached('dr2', lambda: np.sum(cell.dr * cell.dr, axis=1), ('dr',)) # dx**2 + dy**2 + ..
     n = len(cell) # number of translocations
     D_dt = 4. * (diffusivity * cell.dt + noise_dt) # 4*(D+Dnoise)*dt
     if np.any(D_dt <= 0):# or np.any(np.isclose(D_dt, 0)):
         raise RuntimeError('negative diffusion')
     d_neg_posterior = n * log(pi) + np.sum(np.log(D_dt)) # sum(log(4*pi*Dtot*dt))
-    d_neg_posterior += np.sum(cell.cache / D_dt) # sum((dx**2+dy**2+..)/(4*Dtot*dt))
+    d_neg_posterior += np.sum(dr2 / D_dt) # sum((dx**2+dy**2+..)/(4*Dtot*dt))
     if jeffreys_prior:
         d_neg_posterior += 2. * log(diffusivity * dt_mean + sigma2)
     return d_neg_posterior
 
 
-def infer_D(cells, localization_error=None, jeffreys_prior=False, min_diffusivity=None, **kwargs):
+def batch_infer_D(cells, sigma2, min_diffusivity=None, max_iter=100, xtol=1e-10):
+    """
+    Minimize :func:`d_neg_posterior` without Jeffreys' prior in all the cells at once.
+
+    The cells are processed together as a single array program, with segment reductions
+    over the squared displacements and time deltas of the individual cells.
+    In each cell, a safeguarded Newton method looks for the root of the derivative of the
+    negative posterior; a bisection step is taken instead whenever the Newton step leaves
+    the bracket of the root.
+
+    Arguments:
+
+        cells (list): sequence of non-empty :class:`~tramway.inference.base.Translocations`.
+
+        sigma2 (float): localization error (variance).
+
+        min_diffusivity (float or bool): lower bound on the diffusivity;
+            see also :func:`infer_D`.
+
+        max_iter (int): maximum number of iterations.
+
+        xtol (float): relative tolerance on the diffusivity values.
+
+    Returns:
+
+        tuple: diffusivity values (:class:`~numpy.ndarray`) and
+            boolean mask (:class:`~numpy.ndarray`) of the cells the solver converged in.
+
+    """
+    cell_count = len(cells)
+    if cell_count == 0:
+        return np.zeros(0), np.zeros(0, dtype=bool)
+    for cell in cells:
+        if not bool(cell):
+            raise ValueError('empty cell')
+        if cell.dr.shape[1] == 0:
+            raise ValueError('translocation array has no column')
+        if cell.dt.shape[1:]:
+            raise ValueError('time deltas are structured in multiple dimensions')
+    n = np.array([ len(cell.dt) for cell in cells ])
+    start = np.r_[0, np.cumsum(n[:-1])]
+    cell_ids = np.repeat(np.arange(cell_count), n)
+    dr = np.concatenate([ cell.dr for cell in cells ])
+    dt = np.concatenate([ cell.dt for cell in cells ])
+    # ensure that translocations are properly oriented in time
+    if not np.all(0 < dt):
+        warn('translocation dts are not all positive', RuntimeWarning)
+        for j in np.unique(cell_ids[dt < 0]):
+            cell = cells[j]
+            cell.dr[cell.dt < 0] *= -1.
+            cell.dt[cell.dt < 0] *= -1.
+            cell.clear_cache('dr', 'dt')
+        dt = np.abs(dt)
+    dr2 = np.sum(dr * dr, axis=1) # dx**2 + dy**2 + ..
+    # bracket the root of the derivative
+    lower = (1e-16 - sigma2) / np.maximum.reduceat(dt, start) # D_dt > 0
+    if min_diffusivity is not None and min_diffusivity is not False:
+        lower = np.maximum(lower, min_diffusivity)
+    upper = np.maximum(np.maximum.reduceat(dr2 / (4. * dt), start), lower) + 1e-16
+    # initial diffusivity values as in the single-cell procedure
+    D = np.add.reduceat(dr2, start) / (2. * dr.shape[1] * np.add.reduceat(dt, start))
+    D = np.clip(D, lower, upper)
+    # the iterations are performed on the cells that have not converged yet;
+    # `active`, `start` and the translocation arrays are shrunk accordingly
+    active = np.arange(cell_count)
+    def derivatives(D):
+        D_dt = np.repeat(D, n) * dt + sigma2 # D_dt/4 with the notations of `d_neg_posterior`
+        u = dt / D_dt
+        v = dr2 * u / (4. * D_dt)
+        return np.add.reduceat(u - v, start), np.add.reduceat(u * (2. * v - u), start)
+    def shrink(keep, active, n, start, dt, dr2):
+        if np.all(keep):
+            return active, n, start, dt, dr2
+        rows = np.repeat(keep, n)
+        n = n[keep]
+        start = np.r_[0, np.cumsum(n[:-1])].astype(int)
+        return active[keep], n, start, dt[rows], dr2[rows]
+    # the minimum is at the lower bound wherever the derivative is positive
+    g, _ = derivatives(lower)
+    converged = 0 <= g
+    D[converged] = lower[converged]
+    active, n, start, dt, dr2 = shrink(~converged, active, n, start, dt, dr2)
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+        _D, _lower, _upper = D[active], lower[active], upper[active]
+        g, h = derivatives(_D)
+        below = g < 0
+        _lower[below] = _D[below]
+        _upper[~below] = _D[~below]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            D_new = _D - g / h
+        bisect = ~((0 < h) & (_lower < D_new) & (D_new < _upper))
+        D_new[bisect] = .5 * (_lower[bisect] + _upper[bisect])
+        done = (np.abs(D_new - _D) <= xtol * np.abs(D_new)) | (g == 0) \
+                | (_upper - _lower <= xtol * np.abs(D_new))
+        D[active], lower[active], upper[active] = D_new, _lower, _upper
+        converged[active] = done
+        active, n, start, dt, dr2 = shrink(~done, active, n, start, dt, dr2)
+    return D, converged
+
+
+# arguments to :func:`~scipy.optimize.minimize` that customize the scalar procedure
+_minimize_options = ('method', 'jac', 'hess', 'hessp', 'bounds', 'constraints', 'tol',
+        'callback', 'options')
+
+def infer_D(cells, localization_error=None, jeffreys_prior=False, min_diffusivity=None,
+        worker_count=None, chunksize=None, progress=None, **kwargs):
+    """
+    Without Jeffreys' prior and custom :func:`~scipy.optimize.minimize` options, the cells of
+    a :class:`~tramway.inference.base.Distributed` are solved together with
+    :func:`batch_infer_D`.
+    Otherwise, and for the cells the batch solver does not converge in, the diffusivity is
+    found with :func:`~scipy.optimize.minimize` in each cell, in parallel (see also
+    :func:`~tramway.inference.base.map_cells`).
+    """
     if isinstance(cells, Distributed): # multiple cells
         localization_error = cells.get_localization_error(kwargs, 0.03, True, \
                 localization_error=localization_error)
-        args = (localization_error, jeffreys_prior, min_diffusivity)
-        inferred = { i: infer_D(c, *args, **kwargs) for i, c in cells.items() }
-        inferred = pd.DataFrame({'diffusivity': pd.Series(inferred)})
+        index = list(cells.keys())
+        inferred = np.full(len(index), np.nan)
+        if jeffreys_prior or any( option in kwargs for option in _minimize_options ):
+            # the optimization procedure is customized; fall back to scalar minimization
+            remaining = np.ones(len(index), dtype=bool)
+        else:
+            inferred, converged = batch_infer_D([ cells[i] for i in index ],
+                    localization_error, min_diffusivity)
+            remaining = ~converged
+        if np.any(remaining):
+            args = (localization_error, jeffreys_prior, min_diffusivity)
+            inferred[remaining] = map_cells(partial(_infer_D, args, kwargs),
+                    [ cells[i] for i, r in zip(index, remaining) if r ],
+                    worker_count=worker_count, chunksize=chunksize, progress=progress)
+        inferred = pd.DataFrame({'diffusivity': inferred}, index=index)
         return inferred
     else: # single cell
         cell = cells
@@ -91,11 +221,11 @@ def infer_D(cells, localization_error=None, jeffreys_prior=False, min_diffusivit
             warn('translocation dts are not all positive', RuntimeWarning)
             cell.dr[cell.dt < 0] *= -1.
             cell.dt[cell.dt < 0] *= -1.
+            cell.clear_cache('dr', 'dt')
         #assert not np.isclose(np.mean(cell.dt), 0)
-        # initialize the diffusivity value and cell cache
-        dt_mean = np.mean(cell.dt)
+        # initialize the diffusivity value
+        dt_mean = cell.cached('dt_mean', lambda: np.mean(cell.dt), ('dt',))
         D_initial = np.mean(cell.dr * cell.dr) / (2. * dt_mean)
-        cell.cache = None # clear the cache (optional, since `run` also clears it)
         # parametrize the optimization procedure
         if min_diffusivity is not False:
             if min_diffusivity is None:
@@ -109,3 +239,7 @@ def infer_D(cells, localization_error=None, jeffreys_prior=False, min_diffusivit
         # return the resulting optimal diffusivity value
         return result.x[0]
 
+
+
+def _infer_D(args, kwargs, cell):
+    return infer_D(cell, *args, **kwargs)
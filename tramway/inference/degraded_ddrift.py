@@ -78,8 +78,9 @@ def infer_DD(cells, localization_error=None, jeffreys_prior=False, min_diffusivi
             warn('translocation dts are non-positive', RuntimeWarning)
             cell.dr[cell.dt < 0] *= -1.
             cell.dt[cell.dt < 0] *= -1.
+            cell.clear_cache('dr', 'dt')
         #
-        dt_mean = np.mean(cell.dt)
+        dt_mean = cell.cached('dt_mean', lambda: np.mean(cell.dt), ('dt',))
         D_initial = np.mean(cell.dr * cell.dr) / (2. * dt_mean)
         initial_drift = np.zeros(cell.dim, dtype=D_initial.dtype)
         dd = ChainArray('D', D_initial, 'drift', initial_drift)
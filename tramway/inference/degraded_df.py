@@ -116,7 +116,7 @@ def infer_DF(cells, localization_error=None, jeffreys_prior=False, min_diffusivi
         return inferred
     else: # single cell
         cell = cells
-        dt_mean = np.mean(cell.dt)
+        dt_mean = cell.cached('dt_mean', lambda: np.mean(cell.dt), ('dt',))
         D_initial = np.mean(cell.dr * cell.dr) / (2. * dt_mean)
         F_initial = np.zeros(cell.dim, dtype=D_initial.dtype)
         df = ChainArray('D', D_initial, 'F', F_initial)
@@ -23,12 +23,14 @@ setup['infer'] = 'infer_DF'
 
 
 def infer_DF(cells, diffusivity_prior=None, force_prior=None, jeffreys_prior=False,
-        min_diffusivity=None, max_iter=None, epsilon=None, rgrad=None, **kwargs):
+        min_diffusivity=None, max_iter=None, epsilon=None, rgrad=None,
+        posterior_gradient=None, posterior_engine=None, **kwargs):
 
     if diffusivity_prior is None and force_prior is None:
         return degraded_df.infer_DF(cells, jeffreys_prior=jeffreys_prior,
                 min_diffusivity=min_diffusivity, **kwargs)
     else:
         return standard_df.infer_smooth_DF(cells, diffusivity_prior, force_prior, None,
-                jeffreys_prior, min_diffusivity, max_iter, epsilon, rgrad, **kwargs)
+                jeffreys_prior, min_diffusivity, max_iter, epsilon, rgrad,
+                posterior_gradient=posterior_gradient, posterior_engine=posterior_engine, **kwargs)
 
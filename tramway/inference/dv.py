@@ -15,12 +15,14 @@
 from tramway.core import ChainArray
 from .base import *
 from .gradient import *
+from .flat import *
 from warnings import warn
 from math import pi, log
 import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
 from collections import OrderedDict
+from functools import partial
 import time
 
 
@@ -35,6 +37,8 @@ setup = {'arguments': OrderedDict((
                     dict(action='store_true', help='InferenceMAP compatible'))),
         ('rgrad',       dict(help="alternative gradient for the regularization; can be 'delta0' or 'delta1'")),
         ('export_centers',      dict(action='store_true')),
+        ('posterior_gradient',  dict(help="gradient of the posterior passed to the minimizer; can be 'analytic' (default) or 'numeric'")),
+        ('posterior_engine',    dict(help="implementation of the posterior; can be 'flat' (default; vectorized) or 'loop' (cell-wise)")),
         ('verbose',         ()))),
     'cell_sampling': 'connected'}
 setup_with_grad_arguments(setup)
@@ -277,10 +281,172 @@ def dv_neg_posterior1(x, dv, cells, sigma2, jeffreys_prior, dt_mean, \
     return result - y0
 
 
+def dv_neg_posterior_grad(x, dv, cells, sigma2, jeffreys_prior, dt_mean, \
+        index, reverse_index, grad_kwargs, y0, verbose, posteriors, \
+        grad_operator=None, prior_operator=None, prior_weights=None):
+    """
+    Gradient of :func:`dv_neg_posterior` and :func:`dv_neg_posterior1`.
+
+    `grad_operator` represents :meth:`~tramway.inference.base.Distributed.grad` and
+    `prior_operator` represents the operator involved in the smoothing priors
+    (either :meth:`~tramway.inference.base.Distributed.grad` or
+    :meth:`~tramway.inference.base.Distributed.local_variation`), as returned by
+    :meth:`~tramway.inference.base.Distributed.linear_operator`.
+    `prior_weights` is returned by :func:`~tramway.inference.gradient.grad_sum_weights`.
+    """
+    # extract `D` and `V`
+    dv.update(x)
+    D = dv.D
+    V = dv.V
+    grad = np.zeros(x.size, dtype=float)
+    grad_D, grad_V = dv.get(grad, 'D'), dv.get(grad, 'V') # views
+    noise_dt = sigma2
+
+    # spatial gradient of the potential energy; NaN for the cells with no gradient
+    gradV = grad_operator.per_cell(V, cells.dim)
+    grad_gradV = np.zeros_like(gradV)
+    ok = np.zeros(len(index), dtype=bool)
+
+    # for all cell
+    for j, i in enumerate(index):
+        cell = cells[i]
+        n = len(cell) # number of translocations
+
+        if not grad_operator.defined[j]:
+            continue
+
+        # various posterior terms
+        D_dt = D[j] * cell.dt
+        denominator = 4. * (D_dt + noise_dt)
+        dr_minus_drift = cell.dr + np.outer(D_dt, gradV[j])
+        ndsd = np.sum(dr_minus_drift * dr_minus_drift, axis=1)
+        res = n * log(pi) + np.sum(np.log(denominator)) + np.sum(ndsd / denominator)
+        if np.isnan(res):
+            continue
+        ok[j] = True
+        grad_D[j] = np.sum(cell.dt * (4. * (1. - ndsd / denominator) \
+                + 2. * np.dot(dr_minus_drift, gradV[j])) / denominator)
+        grad_gradV[j] = 2. * np.dot(D_dt / denominator, dr_minus_drift)
+    grad_operator.per_cell_transpose(grad_gradV, grad_V)
+
+    # priors
+    include = ok if dv.prior_include is None else ok & dv.prior_include
+    if dv._potential_prior:
+        prior_operator.penalty_grad(V, dv._potential_prior * prior_weights * include, grad_V)
+    if dv._diffusivity_prior:
+        prior_operator.penalty_grad(D, dv._diffusivity_prior * prior_weights * include, grad_D)
+    if jeffreys_prior:
+        grad_D += 2. * (dt_mean / (D * dt_mean + sigma2) - 1. / D)
+
+    return grad
+
+
+def dv_neg_posterior_flat(x, dv, cells, sigma2, jeffreys_prior, dt_mean, \
+        index, reverse_index, grad_kwargs, y0, verbose, posteriors, \
+        flat=None, grad_operator=None, prior_operator=None, prior_weights=None):
+    """
+    Vectorized implementation of :func:`dv_neg_posterior` and :func:`dv_neg_posterior1`.
+
+    The translocations are read from `flat` (:class:`~tramway.inference.flat.FlatTranslocations`).
+    `grad_operator`, `prior_operator` and `prior_weights` are described in :func:`dv_neg_posterior_grad`.
+    """
+    if verbose:
+        t = time.time()
+
+    # extract `D` and `V`
+    dv.update(x)
+    D = dv.D
+    V = dv.V
+    #
+
+    if dv.minimum_diffusivity is not None:
+        observed_min = np.min(D)
+        if observed_min < dv.minimum_diffusivity and \
+                not np.isclose(observed_min, dv.minimum_diffusivity):
+            warn(DiffusivityWarning(observed_min, dv.minimum_diffusivity))
+    noise_dt = sigma2
+
+    # spatial gradient of the potential energy; NaN for the cells with no gradient
+    gradV = grad_operator.per_cell(V, flat.dim)
+
+    # all the translocations at once
+    D_dt = flat.expand(D) * flat.dt
+    denominator = 4. * (D_dt + noise_dt)
+    dr_minus_drift = flat.dr + D_dt[:,np.newaxis] * flat.expand(gradV)
+    # non-directional squared displacement
+    ndsd = np.sum(dr_minus_drift * dr_minus_drift, axis=1)
+    res = flat.count * log(pi) + flat.sum(np.log(denominator) + ndsd / denominator)
+    # cells with undefined terms are ignored, including their priors
+    ok = ~np.isnan(res)
+    raw_posterior = np.sum(res[ok])
+
+    # priors
+    priors = 0.
+    include = ok if dv.prior_include is None else ok & dv.prior_include
+    if dv._potential_prior:
+        priors += dv._potential_prior * prior_operator.penalty(V, prior_weights * include)
+    if dv._diffusivity_prior:
+        priors += dv._diffusivity_prior * prior_operator.penalty(D, prior_weights * include)
+    if jeffreys_prior:
+        priors += 2. * np.sum(np.log(D * dt_mean + sigma2) - np.log(D))
+
+    result = raw_posterior + priors
+    posteriors.append([raw_posterior, result])
+
+    if verbose:
+        print('objective: {}\t time: {}ms'.format(result, int(round((time.time() - t) * 1e3))))
+
+    return result - y0
+
+
+def dv_neg_posterior_flat_grad(x, dv, cells, sigma2, jeffreys_prior, dt_mean, \
+        index, reverse_index, grad_kwargs, y0, verbose, posteriors, \
+        flat=None, grad_operator=None, prior_operator=None, prior_weights=None):
+    """
+    Gradient of :func:`dv_neg_posterior_flat`.
+    """
+    # extract `D` and `V`
+    dv.update(x)
+    D = dv.D
+    V = dv.V
+    grad = np.zeros(x.size, dtype=float)
+    grad_D, grad_V = dv.get(grad, 'D'), dv.get(grad, 'V') # views
+    noise_dt = sigma2
+
+    gradV = grad_operator.per_cell(V, flat.dim)
+
+    # all the translocations at once
+    D_dt = flat.expand(D) * flat.dt
+    denominator = 4. * (D_dt + noise_dt)
+    _gradV = flat.expand(gradV)
+    dr_minus_drift = flat.dr + D_dt[:,np.newaxis] * _gradV
+    ndsd = np.sum(dr_minus_drift * dr_minus_drift, axis=1)
+    res = flat.count * log(pi) + flat.sum(np.log(denominator) + ndsd / denominator)
+    ok = ~np.isnan(res)
+
+    grad_D[ok] = flat.sum(flat.dt * (4. * (1. - ndsd / denominator) \
+            + 2. * np.sum(dr_minus_drift * _gradV, axis=1)) / denominator)[ok]
+    grad_gradV = 2. * flat.sum((D_dt / denominator)[:,np.newaxis] * dr_minus_drift)
+    grad_gradV[~ok] = 0.
+    grad_operator.per_cell_transpose(grad_gradV, grad_V)
+
+    # priors
+    include = ok if dv.prior_include is None else ok & dv.prior_include
+    if dv._potential_prior:
+        prior_operator.penalty_grad(V, dv._potential_prior * prior_weights * include, grad_V)
+    if dv._diffusivity_prior:
+        prior_operator.penalty_grad(D, dv._diffusivity_prior * prior_weights * include, grad_D)
+    if jeffreys_prior:
+        grad_D += 2. * (dt_mean / (D * dt_mean + sigma2) - 1. / D)
+
+    return grad
+
+
 def inferDV(cells, diffusivity_prior=None, potential_prior=None, \
     jeffreys_prior=False, min_diffusivity=None, max_iter=None, epsilon=None, \
     export_centers=False, verbose=True, compatibility=False, \
-    D0=None, V0=None, rgrad=None, **kwargs):
+    D0=None, V0=None, rgrad=None, frozen=None, \
+    posterior_gradient='analytic', posterior_engine='flat', **kwargs):
 
     localization_error = cells.get_localization_error(kwargs, 0.03, True)
 
@@ -289,31 +455,19 @@ def inferDV(cells, diffusivity_prior=None, potential_prior=None, \
         smooth_infer_init(cells, min_diffusivity=min_diffusivity, jeffreys_prior=jeffreys_prior,
         sigma2=localization_error)
     # V initial values
-    if V0 is None:
-        try:
-            if compatibility:
-                raise Exception # skip to the except block
-            volume = [ cells[i].volume for i in index ]
-        except:
-            V_initial = -np.log(n / np.max(n))
-        else:
-            density = n / np.array([ np.inf if v is None else v for v in volume ])
-            density[density == 0] = np.min(density[0 < density])
-            V_initial = np.log(np.max(density)) - np.log(density)
+    try:
+        if compatibility:
+            raise Exception # skip to the except block
+        volume = [ cells[i].volume for i in index ]
+    except:
+        V_initial = -np.log(n / np.max(n))
     else:
-        if np.isscalar(V0):
-            V_initial = np.full(D_initial.size, V0)
-        elif V0.size == D_initial.size:
-            V_initial = V0
-        else:
-            raise ValueError('wrong size for V0')
-    if D0 is not None:
-        if np.isscalar(D0):
-            D_initial[...] = D0
-        elif D0.size == D_initial.size:
-            D_initial = D0
-        else:
-            raise ValueError('wrong size for D0')
+        density = n / np.array([ np.inf if v is None else v for v in volume ])
+        density[density == 0] = np.min(density[0 < density])
+        V_initial = np.log(np.max(density)) - np.log(density)
+    # user-supplied initial values, possibly partial (e.g. warm start)
+    D_initial = initial_values(D0, index, D_initial, 'D0')
+    V_initial = initial_values(V0, index, V_initial, 'V0')
 
     dv = DV(D_initial, V_initial, diffusivity_prior, potential_prior, min_diffusivity)
     posteriors = []
@@ -334,6 +488,8 @@ def inferDV(cells, diffusivity_prior=None, potential_prior=None, \
         V_bounds = [(None, None)] * V_initial.size
         bounds = D_bounds + V_bounds
         options = dict(default_lBFGSb_options)
+    # cells with fixed parameters (e.g. halo cells in domain decomposition)
+    bounds = frozen_bounds(bounds, frozen, index, D_initial, V_initial)
     options.update(kwargs.pop('options', {}))
     options.update(**kwargs) # for backward compatibility
     if max_iter:
@@ -353,6 +509,32 @@ def inferDV(cells, diffusivity_prior=None, potential_prior=None, \
             warn('unsupported rgrad: {}'.format(rgrad), RuntimeWarning)
         fun = dv_neg_posterior
 
+    # explicit spatial gradient and smoothing priors
+    grad_operator = cells.linear_operator('grad', index, reverse_index, **grad_kwargs)
+    if fun is dv_neg_posterior1:
+        prior_operator = cells.linear_operator('local_variation', index, reverse_index,
+                **grad_kwargs)
+    else:
+        prior_operator = grad_operator
+    prior_weights = grad_sum_weights(cells, index, reverse_index)
+
+    # posterior and gradient implementations
+    if posterior_engine in (None, 'flat'):
+        flat = FlatTranslocations(cells, index)
+        fun = partial(dv_neg_posterior_flat, flat=flat, grad_operator=grad_operator,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+        jac = partial(dv_neg_posterior_flat_grad, flat=flat, grad_operator=grad_operator,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+    elif posterior_engine == 'loop':
+        jac = partial(dv_neg_posterior_grad, grad_operator=grad_operator,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+    else:
+        raise ValueError("posterior_engine should be either 'flat' or 'loop'")
+    if posterior_gradient in (None, 'analytic'):
+        _kwargs['jac'] = jac
+    elif posterior_gradient != 'numeric':
+        raise ValueError("posterior_gradient should be either 'analytic' or 'numeric'")
+
     # posterior function input arguments
     args = (dv, cells, localization_error, jeffreys_prior, dt_mean,
             index, reverse_index, grad_kwargs)
@@ -374,7 +556,7 @@ def inferDV(cells, diffusivity_prior=None, potential_prior=None, \
     # collect the result
     dv.update(y)
     D, V = dv.D, dv.V
-    if np.any(V < 0):
+    if frozen is None and np.any(V < 0):
         V -= np.min(V)
     DVF = pd.DataFrame(np.stack((D, V), axis=1), index=index, \
         columns=[ 'diffusivity', 'potential'])
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2019, Institut Pasteur
+#   Contributor: François Laurent
+
+# This file is part of the TRamWAy software available at
+# "https://github.com/DecBayComp/TRamWAy" and is distributed under
+# the terms of the CeCILL license as circulated at the following URL
+# "http://www.cecill.info/licenses.en.html".
+
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+import numpy as np
+
+
+class FlatTranslocations(object):
+    """
+    Translocations of a series of cells, concatenated in contiguous arrays.
+
+    This layout is built once per inference and lets the posteriors evaluate all the
+    cell-wise likelihood terms in a few array operations, with segment reductions
+    instead of a Python loop over the cells.
+
+    Attributes:
+
+        dr (numpy.ndarray):
+            translocation displacements, as a *N x D* matrix.
+
+        dt (numpy.ndarray):
+            translocation durations, as a vector of size *N*.
+
+        dr2 (numpy.ndarray):
+            squared norm of the displacements, as a vector of size *N*.
+
+        cell_id (numpy.ndarray):
+            position in `index` of the cell each translocation belongs to.
+
+        count (numpy.ndarray):
+            number of translocations in each cell, as a vector of the same size as `index`.
+
+    """
+    __slots__ = ('dr', 'dt', 'dr2', 'cell_id', 'count')
+
+    def __init__(self, cells, index):
+        dr, dt = [], []
+        for i in index:
+            cell = cells[i]
+            dr.append(cell.dr)
+            dt.append(cell.dt)
+        self.count = np.array([ _dt.size for _dt in dt ], dtype=int)
+        self.cell_id = np.repeat(np.arange(len(dt)), self.count)
+        self.dr = np.concatenate(dr, axis=0)
+        self.dt = np.concatenate(dt)
+        self.dr2 = np.sum(self.dr * self.dr, axis=1)
+
+    @property
+    def cell_count(self):
+        return self.count.size
+
+    @property
+    def dim(self):
+        return self.dr.shape[1]
+
+    def sum(self, x):
+        """
+        Cell-wise sums of translocation-wise values.
+
+        Arguments:
+
+            x (numpy.ndarray):
+                vector of size *N* or *N x K* matrix.
+
+        Returns:
+
+            numpy.ndarray: vector of size *C* or *C x K* matrix, with *C* the number of cells.
+        """
+        if x.shape[1:]:
+            return np.stack([ self.sum(_x) for _x in x.T ], axis=1)
+        return np.bincount(self.cell_id, weights=x, minlength=self.cell_count)
+
+    def expand(self, X):
+        """
+        Translocation-wise copy of cell-wise values.
+
+        Arguments:
+
+            X (numpy.ndarray):
+                vector of size *C* or *C x K* matrix, with *C* the number of cells.
+
+        Returns:
+
+            numpy.ndarray: vector of size *N* or *N x K* matrix.
+        """
+        return X[self.cell_id]
+
+
+__all__ = ['FlatTranslocations']
+
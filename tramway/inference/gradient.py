@@ -15,6 +15,7 @@
 import math
 import numpy as np
 import pandas as pd
+import scipy.sparse as sparse
 from numpy.polynomial import polynomial as poly
 from collections import OrderedDict
 
@@ -729,6 +730,344 @@ def _vander(x, y):
     return b + 2. * a * x[0]
 
 
+def local_linear_forms(cells, operator, index, index_map=None, neighbours=None, form=None, **kwargs):
+    """
+    Explicit local matrices for a linear spatial operator.
+
+    All the operators in this module (:func:`grad1`, :func:`gradn`, :func:`delta0`,
+    :func:`delta1`) are linear in the measurement vector, and their value at a cell depends
+    only on the cell itself and its neighbours.
+    As a consequence, ``operator(i, X, index_map)`` can be written ``A_i . X[cols_i]``
+    with :math:`A_i` a small dense matrix.
+
+    If `form` is defined, the :math:`A_i` matrices are built directly from the terms
+    the operator caches at each cell (see :data:`linear_forms`).
+    Otherwise, they are recovered by evaluating the operator on the canonical basis vectors.
+
+    Arguments:
+
+        cells (tramway.inference.base.Distributed):
+            distributed cells.
+
+        operator (callable):
+            bound method with signature ``(i, X, index_map, **kwargs)``,
+            typically :meth:`~tramway.inference.base.Distributed.grad` or
+            :meth:`~tramway.inference.base.Distributed.local_variation`.
+
+        index (sequence):
+            cell indices, in the order of the elements of X.
+
+        index_map (numpy.ndarray):
+            index map that converts cell indices to indices in X.
+
+        neighbours (callable):
+            takes a cell index and returns the indices of the cells the operator may
+            recruit; default is :meth:`~tramway.inference.base.Distributed.neighbours`.
+
+        form (callable):
+            takes the cells, a cell index and the value of `operator` at the null vector,
+            and returns the ``(cols, A)`` pair for that cell; the operator is called
+            beforehand so that its cache is filled in.
+
+    Returns:
+
+        list:
+            for each cell in `index`, either a ``(cols, A)`` pair such that
+            ``operator(i, X, index_map).ravel() == A.dot(X[cols])``, or ``None`` if
+            `operator` returns ``None``.
+
+    """
+    if neighbours is None:
+        neighbours = cells.neighbours
+    if index_map is None:
+        X = np.zeros(cells.adjacency.shape[0], dtype=float)
+    else:
+        X = np.zeros(len(index), dtype=float)
+    forms = []
+    if form is not None:
+        for i in index:
+            y = operator(i, X, index_map, **kwargs)
+            forms.append(None if y is None else form(cells, i, np.ravel(y)))
+        return forms
+    for i in index:
+        cols = np.r_[i, neighbours(i)]
+        if index_map is not None:
+            cols = index_map[cols]
+            cols = cols[0 <= cols]
+        A = None
+        for k, col in enumerate(cols):
+            X[col] = 1.
+            try:
+                y = operator(i, X, index_map, **kwargs)
+            finally:
+                X[col] = 0.
+            if y is None:
+                break
+            y = np.ravel(y)
+            if A is None:
+                A = np.empty((y.size, cols.size), dtype=X.dtype)
+            A[:,k] = y
+        forms.append(None if A is None else (cols, A))
+    return forms
+
+
+def _grad1_form(cells, i, y0):
+    # reads the `grad1` cache; y0 holds `na` at the undefined components
+    i, adjacent, X = cells[i].cache['grad1']
+    A = np.zeros((len(X), 1 + adjacent.size), dtype=float)
+    for j, (u, v, Xj) in enumerate(X):
+        if u is None:
+            if v is None:
+                A[j] = y0[j]
+            else:
+                A[j,0] = Xj
+                A[j,1:][v] = -Xj / np.sum(v)
+        elif v is None:
+            A[j,0] = Xj
+            A[j,1:][u] = -Xj / np.sum(u)
+        else:
+            # derivative at x0 of the Lagrange polynomials that interpolate (x0, xu, xv)
+            x0, xu, xv = Xj
+            A[j,0] = 1. / (x0 - xu) + 1. / (x0 - xv)
+            A[j,1:][u] = (x0 - xv) / ((xu - x0) * (xu - xv)) / np.sum(u)
+            A[j,1:][v] = (x0 - xu) / ((xv - x0) * (xv - xu)) / np.sum(v)
+    return np.r_[i, adjacent], A
+
+
+def _delta1_form(cells, i, y0):
+    # reads the `grad1` cache; rows are ordered as in the raveled *2 x D* output of delta1
+    i, adjacent, X = cells[i].cache['grad1']
+    dim = len(X)
+    A = np.zeros((2 * dim, 1 + adjacent.size), dtype=float)
+    below, above = A[:dim], A[dim:]
+    for j, (u, v, Xj) in enumerate(X):
+        if u is None:
+            if v is not None:
+                above[j,0] = Xj
+                above[j,1:][v] = -Xj / np.sum(v)
+        elif v is None:
+            below[j,0] = Xj
+            below[j,1:][u] = -Xj / np.sum(u)
+        else:
+            x0, xu, xv = Xj
+            below[j,0] = 1. / (x0 - xu)
+            below[j,1:][u] = -1. / (x0 - xu) / np.sum(u)
+            above[j,0] = 1. / (x0 - xv)
+            above[j,1:][v] = -1. / (x0 - xv) / np.sum(v)
+    return np.r_[i, adjacent], A
+
+
+def _delta0_form(cells, i, y0, scale=True):
+    # reads the `delta0` cache
+    i, adjacent, dx_norm = cells[i].cache['delta0']
+    w = 1. / dx_norm
+    if scale:
+        w /= np.sqrt(float(dx_norm.size))
+    A = np.zeros((dx_norm.size, 1 + dx_norm.size), dtype=float)
+    A[:,0] = -w
+    A[:,1:] = np.diag(w)
+    return np.r_[i, adjacent], A
+
+
+def _delta0_without_scaling_form(cells, i, y0):
+    return _delta0_form(cells, i, y0, False)
+
+
+def _gradn_form(cells, i, y0):
+    # reads the `poly` cache; gradn is D . pinv(V) . Y[local] with D the derivative of
+    # the interpolating polynomial at the cell center
+    V, local = cells[i].cache['poly']
+    p = V.shape[1]
+    D = _poly2_deriv_eval(np.eye(p), cells[i].center).reshape((-1, p))
+    # same cutoff as numpy.linalg.lstsq with rcond=None
+    pinvV = np.linalg.pinv(V, rcond=np.finfo(V.dtype).eps * max(V.shape))
+    return local, np.dot(D, pinvV)
+
+
+linear_forms = {
+        grad1: _grad1_form,
+        gradn: _gradn_form,
+        delta0: _delta0_form,
+        delta0_without_scaling: _delta0_without_scaling_form,
+        delta1: _delta1_form,
+        }
+"""
+Explicit local matrix builders (`form` argument of :func:`local_linear_forms`)
+for the linear operators of this module.
+"""
+
+
+def grad_sum_weights(cells, index, index_map=None):
+    """
+    Weights applied by :meth:`~tramway.inference.base.Distributed.grad_sum`,
+    assuming the mixing operator is a weighted sum of the elements of the local gradient.
+
+    Returns:
+
+        numpy.ndarray:
+            weight for each cell in `index`.
+    """
+    one = np.ones(1)
+    return np.array([ cells.grad_sum(i, one, index_map) for i in index ], dtype=float)
+
+
+class LocalLinearOperator(object):
+    """
+    Sparse matrix representation of a local linear operator evaluated at a series of cells.
+
+    The local matrices returned by :func:`local_linear_forms` are stacked in a single
+    CSR matrix :math:`G` with as many columns as cells, so that the operator is evaluated
+    at all the cells with a single product :math:`G.X`.
+    The quadratic smoothing priors become :math:`||G.X||^2_W` with :math:`W` the diagonal
+    matrix of the cell weights, and their gradient :math:`2 G^T W G X`.
+
+    Components that are undefined whatever the input vector (see argument `na` in
+    :func:`grad1`) are represented by empty rows flagged in `na_rows`.
+
+    Attributes:
+
+        matrix (scipy.sparse.csr_matrix):
+            stacked local matrices.
+
+        row_cell (numpy.ndarray):
+            position of the cell each row of `matrix` relates to.
+
+        defined (numpy.ndarray):
+            boolean vector with as many elements as cells; ``False`` where the local
+            operator returns ``None``.
+
+        na_rows (numpy.ndarray):
+            boolean vector with as many elements as rows in `matrix`.
+
+    """
+    __slots__ = ('matrix', 'row_cell', 'defined', 'na_rows', '_forms')
+
+    def __init__(self, forms, size=None):
+        if size is None:
+            size = len(forms)
+        self._forms = None
+        self.defined = np.array([ form is not None for form in forms ], dtype=bool)
+        data, rows, cols, row_cell = [], [], [], []
+        row_count = 0
+        for j, form in enumerate(forms):
+            if form is None:
+                continue
+            _cols, A = form
+            k, m = A.shape
+            data.append(A.ravel())
+            rows.append(np.repeat(np.arange(row_count, row_count + k), m))
+            cols.append(np.tile(_cols, k))
+            row_cell.append(np.full(k, j, dtype=int))
+            row_count += k
+        if row_count:
+            data, rows, cols = np.concatenate(data), np.concatenate(rows), np.concatenate(cols)
+            self.row_cell = np.concatenate(row_cell)
+        else:
+            data, rows, cols = np.zeros(0), np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+            self.row_cell = np.zeros(0, dtype=int)
+        na = np.isnan(data)
+        self.na_rows = np.zeros(row_count, dtype=bool)
+        self.na_rows[rows[na]] = True
+        data[na] = 0.
+        self.matrix = sparse.csr_matrix((data, (rows, cols)), shape=(row_count, size))
+        self.matrix.eliminate_zeros()
+
+    @property
+    def cell_count(self):
+        return self.defined.size
+
+    def dot(self, X):
+        """
+        Returns :math:`G.X`, with *NaN* for the undefined components.
+        """
+        Y = self.matrix.dot(X)
+        if np.any(self.na_rows):
+            Y[self.na_rows] = np.nan
+        return Y
+
+    def per_cell(self, X, width, na=np.nan):
+        """
+        Evaluates the operator at every cell, for operators that return `width` values at
+        every cell where they are defined (e.g. gradients).
+
+        Returns:
+
+            numpy.ndarray: matrix of size *cell_count x width*; `na` where the operator is not defined.
+        """
+        Y = np.full((self.cell_count, width), na, dtype=float)
+        Y[self.defined] = self.dot(X).reshape((-1, width))
+        return Y
+
+    def per_cell_transpose(self, Y, out=None):
+        """
+        Adjoint of :meth:`per_cell`; rows of `Y` at cells where the operator is not defined are ignored.
+        """
+        Y = Y[self.defined].ravel()
+        Y[self.na_rows] = 0.
+        if out is None:
+            return self.matrix.T.dot(Y)
+        out += self.matrix.T.dot(Y)
+        return out
+
+    def penalty(self, X, weights):
+        """
+        Penalty :math:`\\sum_i w_i || G_i X ||^2` with :math:`G_i` the block of rows related to cell *i*.
+
+        This is equivalent to summing ``w_i * cells.grad_sum(i, g * g)`` over the cells, with
+        ``g`` the value of the local operator at cell *i*, if `weights` are :func:`grad_sum_weights`.
+        Cells with zero weight are ignored.
+        """
+        w = weights[self.row_cell]
+        Y = self.dot(X)
+        nonzero = w != 0
+        return np.dot(w[nonzero], Y[nonzero] * Y[nonzero])
+
+    def penalty_grad(self, X, weights, out=None):
+        """
+        Gradient :math:`2 G^T W G X` of :meth:`penalty`.
+
+        If `out` is defined, the gradient is added to `out` inplace.
+        """
+        w = weights[self.row_cell]
+        Y = self.dot(X)
+        nonzero = w != 0
+        Y = np.where(nonzero, 2. * w * Y, 0.)
+        undefined = np.any(np.isnan(Y))
+        if undefined:
+            Y[self.na_rows] = 0.
+        grad = self.matrix.T.dot(Y)
+        if undefined:
+            grad[...] = np.nan
+        if out is None:
+            return grad
+        out += grad
+        return out
+
+    def forms(self):
+        """
+        Local matrices, in the format of :func:`local_linear_forms`, for the callers that
+        evaluate the operator one cell at a time.
+
+        The dense blocks are extracted from `matrix` once and then cached.
+        Rows flagged in `na_rows` are *NaN*; cells whose block does not depend on the input
+        vector are ``None``.
+        """
+        if self._forms is None:
+            forms = [None] * self.cell_count
+            bounds = np.searchsorted(self.row_cell, np.arange(self.cell_count + 1))
+            for j in np.flatnonzero(self.defined):
+                start, stop = bounds[j], bounds[j+1]
+                block = self.matrix[start:stop]
+                cols = np.unique(block.indices)
+                if cols.size == 0:
+                    continue
+                A = block[:, cols].toarray()
+                A[self.na_rows[start:stop]] = np.nan
+                forms[j] = (cols, A)
+            self._forms = forms
+        return self._forms
+
+
 def setup_with_grad_arguments(setup):
     """Add :meth:`~tramway.inference.base.Distributed.grad` related arguments to inference plugin setup.
 
@@ -802,5 +1141,6 @@ setup_with_grad_arguments(setup)
 
 
 __all__ = ['default_selection_angle', 'get_grad_kwargs', 'neighbours_per_axis', 'grad1', 'gradn',
-        'delta0', 'delta0_without_scaling', 'delta1', 'setup_with_grad_arguments', 'setup', 'gradient_map']
+        'delta0', 'delta0_without_scaling', 'delta1', 'setup_with_grad_arguments', 'setup', 'gradient_map',
+        'local_linear_forms', 'linear_forms', 'grad_sum_weights', 'LocalLinearOperator']
 
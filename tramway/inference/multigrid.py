@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2020, Institut Pasteur
+#   Contributor: François Laurent
+
+# This file is part of the TRamWAy software available at
+# "https://github.com/DecBayComp/TRamWAy" and is distributed under
+# the terms of the CeCILL license as circulated at the following URL
+# "http://www.cecill.info/licenses.en.html".
+
+# The fact that you are presently reading this means that you have had
+# knowledge of the CeCILL license and that you accept its terms.
+
+
+from .base import *
+from tramway.tessellation.base import Partition
+from tramway.tessellation.nesting import NestedTessellations
+import numpy as np
+import pandas as pd
+import scipy.spatial
+from collections import OrderedDict
+
+
+setup = {'name': 'multigrid',
+    'arguments': OrderedDict((
+        ('level_mode',      dict(help="inference mode at each level (default is 'stochastic.dv')")),
+        ('localization_error',  ('-e', dict(type=float, help='localization precision (see also sigma; default is 0.03)'))),
+        ('diffusivity_prior',   ('-d', dict(type=float, help='prior on the diffusivity'))),
+        ('potential_prior',     ('-v', dict(type=float, help='prior on the potential'))),
+        ('jeffreys_prior',      ('-j', dict(action='store_true', help="Jeffreys' prior"))),
+        ('min_diffusivity',     dict(type=float, help='minimum diffusivity value allowed')),
+        ('max_iter',        dict(type=int, help='maximum number of iterations')),
+        ('verbose',         ()))),
+    'input_type': 'Partition'}
+
+
+def parent_partition(cells):
+    """
+    Partition of the data at the parent level of a nested tessellation.
+
+    Arguments:
+
+        cells (Partition): partition with a
+            :class:`~tramway.tessellation.nesting.NestedTessellations` tessellation.
+
+    Returns:
+
+        tuple: parent :class:`~tramway.tessellation.base.Partition` and array of parent cell
+        indices, one for each cell of `cells`.
+
+    """
+    tessellation = cells.tessellation
+    if not isinstance(tessellation, NestedTessellations):
+        raise TypeError('not a nested tessellation')
+    parent = tessellation.parent
+    if isinstance(parent, Partition):
+        parent = parent.tessellation
+    coarse = Partition(cells.points, parent)
+    coarse.cell_index = parent.cell_index(cells.points, **tessellation.parent_index_arguments)
+    coarse.param = cells.param
+    parent_index = np.full(tessellation.cell_adjacency.shape[0], -1, dtype=int)
+    for u in tessellation.children:
+        parent_index[tessellation.child_cell_indices(u)] = u
+    return coarse, parent_index
+
+
+def nearest_parent(cells, coarse):
+    """
+    Parent cell of each cell of `cells`, as the cell of `coarse` with the nearest center.
+
+    Arguments:
+
+        cells (Partition): fine partition.
+
+        coarse (Partition): coarse partition.
+
+    Returns:
+
+        numpy.ndarray: parent cell index of each cell of `cells`.
+
+    """
+    _, parent_index = scipy.spatial.cKDTree(coarse.tessellation.cell_centers).query(
+            cells.tessellation.cell_centers)
+    return parent_index
+
+
+def prolongate(maps, parent_index):
+    """
+    Copy the values of the parent cells onto their children cells.
+
+    Arguments:
+
+        maps (pandas.DataFrame): maps indexed by parent cell index.
+
+        parent_index (numpy.ndarray): parent cell index of each child cell.
+
+    Returns:
+
+        pandas.DataFrame: maps indexed by child cell index.
+
+    """
+    return pd.DataFrame(maps.reindex(parent_index).values, columns=maps.columns)
+
+
+def _run(mode, partition, x0=None, **kwargs):
+    """
+    Distribute the data and run an inference plugin, as
+    :class:`~tramway.helper.inference.Infer` does with the default options.
+    """
+    from tramway.inference import plugins
+    setup, module = plugins[mode]
+    fun = getattr(module, setup['infer'])
+    if setup.get('input_type', '').lower().endswith('partition'):
+        raise ValueError("mode '{}' is not supported at the different levels".format(mode))
+    cells = distributed(partition)
+    if setup.get('cell_sampling', None) == 'connected':
+        cells = cells.group(connected=True)
+    if x0 is not None:
+        kwargs.update(initial_arguments(fun, x0, kwargs))
+    maps = cells.run(fun, **kwargs)
+    if isinstance(maps, tuple):
+        maps = maps[0]
+    return maps
+
+
+def infer_multigrid(cells, level_mode='stochastic.dv', max_iter=None, coarse=None, verbose=False,
+        **kwargs):
+    """
+    Coarse-to-fine inference over nested tessellations.
+
+    The maps are first inferred at the parent level of the
+    :class:`~tramway.tessellation.nesting.NestedTessellations`, recursively if the parent
+    tessellation is also nested.
+    The parent maps are then prolongated onto the children cells and serve as initial values
+    for the inference at the finest level, that runs to convergence, or `max_iter` iterations.
+
+    Alternatively, the coarse level can be explicitly defined as another partition of the same
+    data, in which case each fine cell is attached to the coarse cell with the nearest center.
+
+    Arguments:
+
+        cells (Partition): partition with a
+            :class:`~tramway.tessellation.nesting.NestedTessellations` tessellation,
+            unless `coarse` is defined.
+
+        level_mode (str): inference plugin at each level; it should admit initial values
+            `D0`, `V0` and/or `F0` (e.g. *stochastic.dv*, *dv*, *standard.d*, *standard.df*).
+
+        max_iter (int): maximum number of iterations at each level.
+
+        coarse (Partition): coarse level; default is the parent level of `cells`.
+
+        verbose (bool): verbose mode of the inference plugin at every level.
+
+    Other keyword arguments are passed to the inference plugin.
+
+    Returns:
+
+        pandas.DataFrame: maps at the finest level.
+
+    """
+    kwargs['verbose'] = verbose
+    if max_iter:
+        kwargs['max_iter'] = max_iter
+
+    if coarse is None:
+        coarse, parent_index = parent_partition(cells)
+    else:
+        parent_index = nearest_parent(cells, coarse)
+
+    if isinstance(coarse.tessellation, NestedTessellations):
+        coarse_maps = infer_multigrid(coarse, level_mode, **kwargs)
+    else:
+        coarse_maps = _run(level_mode, coarse, **kwargs)
+    x0 = prolongate(coarse_maps, parent_index)
+
+    return _run(level_mode, cells, x0, **kwargs)
+
+
+__all__ = ['setup', 'infer_multigrid', 'parent_partition', 'nearest_parent', 'prolongate']
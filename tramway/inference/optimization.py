@@ -19,6 +19,8 @@ from collections import namedtuple, defaultdict, deque
 import traceback
 from tramway.core import parallel
 import logging
+import json
+import os
 
 
 BFGSResult = namedtuple('BFGSResult', ('x', 'H', 'resolution', 'niter', 'f', 'df', 'projg', 'cumtime', 'err', 'diagnosis', 'ncalls'))
@@ -347,10 +349,13 @@ class SparseFunction(parallel.Workspace):
 
         ncalls (int): number of calls to `fun`.
 
+        jac (callable): local gradient function (takes the same input arguments
+            as `fun`); if `None`, the gradient is estimated with :func:`sparse_grad`.
+
     See also :func:`minimize_sparse_bfgs`.
     """
     def __init__(self, x, covariate, gradient_subspace, descent_subspace,
-            eps, fun, _sum, args, regul, bounds, h0):
+            eps, fun, _sum, args, regul, bounds, h0, jac=None):
         parallel.Workspace.__init__(self, x, *args)
         self.covariate = covariate
         self.gradient_subspace = gradient_subspace
@@ -363,6 +368,7 @@ class SparseFunction(parallel.Workspace):
         self.bounds = bounds
         self.h0 = h0
         self.ncalls = 0
+        self.jac = jac
 
     @property
     def x(self):
@@ -662,6 +668,11 @@ class InverseHessianBlock(LocalSubspaceProxy):
                 np.outer((proj + yHy) * sp, sp) - np.outer(Hy, sp) - np.outer(sp, Hy))
     def drop(self):
         raise NotImplementedError('abstract method')
+    def get_state(self):
+        """ Storable representation of the block (see :meth:`SBFGSScheduler.get_checkpoint`). """
+        return self.block
+    def set_state(self, state):
+        self.block = state
 class GradientDescent(InverseHessianBlock):
     """Does not use Cauchy points."""
     __slots__ = ()
@@ -671,6 +682,10 @@ class GradientDescent(InverseHessianBlock):
         pass
     def drop(self):
         pass
+    def get_state(self):
+        return None
+    def set_state(self, state):
+        pass
 class InverseHessianBlockView(InverseHessianBlock):
     __slots__ = ('fresh', 'slice')
     def __init__(self, component):
@@ -682,6 +697,11 @@ class InverseHessianBlockView(InverseHessianBlock):
             self.slice = np.ix_(self.gradient_subspace, self.gradient_subspace)
     def drop(self):
         self.fresh = True
+    def get_state(self):
+        # the global matrix is stored separately
+        return self.fresh
+    def set_state(self, state):
+        self.fresh = state
     @property
     def block(self):
         block = self.__global__.H
@@ -723,6 +743,11 @@ class LimitedMemoryInverseHessianBlock(InverseHessianBlock):
         self.drop()
     def drop(self):
         self.block = deque([], self.__global__.memory)
+    def get_state(self):
+        return [ list(pair) for pair in self.block ]
+    def set_state(self, state):
+        self.drop()
+        self.block.extend( Pair(*pair) for pair in state )
     def dot(self, g):
         if self.block:
             # `block` is nonempty
@@ -807,6 +832,10 @@ class Component(LocalSubspaceProxy, parallel.UpdateVehicle):
                 covariate = self.__global__.gradient_covariate
             except AttributeError:
                 covariate = self.covariate
+        jac = getattr(self.__global__, 'jac', None)
+        if jac is not None:
+            return local_grad_sum(jac, _x, covariate, subspace, self.__global__.args,
+                    self.__global__.regul)
         _total_g, _partial_g = sparse_grad(self.__global__.fun, _x, covariate,
                 subspace, self.__global__.args, self.__global__.sum, self.__global__.regul,
                 self.__global__.bounds, self.__global__.h0)
@@ -860,6 +889,22 @@ class Component(LocalSubspaceProxy, parallel.UpdateVehicle):
 parallel.abc.VehicleJobStep.register(Component)
 
 
+class ShuffledComponents(object):
+    """
+    Takes an iteration number and returns a component index.
+
+    The components are drawn in a random order that changes every epoch.
+    """
+    __slots__ = ('order',)
+    def __init__(self, m):
+        self.order = np.arange(m)
+    def __call__(self, k):
+        _i = k % self.order.size
+        if _i == 0:
+            np.random.shuffle(self.order)
+        return self.order[_i]
+
+
 def _fun_args(fun, x0, component, covariate, gradient_subspace, descent_subspace,
         args, bounds, _sum, gradient_sum, gradient_covariate):
     _all = None
@@ -872,16 +917,7 @@ def _fun_args(fun, x0, component, covariate, gradient_subspace, descent_subspace
             if component == 0:
                 component = lambda k: 0
             elif 0 < component:
-                m = component
-                def mk_component(m):
-                    components = np.arange(m)
-                    def _component(k):
-                        _i = k % m
-                        if _i == 0:
-                            np.random.shuffle(components)
-                        return components[_i]
-                    return _component
-                component = mk_component(m)
+                component = ShuffledComponents(component)
             else:
                 raise ValueError('wrong number of components')
         else:
@@ -969,7 +1005,8 @@ def minimize_sparse_bfgs1(fun, x0, component, covariate, gradient_subspace, desc
         ls_armijo_max=None, ls_wolfe=None, ls_failure_rate=.9, fix_ls=None, fix_ls_trigger=5,
         gradient_initial_step=1e-8, Component=Component,
         independent_components=False, newton=True, verbose=False, diagnosis=None,
-        returns=(), **kwargs):
+        returns=(), jac=None, telemetry=None, checkpoint=None, checkpoint_interval=1000,
+        resume_from=None, **kwargs):
     """
     Let the objective function :math:`f(x) = \sum_{i \in C} f_{i}(x) \forall x in \Theta`
     be a linear function of sparse components :math:`f_{i}` such that
@@ -1035,6 +1072,15 @@ def minimize_sparse_bfgs1(fun, x0, component, covariate, gradient_subspace, desc
         gradient_covariate (callable): takes a parameter index (`int`) and returns a sequence
             of the components affected by this parameter.
 
+        jac (callable): exact gradient of the local cost function;
+            takes the same input arguments as `fun` and returns either the gradient as a
+            `numpy.ndarray` of the size of the parameter vector, or a pair of arrays of
+            parameter indices (possibly repeated) and corresponding partial derivatives;
+            the local costs are assumed to be summed (see `gradient_sum`), and the
+            covariates to include all the components that depend on the gradient-active
+            parameters;
+            if `None`, the gradient is estimated by finite differences with :func:`sparse_grad`.
+
         memory (int): number of memorized pairs of `H` updates in quasi-Newton mode.
 
         eps (float): initial scaling of the descent direction.
@@ -1102,6 +1148,24 @@ def minimize_sparse_bfgs1(fun, x0, component, covariate, gradient_subspace, desc
             the L2-norm of the difference between this and the current parameter vector is evaluated
             and returned as attribute `err`; note that this computation may add quite some overhead.
 
+        telemetry (callable or str or file): function that takes a telemetry record (`dict`),
+            or path to or file object of a JSON-lines file the records are appended to;
+            a record is emitted for each completed iteration (see :class:`SBFGSScheduler`).
+
+        checkpoint (str): path to a .rwa file the state of the optimizer is periodically
+            saved into; the file is overwritten.
+
+        checkpoint_interval (int): number of iterations between two checkpoints;
+            a checkpoint is also saved on completion.
+
+        resume_from (str): path to a .rwa checkpoint file to resume the optimization from;
+            `max_iter` still refers to the total number of iterations;
+            without workers (``worker_count=0``), the resumed optimization behaves identically
+            to the uninterrupted one, given the same input arguments.
+
+    Other keyword arguments are passed to :class:`~tramway.core.parallel.Scheduler`,
+    e.g. `worker_count`, `shared_memory` and `backend`.
+
     Returns:
 
         BFGSResult: final parameter vector.
@@ -1123,7 +1187,7 @@ def minimize_sparse_bfgs1(fun, x0, component, covariate, gradient_subspace, desc
 
     # component
     __global__ = SparseFunction(x0, covariate, gradient_subspace, descent_subspace,
-            eps, fun, _sum, args, regul, bounds, gradient_initial_step)
+            eps, fun, _sum, args, regul, bounds, gradient_initial_step, jac)
     extend_global(__global__, independent_components, memory, newton, gradient_covariate)
     C = _defaultdict(Component, __global__)
 
@@ -1135,9 +1199,14 @@ def minimize_sparse_bfgs1(fun, x0, component, covariate, gradient_subspace, desc
             ls_failure_rate=ls_failure_rate, fix_ls=fix_ls, fix_ls_trigger=fix_ls_trigger,
             verbose=verbose, logger=logger, diagnosis=diagnosis,
             returns={'f', 'df', 'projg', 'err', 'ncalls', 'diagnosis'} if returns == 'all' else returns,
+            telemetry=telemetry if telemetry is None or callable(telemetry) else TelemetryWriter(telemetry),
+            checkpoint=checkpoint, checkpoint_interval=checkpoint_interval,
             **kwargs)
     sched.logger = logger
 
+    if resume_from:
+        sched.set_checkpoint(load_checkpoint(resume_from))
+
     if verbose:
         compact_logs = False
         if logger is module_logger:
@@ -1149,7 +1218,13 @@ def minimize_sparse_bfgs1(fun, x0, component, covariate, gradient_subspace, desc
         logger.debug('number of workers: {}'.format(sched.worker_count))
         t0 = time.time()
 
-    sched.run()
+    try:
+        sched.run()
+        if checkpoint:
+            sched.save_checkpoint()
+    finally:
+        if isinstance(sched.telemetry, TelemetryWriter):
+            sched.telemetry.close()
 
     try:
         resolution = sched.resolution
@@ -1194,11 +1269,79 @@ def minimize_sparse_bfgs1(fun, x0, component, covariate, gradient_subspace, desc
             ncalls     if ncalls     else None)
 
 
+class TelemetryWriter(object):
+    """
+    Appends telemetry records to a JSON-lines file, one record per line.
+
+    The file is flushed after each record so that it can be monitored while
+    the optimization is running.
+    """
+    __slots__ = ('_file', '_close')
+    def __init__(self, f):
+        if isinstance(f, str):
+            self._file = open(f, 'a')
+            self._close = True
+        else:
+            self._file = f
+            self._close = False
+    def __call__(self, record):
+        self._file.write(json.dumps(record, default=_jsonable) + '\n')
+        self._file.flush()
+    def close(self):
+        if self._close:
+            self._file.close()
+
+def _jsonable(obj):
+    try:
+        return obj.tolist() # numpy scalars and arrays
+    except AttributeError:
+        return str(obj)
+
+def load_checkpoint(path):
+    """
+    Load the optimizer state saved by :meth:`SBFGSScheduler.save_checkpoint`.
+    """
+    from rwa import HDF5Store
+    store = HDF5Store(path, 'r')
+    store.lazy = False
+    try:
+        return store.peek('checkpoint')
+    finally:
+        store.close()
+
+def _qsize(q):
+    try:
+        return q.qsize()
+    except (AttributeError, NotImplementedError): # not available on macOS
+        return None
+
+
 class SBFGSScheduler(parallel.Scheduler):
+    """
+    If `telemetry` is defined, it is called with a `dict` for each completed iteration,
+    with keys:
+
+    * *iter*, *component*: iteration number and component index,
+    * *worker*: worker index,
+    * *time*: wall time of the iteration in the worker, in seconds,
+    * *elapsed*: wall time since the beginning of the optimization, in seconds,
+    * *utilisation*: fraction of the elapsed time the worker spent on iterations,
+    * *ncalls*: number of calls to the local cost function,
+    * *f*, *df*, *dg*: local cost, cost decrease and curvature projection, if available,
+    * *ls_failure*: whether the line search failed,
+    * *ls_resolution*: line search outcome, e.g. 'Wolfe criterion met',
+    * *active*, *paused*: numbers of components being processed and paused,
+    * *pending_tasks*, *pending_results*: numbers of tasks waiting for a worker and
+      of results waiting for the scheduler, if available.
+
+    If `checkpoint` is defined, the state of the optimizer is saved every
+    `checkpoint_interval` iterations (see :meth:`get_checkpoint`).
+    """
     def __init__(self, __global__, C, component, worker_count=None,
             name=None, args=(), kwargs={}, daemon=None,
             max_iter=None, ftol=None, gtol=None, low_df_rate=None, low_dg_rate=None,
-            ls_failure_rate=None, fix_ls=None, fix_ls_trigger=None, returns={}, **_kwargs):
+            ls_failure_rate=None, fix_ls=None, fix_ls_trigger=None, returns={}, telemetry=None,
+            checkpoint=None, checkpoint_interval=None, **_kwargs):
         __global__.gtol = gtol
         parallel.Scheduler.__init__(self, __global__, C, worker_count=worker_count, iter_max=max_iter,
                 name=name, args=args, kwargs=kwargs, daemon=daemon, **_kwargs)
@@ -1219,11 +1362,46 @@ class SBFGSScheduler(parallel.Scheduler):
         self.err_history = [] if 'err' in returns else None
         self.diagnoses = [] if 'diagnosis' in returns else None
         self.paused = dict()
+        self.telemetry = telemetry
+        self.busy_time = defaultdict(float)
+        self.t0 = None
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.iter_since_checkpoint = 0
 
     @property
     def worker(self):
         return SBFGSWorker
 
+    def run(self):
+        self.t0 = time.time()
+        return parallel.Scheduler.run(self)
+
+    def emit_telemetry(self, k, i, status):
+        w = status.get('worker', None)
+        t = status.get('time', None)
+        if t is not None:
+            self.busy_time[w] += t
+        elapsed = time.time() - self.t0
+        self.telemetry(dict(
+            iter=k,
+            component=i,
+            worker=w,
+            time=t,
+            elapsed=elapsed,
+            utilisation=self.busy_time[w] / elapsed if 0 < elapsed else None,
+            ncalls=status.get('ncalls', None),
+            f=status.get('f', None),
+            df=status.get('df', None),
+            dg=status.get('dg', None),
+            ls_failure=bool(status.get('ls_failure', False)),
+            ls_resolution=status.get('ls_resolution', None),
+            active=len(self.active),
+            paused=len(self.paused),
+            pending_tasks=_qsize(getattr(self, 'task_queue', None)),
+            pending_results=_qsize(getattr(self, 'return_queue', None)),
+            ))
+
     def pause(self, i, t):
         self.paused[i] = t
         return len(self.paused) < len(self.task)
@@ -1244,7 +1422,104 @@ class SBFGSScheduler(parallel.Scheduler):
             i = None
         return i
 
+    def get_checkpoint(self):
+        """
+        Returns:
+
+            dict: state of the optimizer; includes the parameter vector, the local parameters
+                and inverse Hessian blocks of the components, the iteration counter, the
+                component order and the state of the random number generator, the convergence
+                counters and the histories.
+
+        """
+        __global__ = self.workspace
+        C = self.task
+        index = sorted(C)
+        H = getattr(__global__, 'H', None)
+        if H is not None:
+            H = sparse.csr_matrix(H)
+            H = dict(data=H.data, indices=H.indices, indptr=H.indptr, shape=H.shape)
+        return dict(
+            x=np.array(__global__.x),
+            k=self.k_eff,
+            component_index=np.array(index, dtype=int),
+            component_x=[ C[i].x for i in index ],
+            component_H=[ None if C[i]._H is None else C[i]._H.get_state() for i in index ],
+            H=H,
+            order=getattr(self.component, 'order', None),
+            rng_state=np.random.get_state(),
+            paused=dict(self.paused),
+            ls_failure_count=self.ls_failure_count,
+            low_df_count=self.low_df_count,
+            low_dg_count=self.low_dg_count,
+            history={ attr: getattr(self, attr) for attr in
+                ('ncalls', 'f_history', 'df_history', 'dg_history', 'err_history')
+                if getattr(self, attr) is not None },
+            )
+
+    def set_checkpoint(self, state):
+        """
+        Restore the state returned by :meth:`get_checkpoint`.
+        """
+        __global__ = self.workspace
+        __global__.x[...] = state['x']
+        self.k_eff = state['k']
+        H = state.get('H', None)
+        if H is not None:
+            __global__.H = sparse.csr_matrix((H['data'], H['indices'], H['indptr']),
+                    shape=H['shape']).tolil()
+        C = self.task
+        for i, x, H in zip(state['component_index'], state['component_x'], state['component_H']):
+            c = C[int(i)]
+            if x is not None:
+                c._x = np.array(x)
+            if H is not None:
+                c.H.set_state(H)
+        order = state.get('order', None)
+        if order is not None:
+            self.component.order[...] = order
+        np.random.set_state(state['rng_state'])
+        self.paused = dict(state['paused'])
+        self.ls_failure_count = state['ls_failure_count']
+        self.low_df_count = state['low_df_count']
+        self.low_dg_count = state['low_dg_count']
+        for attr, history in state['history'].items():
+            if getattr(self, attr) is not None:
+                setattr(self, attr, list(history))
+
+    def save_checkpoint(self, path=None):
+        """
+        Save the state returned by :meth:`get_checkpoint` into a .rwa file.
+
+        The previous checkpoint is replaced only once the new one is complete.
+        """
+        from rwa import HDF5Store
+        if path is None:
+            path = self.checkpoint
+        tmp_path = path + '.tmp'
+        store = HDF5Store(tmp_path, 'w')
+        try:
+            store.poke('checkpoint', self.get_checkpoint())
+        finally:
+            store.close()
+        try:
+            replace = os.replace
+        except AttributeError: # Py2
+            replace = os.rename
+        replace(tmp_path, path)
+        self.iter_since_checkpoint = 0
+
     def stop(self, k, i, status):
+        if self.telemetry is not None and k is not None and status:
+            self.emit_telemetry(k, i, status)
+        stop = self.check_convergence(k, i, status)
+        if self.checkpoint and k is not None:
+            self.iter_since_checkpoint += 1
+            if self.checkpoint_interval <= self.iter_since_checkpoint:
+                self.save_checkpoint()
+        return stop
+
+    def check_convergence(self, k, i, status):
 
         # check for convergence based on f
         ncomponents = len(self.task)
@@ -1388,6 +1663,7 @@ class SBFGSWorker(parallel.Worker):
         try:
             while True:
                 k, c = self.get_task()
+                t_step = time.time()
                 i = c.i
                 info = dict()
                 __global__.ncalls = 0
@@ -1449,11 +1725,11 @@ class SBFGSWorker(parallel.Worker):
                                 c.__f__, x, p, c.__g__, c.descent_subspace,
                                 f0=c.f, g0=g0, bounds=bounds,
                                 weight_regul=regul, step_regul=ls_regul,
-                                return_resolution=verbose,
+                                return_resolution=True,
                                 **ls_kwargs) # s_{k}
 
-                        if verbose:
-                            s, res = s
+                        s, res = s
+                        info['ls_resolution'] = res
                         break
 
                         # if the linesearch failed, make `g` sparser
@@ -1544,6 +1820,8 @@ class SBFGSWorker(parallel.Worker):
                 finally:
                     c.push(x)
                     info['ncalls'] = __global__.ncalls
+                    info['worker'] = self._id
+                    info['time'] = time.time() - t_step
                     if xref is not None:
                         err = x - xref
                         err = np.dot(err, err)
@@ -2055,7 +2333,62 @@ def sparse_grad(fun, x, active_i, active_j, args=(), _sum=np.sum, regul=None, bo
     else:
         return None, None
 
+def local_grad_sum(gradient, x, active_i, active_j, args=(), regul=None):
+    """
+    Sum the exact gradients of local cost functions.
+
+    Counterpart of :func:`sparse_grad` for the case the local gradients are known.
+    As the exact partial derivatives are summed over all the components listed by `active_i`,
+    these components should include all the components that depend on the parameters
+    in `active_j`.
+
+    Arguments:
+
+        gradient (callable): takes a component index and the parameter vector, followed
+            by `args`, and returns either a gradient vector or a pair of arrays of parameter
+            indices and partial derivatives.
+
+        x (numpy.ndarray): parameter vector.
+
+        active_i (sequence or callable): component indices, or function that takes
+            a parameter index and returns the indices of the components affected by this
+            parameter.
+
+        active_j (sequence): indices of the parameters the derivatives are taken wrt;
+            if `None`, all the parameters.
+
+        args (sequence): extra positional input arguments to `gradient`.
+
+        regul (float): regularization coefficient on the parameters.
+
+    Returns:
+
+        numpy.ndarray: derivatives wrt the parameters in `active_j`.
+    """
+    if active_j is None:
+        active_j = np.arange(x.size)
+    else:
+        active_j = np.asarray(active_j)
+    if callable(active_i):
+        I = set()
+        for j in active_j:
+            I.update(active_i(j))
+        active_i = sorted(I)
+    total_grad = np.zeros(x.size, dtype=float)
+    for i in active_i:
+        g = gradient(i, x, *args)
+        if isinstance(g, tuple):
+            j, g = g
+            np.add.at(total_grad, j, g)
+        else:
+            total_grad += g
+    total_grad = total_grad[active_j]
+    if regul:
+        total_grad += regul * 2. * x[active_j]
+    return total_grad
+
+
 minimize_sparse_bfgs = minimize_sparse_bfgs1
 
-__all__ = [ 'BFGSResult', 'minimize_sparse_bfgs', 'minimize_sparse_bfgs0', 'minimize_sparse_bfgs1', 'SparseFunction', 'wolfe_line_search', 'sparse_grad' ]
+__all__ = [ 'BFGSResult', 'minimize_sparse_bfgs', 'minimize_sparse_bfgs0', 'minimize_sparse_bfgs1', 'SparseFunction', 'wolfe_line_search', 'sparse_grad', 'local_grad_sum' ]
 
@@ -14,12 +14,14 @@
 
 from .base import *
 from .gradient import *
+from .flat import *
 from warnings import warn
 from math import pi, log
 import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
 from collections import OrderedDict
+from functools import partial
 
 
 setup = {'name': ('standard.d', 'smooth.d'),
@@ -31,7 +33,9 @@ setup = {'name': ('standard.d', 'smooth.d'),
         ('min_diffusivity',     dict(type=float, help='minimum diffusivity value allowed')),
         ('max_iter',        dict(type=int, help='maximum number of iterations')),
         ('rgrad',       dict(help="alternative gradient for the regularization; can be 'delta'/'delta0' or 'delta1'")),
-        ('tol',             dict(type=float, help='tolerance for scipy minimizer')))),
+        ('tol',             dict(type=float, help='tolerance for scipy minimizer')),
+        ('posterior_gradient',  dict(help="gradient of the posterior passed to the minimizer; can be 'analytic' (default) or 'numeric'")),
+        ('posterior_engine',    dict(help="implementation of the posterior; can be 'flat' (default; vectorized) or 'loop' (cell-wise)")))),
     'cell_sampling': 'group'}
 setup_with_grad_arguments(setup)
 
@@ -84,13 +88,10 @@ def smooth_d_neg_posterior(diffusivity, cells, sigma2, diffusivity_prior, \
         cell = cells[i]
         n = len(cell)
         # posterior calculations
-        if cell.cache is None:
-            cell.cache = dict(dr2=None)
-        if cell.cache['dr2'] is None:
-            cell.cache['dr2'] = np.sum(cell.dr * cell.dr, axis=1) # dx**2 + dy**2 + ..
+        dr2 = cell.cached('dr2', lambda: np.sum(cell.dr * cell.dr, axis=1), ('dr',)) # dx**2 + dy**2 + ..
         D_dt = 4. * (diffusivity[j] * cell.dt + noise_dt) # 4*(D+Dnoise)*dt
         result += n * log(pi) + np.sum(np.log(D_dt)) # sum(log(4*pi*Dtot*dt))
-        result += np.sum(cell.cache['dr2'] / D_dt) # sum((dx**2+dy**2+..)/(4*Dtot*dt))
+        result += np.sum(dr2 / D_dt) # sum((dx**2+dy**2+..)/(4*Dtot*dt))
         # prior
         if diffusivity_prior:
             # gradient of diffusivity
@@ -120,13 +121,10 @@ def d_neg_posterior1(diffusivity, cells, sigma2, diffusivity_prior, \
         cell = cells[i]
         n = len(cell)
         # posterior calculations
-        if cell.cache is None:
-            cell.cache = dict(dr2=None)
-        if cell.cache['dr2'] is None:
-            cell.cache['dr2'] = np.sum(cell.dr * cell.dr, axis=1) # dx**2 + dy**2 + ..
+        dr2 = cell.cached('dr2', lambda: np.sum(cell.dr * cell.dr, axis=1), ('dr',)) # dx**2 + dy**2 + ..
         D_dt = 4. * (diffusivity[j] * cell.dt + noise_dt) # 4*(D+Dnoise)*dt
         result += n * log(pi) + np.sum(np.log(D_dt)) # sum(log(4*pi*Dtot*dt))
-        result += np.sum(cell.cache['dr2'] / D_dt) # sum((dx**2+dy**2+..)/(4*Dtot*dt))
+        result += np.sum(dr2 / D_dt) # sum((dx**2+dy**2+..)/(4*Dtot*dt))
         # prior
         if diffusivity_prior:
             # gradient of diffusivity
@@ -138,14 +136,82 @@ def d_neg_posterior1(diffusivity, cells, sigma2, diffusivity_prior, \
     return result
 
 
+def d_neg_posterior_grad(diffusivity, cells, sigma2, diffusivity_prior, \
+    jeffreys_prior, dt_mean, min_diffusivity, index, reverse_index, grad_kwargs, \
+    prior_operator=None, prior_weights=None):
+    """
+    Gradient of :func:`smooth_d_neg_posterior` and :func:`d_neg_posterior1`.
+
+    The two posteriors differ only in the smoothing prior, which is described by
+    `prior_operator` and `prior_weights`, as returned by
+    :meth:`~tramway.inference.base.Distributed.linear_operator` and
+    :func:`~tramway.inference.gradient.grad_sum_weights` respectively.
+    """
+    noise_dt = sigma2
+    grad = np.zeros(diffusivity.size, dtype=float)
+    for j, i in enumerate(index):
+        cell = cells[i]
+        dr2 = cell.cached('dr2', lambda: np.sum(cell.dr * cell.dr, axis=1), ('dr',))
+        D_dt = 4. * (diffusivity[j] * cell.dt + noise_dt)
+        grad[j] = 4. * np.sum(cell.dt * (1. - dr2 / D_dt) / D_dt)
+    if diffusivity_prior and prior_operator is not None:
+        prior_operator.penalty_grad(diffusivity, diffusivity_prior * prior_weights, grad)
+    if jeffreys_prior:
+        grad += 2. * dt_mean / (diffusivity * dt_mean + sigma2)
+    return grad
+
+
+def d_neg_posterior_flat(diffusivity, cells, sigma2, diffusivity_prior, \
+    jeffreys_prior, dt_mean, min_diffusivity, index, reverse_index, grad_kwargs, \
+    flat=None, prior_operator=None, prior_weights=None):
+    """
+    Vectorized implementation of :func:`smooth_d_neg_posterior` and :func:`d_neg_posterior1`.
+
+    The translocations are read from `flat` (:class:`~tramway.inference.flat.FlatTranslocations`),
+    and the smoothing prior is described by `prior_operator` and `prior_weights` instead of being
+    evaluated calling :meth:`~tramway.inference.base.Distributed.grad` or
+    :meth:`~tramway.inference.base.Distributed.local_variation`.
+    """
+    if min_diffusivity is not None:
+        observed_min = np.min(diffusivity)
+        if observed_min < min_diffusivity and not np.isclose(observed_min, min_diffusivity):
+            warn(DiffusivityWarning(observed_min, min_diffusivity))
+    noise_dt = sigma2
+    D_dt = 4. * (flat.expand(diffusivity) * flat.dt + noise_dt) # 4*(D+Dnoise)*dt
+    result = flat.dt.size * log(pi) + np.sum(np.log(D_dt)) + np.sum(flat.dr2 / D_dt)
+    if diffusivity_prior and prior_operator is not None:
+        result += diffusivity_prior * prior_operator.penalty(diffusivity, prior_weights)
+    if jeffreys_prior:
+        result += 2. * np.sum(np.log(diffusivity * dt_mean + sigma2))
+    return result
+
+
+def d_neg_posterior_flat_grad(diffusivity, cells, sigma2, diffusivity_prior, \
+    jeffreys_prior, dt_mean, min_diffusivity, index, reverse_index, grad_kwargs, \
+    flat=None, prior_operator=None, prior_weights=None):
+    """
+    Gradient of :func:`d_neg_posterior_flat`.
+    """
+    noise_dt = sigma2
+    D_dt = 4. * (flat.expand(diffusivity) * flat.dt + noise_dt)
+    grad = 4. * flat.sum(flat.dt * (1. - flat.dr2 / D_dt) / D_dt)
+    if diffusivity_prior and prior_operator is not None:
+        prior_operator.penalty_grad(diffusivity, diffusivity_prior * prior_weights, grad)
+    if jeffreys_prior:
+        grad += 2. * dt_mean / (diffusivity * dt_mean + sigma2)
+    return grad
+
+
 def infer_smooth_D(cells, diffusivity_prior=None, jeffreys_prior=None, \
-    min_diffusivity=None, max_iter=None, epsilon=None, rgrad=None, verbose=False, **kwargs):
+    min_diffusivity=None, max_iter=None, epsilon=None, rgrad=None, verbose=False, \
+    posterior_gradient='analytic', posterior_engine='flat', D0=None, **kwargs):
 
     # initial values
     localization_error = cells.get_localization_error(kwargs, 0.03, True)
     index, reverse_index, n, dt_mean, D_initial, min_diffusivity, D_bounds, _ = \
         smooth_infer_init(cells, min_diffusivity=min_diffusivity, jeffreys_prior=jeffreys_prior,
         sigma2=localization_error)
+    D_initial = initial_values(D0, index, D_initial, 'D0')
 
     # gradient options
     grad_kwargs = get_grad_kwargs(kwargs, epsilon=epsilon)
@@ -172,13 +238,39 @@ def infer_smooth_D(cells, diffusivity_prior=None, jeffreys_prior=None, \
     # posterior function
     if rgrad in ('delta','delta0','delta1'):
         fun = d_neg_posterior1
+        operator = 'local_variation'
     else:
         if rgrad not in (None, 'grad', 'grad1', 'gradn'):
             warn('unsupported rgrad: {}'.format(rgrad), RuntimeWarning)
         fun = smooth_d_neg_posterior
+        operator = 'grad'
 
     args = (cells, localization_error, diffusivity_prior, jeffreys_prior, dt_mean, min_diffusivity, index, reverse_index, grad_kwargs)
 
+    # explicit smoothing prior
+    prior_operator = prior_weights = None
+    if diffusivity_prior:
+        prior_operator = cells.linear_operator(operator, index, reverse_index, **grad_kwargs)
+        prior_weights = grad_sum_weights(cells, index, reverse_index)
+
+    # posterior and gradient implementations
+    if posterior_engine in (None, 'flat'):
+        flat = FlatTranslocations(cells, index)
+        fun = partial(d_neg_posterior_flat, flat=flat,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+        jac = partial(d_neg_posterior_flat_grad, flat=flat,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+    elif posterior_engine == 'loop':
+        jac = partial(d_neg_posterior_grad,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+    else:
+        raise ValueError("posterior_engine should be either 'flat' or 'loop'")
+    if posterior_gradient in (None, 'analytic'):
+        if 'jac' not in kwargs:
+            kwargs['jac'] = jac
+    elif posterior_gradient != 'numeric':
+        raise ValueError("posterior_gradient should be either 'analytic' or 'numeric'")
+
     # run the optimization
     result = minimize(fun, D_initial, args=args, **kwargs)
     if not (result.success or verbose):
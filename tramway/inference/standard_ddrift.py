@@ -15,12 +15,14 @@
 from tramway.core import ChainArray
 from .base import *
 from .gradient import *
+from .flat import *
 from warnings import warn
 from math import pi, log
 import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
 from collections import OrderedDict
+from functools import partial
 
 
 setup = {'name': ('standard.dd', 'standard.ddrift', 'smooth.dd', 'smooth.ddrift'),
@@ -33,7 +35,9 @@ setup = {'name': ('standard.dd', 'standard.ddrift', 'smooth.dd', 'smooth.ddrift'
         ('min_diffusivity', dict(type=float, help='minimum diffusivity value allowed')),
         ('max_iter',        dict(type=int, help='maximum number of iterations')),
         ('rgrad',   dict(help="alternative gradient for the regularization; can be 'delta'/'delta0' or 'delta1'")),
-        ('tol',             dict(type=float, help='tolerance for scipy minimizer')))),
+        ('tol',             dict(type=float, help='tolerance for scipy minimizer')),
+        ('posterior_gradient',  dict(help="gradient of the posterior passed to the minimizer; can be 'analytic' (default) or 'numeric'")),
+        ('posterior_engine',    dict(help="implementation of the posterior; can be 'flat' (default; vectorized) or 'loop' (cell-wise)")))),
     'cell_sampling': 'group'}
 setup_with_grad_arguments(setup)
 
@@ -108,8 +112,105 @@ def dd_neg_posterior1(x, dd, cells, sigma2, diffusivity_prior, drift_prior,
     return result
 
 
+def dd_neg_posterior_grad(x, dd, cells, sigma2, diffusivity_prior, drift_prior,
+        jeffreys_prior, dt_mean, min_diffusivity, index, reverse_index, grad_kwargs,
+        prior_operator=None, prior_weights=None):
+    """
+    Gradient of :func:`smooth_dd_neg_posterior` and :func:`dd_neg_posterior1`.
+
+    The smoothing prior on the diffusivity is described by `prior_operator` and `prior_weights`,
+    as returned by :meth:`~tramway.inference.base.Distributed.linear_operator` and
+    :func:`~tramway.inference.gradient.grad_sum_weights` respectively.
+    """
+    # extract `D` and `drift`
+    dd.update(x)
+    D, drift = dd['D'], dd['drift']
+    grad = np.zeros(x.size, dtype=float)
+    grad_D, grad_drift = dd.get(grad, 'D'), dd.get(grad, 'drift') # views
+    noise_dt = sigma2
+    # for all cell
+    for j, i in enumerate(index):
+        cell = cells[i]
+        denominator = 4. * (D[j] * cell.dt + noise_dt)
+        dr_minus_drift_dt = cell.dr - np.outer(cell.dt, drift[j])
+        ndsd = np.sum(dr_minus_drift_dt * dr_minus_drift_dt, axis=1)
+        grad_D[j] = 4. * np.sum(cell.dt * (1. - ndsd / denominator) / denominator)
+        grad_drift[j] = -2. * np.dot(cell.dt / denominator, dr_minus_drift_dt)
+    # priors
+    if diffusivity_prior and prior_operator is not None:
+        prior_operator.penalty_grad(D, diffusivity_prior * prior_weights, grad_D)
+    if drift_prior:
+        grad_drift += (2. * drift_prior * np.sum(prior_weights)) * drift
+    if jeffreys_prior:
+        grad_D += 2. * dt_mean / (D * dt_mean + sigma2)
+    return grad
+
+
+def dd_neg_posterior_flat(x, dd, cells, sigma2, diffusivity_prior, drift_prior,
+        jeffreys_prior, dt_mean, min_diffusivity, index, reverse_index, grad_kwargs,
+        flat=None, prior_operator=None, prior_weights=None):
+    """
+    Vectorized implementation of :func:`smooth_dd_neg_posterior` and :func:`dd_neg_posterior1`.
+
+    The translocations are read from `flat` (:class:`~tramway.inference.flat.FlatTranslocations`),
+    and the smoothing prior on the diffusivity is described by `prior_operator` and `prior_weights`.
+    """
+    # extract `D` and `drift`
+    dd.update(x)
+    D, drift = dd['D'], dd['drift']
+    #
+    if min_diffusivity is not None:
+        observed_min = np.min(D)
+        if observed_min < min_diffusivity and not np.isclose(observed_min, min_diffusivity):
+            warn(DiffusivityWarning(observed_min, min_diffusivity))
+    noise_dt = sigma2
+    # all the translocations at once
+    denominator = 4. * (flat.expand(D) * flat.dt + noise_dt) # 4*(D+Dnoise)*dt
+    dr_minus_drift_dt = flat.dr - flat.dt[:,np.newaxis] * flat.expand(drift)
+    # non-directional squared displacement
+    ndsd = np.sum(dr_minus_drift_dt * dr_minus_drift_dt, axis=1)
+    result = flat.dt.size * log(pi) + np.sum(np.log(denominator)) + np.sum(ndsd / denominator)
+    # priors
+    if diffusivity_prior and prior_operator is not None:
+        result += diffusivity_prior * prior_operator.penalty(D, prior_weights)
+    if drift_prior:
+        result += drift_prior * np.sum(prior_weights) * np.sum(drift * drift)
+    if jeffreys_prior:
+        result += 2. * np.sum(np.log(D * dt_mean + sigma2))
+    return result
+
+
+def dd_neg_posterior_flat_grad(x, dd, cells, sigma2, diffusivity_prior, drift_prior,
+        jeffreys_prior, dt_mean, min_diffusivity, index, reverse_index, grad_kwargs,
+        flat=None, prior_operator=None, prior_weights=None):
+    """
+    Gradient of :func:`dd_neg_posterior_flat`.
+    """
+    # extract `D` and `drift`
+    dd.update(x)
+    D, drift = dd['D'], dd['drift']
+    grad = np.zeros(x.size, dtype=float)
+    grad_D, grad_drift = dd.get(grad, 'D'), dd.get(grad, 'drift') # views
+    noise_dt = sigma2
+    # all the translocations at once
+    denominator = 4. * (flat.expand(D) * flat.dt + noise_dt)
+    dr_minus_drift_dt = flat.dr - flat.dt[:,np.newaxis] * flat.expand(drift)
+    ndsd = np.sum(dr_minus_drift_dt * dr_minus_drift_dt, axis=1)
+    grad_D[...] = 4. * flat.sum(flat.dt * (1. - ndsd / denominator) / denominator)
+    grad_drift[...] = -2. * flat.sum((flat.dt / denominator)[:,np.newaxis] * dr_minus_drift_dt)
+    # priors
+    if diffusivity_prior and prior_operator is not None:
+        prior_operator.penalty_grad(D, diffusivity_prior * prior_weights, grad_D)
+    if drift_prior:
+        grad_drift += (2. * drift_prior * np.sum(prior_weights)) * drift
+    if jeffreys_prior:
+        grad_D += 2. * dt_mean / (D * dt_mean + sigma2)
+    return grad
+
+
 def infer_smooth_DD(cells, diffusivity_prior=None, drift_prior=None, jeffreys_prior=False,
-    min_diffusivity=None, max_iter=None, epsilon=None, rgrad=None, verbose=False, **kwargs):
+    min_diffusivity=None, max_iter=None, epsilon=None, rgrad=None, verbose=False,
+    posterior_gradient='analytic', posterior_engine='flat', **kwargs):
 
     # initial values
     localization_error = cells.get_localization_error(kwargs, 0.03, True)
@@ -145,15 +246,42 @@ def infer_smooth_DD(cells, diffusivity_prior=None, drift_prior=None, jeffreys_pr
     # posterior function
     if rgrad in ('delta','delta0','delta1'):
         fun = dd_neg_posterior1
+        operator = 'local_variation'
     else:
         if rgrad not in (None, 'grad', 'grad1', 'gradn'):
             warn('unsupported rgrad: {}'.format(rgrad), RuntimeWarning)
         fun = smooth_dd_neg_posterior
+        operator = 'grad'
 
-    # run the optimization
     #cell.cache = None # no cache needed
     args = (dd, cells, localization_error, diffusivity_prior, drift_prior, jeffreys_prior, \
             dt_mean, min_diffusivity, index, reverse_index, grad_kwargs)
+
+    # explicit smoothing prior
+    prior_operator = None
+    if diffusivity_prior:
+        prior_operator = cells.linear_operator(operator, index, reverse_index, **grad_kwargs)
+    prior_weights = grad_sum_weights(cells, index, reverse_index)
+
+    # posterior and gradient implementations
+    if posterior_engine in (None, 'flat'):
+        flat = FlatTranslocations(cells, index)
+        fun = partial(dd_neg_posterior_flat, flat=flat,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+        jac = partial(dd_neg_posterior_flat_grad, flat=flat,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+    elif posterior_engine == 'loop':
+        jac = partial(dd_neg_posterior_grad,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+    else:
+        raise ValueError("posterior_engine should be either 'flat' or 'loop'")
+    if posterior_gradient in (None, 'analytic'):
+        if 'jac' not in kwargs:
+            kwargs['jac'] = jac
+    elif posterior_gradient != 'numeric':
+        raise ValueError("posterior_gradient should be either 'analytic' or 'numeric'")
+
+    # run the optimization
     result = minimize(fun, dd.combined, args=args, **kwargs)
     if not (result.success or verbose):
         warn('{}'.format(result.message), OptimizationWarning)
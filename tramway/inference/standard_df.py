@@ -15,12 +15,14 @@
 from tramway.core import ChainArray
 from .base import *
 from .gradient import *
+from .flat import *
 from warnings import warn
 from math import pi, log
 import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
 from collections import OrderedDict
+from functools import partial
 
 
 setup = {'name': ('standard.df', 'smooth.df'),
@@ -34,7 +36,9 @@ setup = {'name': ('standard.df', 'smooth.df'),
         ('min_diffusivity',     dict(type=float, help='minimum diffusivity value allowed')),
         ('max_iter',        dict(type=int, help='maximum number of iterations')),
         ('rgrad',       dict(help="alternative gradient for the regularization; can be 'delta'/'delta0' or 'delta1'")),
-        ('tol',             dict(type=float, help='tolerance for scipy minimizer')))),
+        ('tol',             dict(type=float, help='tolerance for scipy minimizer')),
+        ('posterior_gradient',  dict(help="gradient of the posterior passed to the minimizer; can be 'analytic' (default) or 'numeric'")),
+        ('posterior_engine',    dict(help="implementation of the posterior; can be 'flat' (default; vectorized) or 'loop' (cell-wise)")))),
     'cell_sampling': 'group'}
 setup_with_grad_arguments(setup)
 
@@ -113,11 +117,117 @@ def df_neg_posterior1(x, df, cells, sigma2, diffusivity_prior,
     return result
 
 
+def df_neg_posterior_grad(x, df, cells, sigma2, diffusivity_prior,
+        force_prior, jeffreys_prior, dt_mean, min_diffusivity,
+        index, reverse_index, grad_kwargs, prior_operator=None, prior_weights=None):
+    """
+    Gradient of :func:`smooth_df_neg_posterior` and :func:`df_neg_posterior1`.
+
+    The smoothing prior on the diffusivity is described by `prior_operator` and `prior_weights`,
+    as returned by :meth:`~tramway.inference.base.Distributed.linear_operator` and
+    :func:`~tramway.inference.gradient.grad_sum_weights` respectively.
+    """
+    # extract `D` and `F`
+    df.update(x)
+    D, F = df['D'], df['F']
+    grad = np.zeros(x.size, dtype=float)
+    grad_D, grad_F = df.get(grad, 'D'), df.get(grad, 'F') # views
+    noise_dt = sigma2
+    # for all cell
+    for j, i in enumerate(index):
+        cell = cells[i]
+        D_dt = D[j] * cell.dt
+        denominator = 4. * (D_dt + noise_dt)
+        dr_minus_drift_dt = cell.dr - np.outer(D_dt, F[j])
+        ndsd = np.sum(dr_minus_drift_dt * dr_minus_drift_dt, axis=1)
+        grad_D[j] = np.sum(cell.dt * (4. * (1. - ndsd / denominator) \
+                - 2. * np.dot(dr_minus_drift_dt, F[j])) / denominator)
+        grad_F[j] = -2. * np.dot(D_dt / denominator, dr_minus_drift_dt)
+    # priors
+    if diffusivity_prior and prior_operator is not None:
+        prior_operator.penalty_grad(D, diffusivity_prior * prior_weights, grad_D)
+    if force_prior:
+        grad_F += (2. * force_prior * np.sum(prior_weights)) * F
+    if jeffreys_prior:
+        grad_D += 2. * (dt_mean / (D * dt_mean + sigma2) - 1. / D)
+    return grad
+
+
+def df_neg_posterior_flat(x, df, cells, sigma2, diffusivity_prior,
+        force_prior, jeffreys_prior, dt_mean, min_diffusivity,
+        index, reverse_index, grad_kwargs, flat=None, prior_operator=None, prior_weights=None):
+    """
+    Vectorized implementation of :func:`smooth_df_neg_posterior` and :func:`df_neg_posterior1`.
+
+    The translocations are read from `flat` (:class:`~tramway.inference.flat.FlatTranslocations`),
+    and the smoothing prior on the diffusivity is described by `prior_operator` and `prior_weights`.
+    """
+    # extract `D` and `F`
+    df.update(x)
+    D, F = df['D'], df['F']
+    #
+    if min_diffusivity is not None:
+        observed_min = np.min(D)
+        if observed_min < min_diffusivity and not np.isclose(observed_min, min_diffusivity):
+            warn(DiffusivityWarning(observed_min, min_diffusivity))
+    noise_dt = sigma2
+    # all the translocations at once
+    D_dt = flat.expand(D) * flat.dt
+    denominator = 4. * (D_dt + noise_dt) # 4*(D+Dnoise)*dt
+    dr_minus_drift_dt = flat.dr - D_dt[:,np.newaxis] * flat.expand(F)
+    # non-directional squared displacement
+    ndsd = np.sum(dr_minus_drift_dt * dr_minus_drift_dt, axis=1)
+    result = flat.dt.size * log(pi) + np.sum(np.log(denominator)) + np.sum(ndsd / denominator)
+    # priors
+    if diffusivity_prior and prior_operator is not None:
+        result += diffusivity_prior * prior_operator.penalty(D, prior_weights)
+    if force_prior:
+        result += force_prior * np.sum(prior_weights) * np.sum(F * F)
+    if jeffreys_prior:
+        result += 2. * np.sum(np.log(D * dt_mean + sigma2) - np.log(D))
+    return result
+
+
+def df_neg_posterior_flat_grad(x, df, cells, sigma2, diffusivity_prior,
+        force_prior, jeffreys_prior, dt_mean, min_diffusivity,
+        index, reverse_index, grad_kwargs, flat=None, prior_operator=None, prior_weights=None):
+    """
+    Gradient of :func:`df_neg_posterior_flat`.
+    """
+    # extract `D` and `F`
+    df.update(x)
+    D, F = df['D'], df['F']
+    grad = np.zeros(x.size, dtype=float)
+    grad_D, grad_F = df.get(grad, 'D'), df.get(grad, 'F') # views
+    noise_dt = sigma2
+    # all the translocations at once
+    D_dt = flat.expand(D) * flat.dt
+    denominator = 4. * (D_dt + noise_dt)
+    _F = flat.expand(F)
+    dr_minus_drift_dt = flat.dr - D_dt[:,np.newaxis] * _F
+    ndsd = np.sum(dr_minus_drift_dt * dr_minus_drift_dt, axis=1)
+    grad_D[...] = flat.sum(flat.dt * (4. * (1. - ndsd / denominator) \
+            - 2. * np.sum(dr_minus_drift_dt * _F, axis=1)) / denominator)
+    grad_F[...] = -2. * flat.sum((D_dt / denominator)[:,np.newaxis] * dr_minus_drift_dt)
+    # priors
+    if diffusivity_prior and prior_operator is not None:
+        prior_operator.penalty_grad(D, diffusivity_prior * prior_weights, grad_D)
+    if force_prior:
+        grad_F += (2. * force_prior * np.sum(prior_weights)) * F
+    if jeffreys_prior:
+        grad_D += 2. * (dt_mean / (D * dt_mean + sigma2) - 1. / D)
+    return grad
+
+
 def infer_smooth_DF(cells, diffusivity_prior=None, force_prior=None, potential_prior=None,
         jeffreys_prior=False, min_diffusivity=None, max_iter=None, epsilon=None, rgrad=None,
-        verbose=False, **kwargs):
+        verbose=False, posterior_gradient='analytic', posterior_engine='flat',
+        D0=None, F0=None, **kwargs):
     """
     Argument `potential_prior` is an alias for `force_prior` which penalizes the large force amplitudes.
+
+    Arguments `D0` and `F0` are optional initial values for the diffusivity and force
+    respectively; see also :func:`~tramway.inference.base.initial_values`.
     """
 
     # initial values
@@ -126,6 +236,8 @@ def infer_smooth_DF(cells, diffusivity_prior=None, force_prior=None, potential_p
         smooth_infer_init(cells, min_diffusivity=min_diffusivity, jeffreys_prior=jeffreys_prior,
         sigma2=localization_error)
     F_initial = np.zeros((len(index), cells.dim), dtype=D_initial.dtype)
+    D_initial = initial_values(D0, index, D_initial, 'D0')
+    F_initial = initial_values(F0, index, F_initial, 'F0')
     df = ChainArray('D', D_initial, 'F', F_initial)
 
     # gradient options
@@ -154,10 +266,12 @@ def infer_smooth_DF(cells, diffusivity_prior=None, force_prior=None, potential_p
     # posterior function
     if rgrad in ('delta','delta0','delta1'):
         fun = df_neg_posterior1
+        operator = 'local_variation'
     else:
         if rgrad not in (None, 'grad', 'grad1', 'gradn'):
             warn('unsupported rgrad: {}'.format(rgrad), RuntimeWarning)
         fun = smooth_df_neg_posterior
+        operator = 'grad'
 
     if force_prior is None:
         if potential_prior is not None:
@@ -165,9 +279,34 @@ def infer_smooth_DF(cells, diffusivity_prior=None, force_prior=None, potential_p
             warn('please use `force_prior` instead of `potential_prior`', PendingDeprecationWarning)
         force_prior = potential_prior
 
-    # run the optimization
     #cell.cache = None # no cache needed
     args = (df, cells, localization_error, diffusivity_prior, force_prior, jeffreys_prior, dt_mean, min_diffusivity, index, reverse_index, grad_kwargs)
+
+    # explicit smoothing prior
+    prior_operator = None
+    if diffusivity_prior:
+        prior_operator = cells.linear_operator(operator, index, reverse_index, **grad_kwargs)
+    prior_weights = grad_sum_weights(cells, index, reverse_index)
+
+    # posterior and gradient implementations
+    if posterior_engine in (None, 'flat'):
+        flat = FlatTranslocations(cells, index)
+        fun = partial(df_neg_posterior_flat, flat=flat,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+        jac = partial(df_neg_posterior_flat_grad, flat=flat,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+    elif posterior_engine == 'loop':
+        jac = partial(df_neg_posterior_grad,
+                prior_operator=prior_operator, prior_weights=prior_weights)
+    else:
+        raise ValueError("posterior_engine should be either 'flat' or 'loop'")
+    if posterior_gradient in (None, 'analytic'):
+        if 'jac' not in kwargs:
+            kwargs['jac'] = jac
+    elif posterior_gradient != 'numeric':
+        raise ValueError("posterior_gradient should be either 'analytic' or 'numeric'")
+
+    # run the optimization
     result = minimize(fun, df.combined, args=args, **kwargs)
     if not (result.success or verbose):
         warn('{}'.format(result.message), OptimizationWarning)
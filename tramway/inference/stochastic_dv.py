@@ -21,7 +21,9 @@ from math import pi, log
 import numpy as np
 import pandas as pd
 import scipy.sparse as sparse
+import scipy.sparse.csgraph as csgraph
 from collections import OrderedDict, deque
+from functools import partial
 import time
 from scipy.stats import trim_mean
 import logging
@@ -48,6 +50,10 @@ setup = {'name': ('stochastic.dv', 'stochastic.dv1'),
         ('grad_selection_angle',('-a', dict(type=float, help='top angle of the selection hypercone for neighbours in the spatial gradient calculation (1= pi radians; if not -c, default is: {})'.format(default_selection_angle)))),
         ('rgrad',               dict(help="local spatial variation; any of 'delta0' (highly recommended), 'delta1'")),
         ('export_centers',      dict(action='store_true')),
+        ('posterior_gradient',  dict(help="gradient of the local posteriors passed to the minimizer; can be 'analytic' (default) or 'numeric'")),
+        ('checkpoint',          dict(help='path to a .rwa file the state of the optimizer is periodically saved into')),
+        ('checkpoint_interval', dict(type=int, help='number of iterations between two checkpoints')),
+        ('resume_from',         dict(help='path to a .rwa checkpoint file to resume the optimization from')),
         ('verbose',             ()))),
         #('region_size',         ('-s', dict(type=int, help='radius of the regions, in number of adjacency steps'))))),
     'cell_sampling': 'group'}
@@ -98,7 +104,10 @@ class LocalDV(DV):
                 self._logger = None
 
     def region(self, i):
-        return self.regions[i]
+        regions = self.regions
+        if sparse.issparse(regions):
+            return regions.indices[regions.indptr[i]:regions.indptr[i+1]]
+        return regions[i]
 
     def indices(self, cell_ids):
         if isinstance(cell_ids, (int, np.int_)):
@@ -193,40 +202,75 @@ parallel.abc.WorkspaceExtension.register(LocalDV)
 
 
 def make_regions(cells, index, reverse_index, size=1):
-    A = cells.adjacency
-    regions = []
-    for i in index:
-        j = set([i.tolist()])
-        j_inner = set()
-        for k in range(size):
-            j_outer = j - j_inner
-            j_inner = j
-            for l in j_outer:
-                neighbours = A.indices[A.indptr[l]:A.indptr[l+1]] # NOT cells.neighbours(l)
-                j |= set(neighbours.tolist())
-        j = reverse_index[list(j)]
-        regions.append(j)
+    """
+    Groups of neighbour cells.
+
+    The region of a cell includes all the cells at most `size` adjacency steps away,
+    i.e. the nonzero elements of the corresponding row of :math:`(A+I)^{size}`.
+
+    Arguments:
+
+        cells (Distributed): distributed cells.
+
+        index (numpy.ndarray): indices of the cells the regions are centered on.
+
+        reverse_index (numpy.ndarray): index map that converts cell indices into positions
+            in `index`; cells that map to negative positions are excluded.
+
+        size (int): radius of the regions, in number of adjacency steps.
+
+    Returns:
+
+        scipy.sparse.csr_matrix: square boolean matrix; row *j* lists the positions
+            (in `index`) of the cells in the region of the cell at position *j*.
+
+    """
+    A = cells.adjacency # NOT cells.neighbours
+    A = sparse.csr_matrix((np.ones(A.indices.size, dtype=np.int32), A.indices, A.indptr),
+            shape=A.shape)
+    A = A + sparse.identity(A.shape[0], dtype=np.int32, format='csr')
+    A.data[:] = 1
+    R = sparse.identity(A.shape[0], dtype=np.int32, format='csr')[np.asarray(index)]
+    for _ in range(size):
+        R = R.dot(A)
+        R.data[:] = 1
+    R = R.tocoo()
+    col = reverse_index[R.col]
+    ok = 0 <= col
+    m = len(index)
+    regions = sparse.csr_matrix((np.ones(np.sum(ok), dtype=bool), (R.row[ok], col[ok])),
+            shape=(m, m))
+    regions.sort_indices()
     return regions
 
 
 def lookup_space_cells(cells):
+    """
+    Groups of cells that are connected in time.
+
+    Arguments:
+
+        cells (DynamicCells): distributed cells.
+
+    Returns:
+
+        scipy.sparse.csr_matrix: boolean matrix with as many rows as groups;
+            row *k* lists the indices of the cells in group *k*.
+
+    """
     A = cells.temporal_adjacency
-    available = { i for i in cells }
-    space_cells = []
-    while available:
-        space_cell = set()
-        front_cells = { available.pop() }
-        while front_cells:
-            more_cells = set()
-            for i in front_cells:
-                more_cells |= set(A.indices[A.indptr[i]:A.indptr[i+1]])
-            space_cell |= front_cells
-            if more_cells:
-                front_cells = more_cells - space_cell
-            else:
-                break
-        available -= space_cell
-        space_cells.append(list(space_cell))
+    count, label = csgraph.connected_components(A, directed=False)
+    # keep the groups that contain at least one cell
+    cell_ids = np.array([ i for i in cells ], dtype=int)
+    nonempty = np.zeros(count, dtype=bool)
+    nonempty[label[cell_ids]] = True
+    renumbered = np.cumsum(nonempty) - 1
+    member = nonempty[label]
+    row = renumbered[label[member]]
+    col, = np.nonzero(member)
+    space_cells = sparse.csr_matrix((np.ones(col.size, dtype=bool), (row, col)),
+            shape=(np.sum(nonempty), A.shape[0]))
+    space_cells.sort_indices()
     return space_cells
 
 
@@ -331,6 +375,91 @@ def local_dv_neg_posterior(j, x, dv, cells, sigma2, jeffreys_prior,
 
     return result
 
+def local_dv_neg_posterior_grad(j, x, dv, cells, sigma2, jeffreys_prior,
+    dt_mean, index, reverse_index, grad_kwargs,
+    posterior_info=None, iter_num=None, verbose=False,
+    grad_forms=None, prior_forms=None, prior_weights=None, time_forms=None):
+    """
+    Gradient of :func:`local_dv_neg_posterior`.
+
+    `grad_forms`, `prior_forms` and `time_forms` are the local matrices of
+    :meth:`~tramway.inference.base.Distributed.grad`,
+    :meth:`~tramway.inference.base.Distributed.local_variation` and
+    :meth:`~tramway.inference.time.DynamicCells.temporal_variation` respectively,
+    as returned by :meth:`~tramway.inference.gradient.LocalLinearOperator.forms`.
+    `prior_weights` is returned by :func:`~tramway.inference.gradient.grad_sum_weights`.
+
+    Returns:
+
+        tuple: indices in `x` (possibly repeated) and the corresponding partial derivatives.
+    """
+    Dj = x[j]
+    if np.any(np.isnan(Dj)):
+        raise ValueError('D is nan')
+    m = int(x.size/2)
+    D, V = x[:m], x[m:]
+
+    noise_dt = sigma2
+
+    i = index[j]
+    cell = cells[i]
+
+    # spatial gradient of the local potential energy
+    form = grad_forms[j]
+    if form is None:
+        gradV = None
+    else:
+        cols, A = form
+        gradV = A.dot(V[cols])
+    if gradV is None or np.any(np.isnan(gradV)):
+        # the potential energy does not contribute to the likelihood
+        form = None
+        gradV = np.zeros(cell.dim)
+
+    D_dt = Dj * cell.dt
+    denominator = 4. * (D_dt + noise_dt)
+    if np.any(denominator <= 0):
+        raise ValueError('undefined posterior; local diffusion value: %s', Dj)
+    dr_minus_drift = cell.dr + np.outer(D_dt, gradV)
+    ndsd = np.sum(dr_minus_drift * dr_minus_drift, axis=1)
+    grad_Dj = np.sum(cell.dt * (4. * (1. - ndsd / denominator) \
+            + 2. * np.dot(dr_minus_drift, gradV)) / denominator)
+    if jeffreys_prior:
+        if Dj <= 0:
+            raise ValueError('non positive diffusivity')
+        grad_Dj += jeffreys_prior * 2. * dt_mean[j] / (Dj * dt_mean[j] + sigma2) - 1. / Dj
+    indices, grad = [[j]], [[grad_Dj]]
+    if form is not None:
+        grad_gradV = 2. * np.dot(D_dt / denominator, dr_minus_drift)
+        indices.append(m + cols)
+        grad.append(A.T.dot(grad_gradV))
+
+    # priors
+    form = prior_forms[j]
+    if form is not None:
+        cols, B = form
+        V_prior = dv.potential_spatial_prior(j)
+        if V_prior:
+            indices.append(m + cols)
+            grad.append(2. * V_prior * prior_weights[j] * B.T.dot(B.dot(V[cols])))
+        D_prior = dv.diffusivity_spatial_prior(j)
+        if D_prior:
+            indices.append(cols)
+            grad.append(2. * D_prior * prior_weights[j] * B.T.dot(B.dot(D[cols])))
+    form = None if time_forms is None else time_forms[j]
+    if form is not None:
+        cols, T = form
+        D_time_prior = dv.diffusivity_time_prior(i)
+        if D_time_prior:
+            indices.append(cols)
+            grad.append(2. * D_time_prior * T.T.dot(T.dot(D[cols])))
+        V_time_prior = dv.potential_time_prior(i)
+        if V_time_prior:
+            indices.append(m + cols)
+            grad.append(2. * V_time_prior * T.T.dot(T.dot(V[cols])))
+
+    return np.concatenate(indices), np.concatenate(grad)
+
 def _local_dv_neg_posterior(*args, **kwargs):
     try:
         return local_dv_neg_posterior(*args, **kwargs)
@@ -344,11 +473,11 @@ def infer_stochastic_DV(cells,
     jeffreys_prior=False, min_diffusivity=None, max_iter=None,
     compatibility=False,
     export_centers=False, verbose=True, superlocal=True, stochastic=True,
-    D0=None, V0=None, x0=None, rgrad=None, debug=False, fulltime=False,
+    D0=None, V0=None, x0=None, rgrad=None, debug=False, fulltime=False, frozen=None,
     diffusion_prior=None, diffusion_spatial_prior=None, diffusion_time_prior=None,
     prior_delay=None, return_struct=False, posterior_max_count=None,# deprecated
     diffusivity_prior=None, potential_prior=None, time_prior=None,
-    **kwargs):
+    posterior_gradient='analytic', **kwargs):
     """
     Arguments:
 
@@ -372,12 +501,18 @@ def infer_stochastic_DV(cells,
 
         stochastic (bool): if ``False``, emulate standard *DV* with sparse gradient.
 
-        D0 (float or ndarray): initial diffusivity value(s).
+        D0 (float or ndarray or Series): initial diffusivity value(s);
+            a :class:`~pandas.Series` is indexed by cell index and may cover only
+            some of the cells.
 
-        V0 (float or ndarray): initial potential energy value(s).
+        V0 (float or ndarray or Series): initial potential energy value(s).
 
         x0 (ndarray): initial parameter vector [diffusivities, potentials].
 
+        frozen (array-like): boolean array indexed by cell index, with ``True`` for the
+            cells the diffusivity and potential of which remain at their initial values;
+            see also :meth:`~tramway.inference.base.Distributed.run_schwarz`.
+
         rgrad (str): either 'grad'/'grad1', 'gradn' (none recommended), 'delta'/'delta0'
             or 'delta1';
             see the corresponding functions in module :mod:`~tramway.inference.gradient`.
@@ -392,6 +527,15 @@ def infer_stochastic_DV(cells,
             candidate updated component;
             required to compute the 'diagnoses' debug variable.
 
+        checkpoint (str): path to a .rwa file the state of the optimizer is periodically
+            saved into, every `checkpoint_interval` iterations.
+
+        resume_from (str): path to a .rwa checkpoint file to resume the optimization from.
+
+        posterior_gradient (str): either 'analytic' (default) to pass
+            :func:`local_dv_neg_posterior_grad` to the minimizer, or 'numeric' to let the
+            minimizer estimate the gradient by finite differences.
+
         prior_delay/return_struct/posterior_max_count: all deprecated.
 
         ...
@@ -408,7 +552,7 @@ def infer_stochastic_DV(cells,
         sigma2=localization_error)
     # V initial values
     if x0 is None:
-        if V0 is None:
+        if V0 is None or isinstance(V0, (pd.Series, pd.DataFrame)):
             try:
                 if compatibility:
                     raise Exception # skip to the except block
@@ -427,21 +571,14 @@ def infer_stochastic_DV(cells,
         if x0.size != 2 * D_initial.size:
             raise ValueError('wrong size for x0')
         D_initial, V_initial = x0[:int(x0.size/2)], x0[int(x0.size/2):]
-    if D0 is not None:
-        if np.isscalar(D0):
-            D_initial[...] = D0
-        elif D0.size == D_initial.size:
-            D_initial = D0
-        else:
-            raise ValueError('wrong size for D0')
+    # user-supplied initial values, possibly partial (e.g. warm start)
+    D_initial = initial_values(D0, index, D_initial, 'D0')
     if V0 is not None:
-        if np.isscalar(V0):
-            # V0 may be given as an integer
-            V_initial = np.full(D_initial.size, V0, dtype=D_initial.dtype)
-        elif V0.size == D_initial.size:
-            V_initial = V0
-        else:
-            raise ValueError('wrong size for V0')
+        try:
+            V_initial
+        except NameError: # V0 is a scalar or a full array
+            V_initial = np.zeros_like(D_initial)
+        V_initial = initial_values(V0, index, V_initial, 'V0')
 
     if diffusivity_prior is None:
         diffusivity_prior = diffusion_prior
@@ -481,6 +618,8 @@ def infer_stochastic_DV(cells,
     #if min_diffusivity is not None:
     #    assert np.all(min_diffusivity < D_initial)
     bounds = D_bounds + V_bounds
+    # cells with fixed parameters (e.g. halo cells in domain decomposition)
+    bounds = frozen_bounds(bounds, frozen, index, D_initial, V_initial)
 
     # posterior function input arguments
     if jeffreys_prior is True:
@@ -498,6 +637,25 @@ def infer_stochastic_DV(cells,
     # keyword arguments to `minimize_sparse_bfgs`
     sbfgs_kwargs = dict(kwargs)
 
+    # local gradient
+    if posterior_gradient in (None, 'analytic'):
+        grad_forms = cells.linear_operator('grad', index, reverse_index, **grad_kwargs).forms()
+        if diffusivity_spatial_prior or potential_spatial_prior:
+            prior_forms = cells.linear_operator('local_variation', index, reverse_index,
+                    **grad_kwargs).forms()
+            prior_weights = grad_sum_weights(cells, index, reverse_index)
+        else:
+            prior_forms, prior_weights = [None] * m, None
+        if diffusivity_time_prior or potential_time_prior:
+            time_forms = cells.linear_operator('temporal_variation', index, reverse_index,
+                    neighbours=cells.time_neighbours).forms()
+        else:
+            time_forms = None
+        sbfgs_kwargs['jac'] = partial(local_dv_neg_posterior_grad, grad_forms=grad_forms,
+                prior_forms=prior_forms, prior_weights=prior_weights, time_forms=time_forms)
+    elif posterior_gradient != 'numeric':
+        raise ValueError("posterior_gradient should be either 'analytic' or 'numeric'")
+
     # cell groups (a given cell + its neighbours)
     dv.regions = make_regions(cells, index, reverse_index)
 
@@ -509,9 +667,9 @@ def infer_stochastic_DV(cells,
         descent_subspace = None
         if fulltime:
             space_cells = lookup_space_cells(cells)
-            component = len(space_cells)
+            component = space_cells.shape[0]
             def gradient_subspace(i):
-                return space_cells[i]
+                return space_cells.indices[space_cells.indptr[i]:space_cells.indptr[i+1]]
         elif superlocal:
             gradient_subspace = dv.indices
         else:
@@ -537,7 +695,7 @@ def infer_stochastic_DV(cells,
         if 'gradient_covariate' not in sbfgs_kwargs:
             sbfgs_kwargs['gradient_covariate'] = col2rows
 
-    if os.name == 'nt':
+    if os.name == 'nt' and not parallel.get_backend(sbfgs_kwargs.get('backend', None)).threads:
         if sbfgs_kwargs.get('worker_count', None):
             logger.warning('multiprocessing may break on Windows')
         else:
@@ -24,6 +24,7 @@ import itertools
 import copy
 from collections import Counter, namedtuple, defaultdict
 import sys
+import warnings
 
 
 class Partition(Lazy):
@@ -859,19 +860,22 @@ class Delaunay(Tessellation):
 
     Attributes:
         cell_centers (numpy.ndarray): coordinates of the cell centers.
+        cell_tree (scipy.spatial.cKDTree): spatial index of the (scaled) cell centers;
+            built on demand and not serialized.
     """
-    __slots__ = ('_cell_centers',)
+    __slots__ = ('_cell_centers', '_cell_tree')
 
     def __init__(self, scaler=None):
         Tessellation.__init__(self, scaler)
         self._cell_centers = None
+        self._cell_tree = None
 
     def tessellate(self, points):
         self._cell_centers = np.asarray(self._preprocess(points))
 
     def cell_index(self, points, format=None, select=None, knn=None, radius=None,
         min_location_count=None, metric='euclidean', filter=None,
-        filter_descriptors_only=False, **kwargs):
+        filter_descriptors_only=False, exact_radius=None, **kwargs):
         """
         See :meth:`Tessellation.cell_index`.
 
@@ -909,12 +913,17 @@ class Delaunay(Tessellation):
                 This argument applies before `knn`. The points in these cells, if not
                 associated with another cell, are labeled ``-1``. The other cell labels
                 do not change.
-            metric (str): any metric name understandable by :func:`~scipy.spatial.distance.cdist`.
+            metric (str): any metric name understandable by :func:`~scipy.spatial.distance.cdist`;
+                with the default euclidean metric, the nearest neighbours are looked for
+                with spatial indices (see :attr:`cell_tree`) and the point-cell distance
+                matrix is never formed.
             filter (callable): takes the calling instance, a cell index and the corresponding
                 subset of points; returns ``True`` if the corresponding cell should be
                 included in the labeling.
             filter_descriptors_only (bool): whether `filter` should get points as
                 descriptors only.
+            exact_radius (bool): see :func:`cell_index_by_radius`; applies only if
+                `radius` is a float and no other selection argument is defined.
 
         Returns:
             see :meth:`Tessellation.cell_index`.
@@ -940,57 +949,68 @@ class Delaunay(Tessellation):
             min_r = max_r = radius
             if radius and not(min_nn or max_nn or min_location_count or filter):
                 return cell_index_by_radius(self, points, radius,
-                        format=format, select=select, metric=metric, **kwargs)
+                        format=format, select=select, metric=metric,
+                        exact_radius=exact_radius, **kwargs)
         points = self.scaler.scale_point(points, inplace=False)
         X = self.descriptors(points, asarray=True)
         Y = self._cell_centers
-        try:
-            D = cdist(X, Y, metric, **kwargs)
-        except MemoryError as e:
-            memory_error = e # make it available outside the except block
-            # slice X to process less rows at a time
-            if metric != 'euclidean':
-                raise #NotImplementedError
-            K = np.zeros(X.shape[0], dtype=int)
-            X2 = np.sum(X * X, axis=1, keepdims=True).astype(np.float32)
-            Y2 = np.sum(Y * Y, axis=1, keepdims=True).astype(np.float32)
-            X, Y = X.astype(np.float32), Y.astype(np.float32)
-            n = 0
-            while True:
-                n += 1
-                block = int(ceil(X.shape[0] * 2**(-n)))
-                try:
-                    np.empty((block, Y.shape[0]), dtype=X.dtype)
-                except MemoryError:
-                    pass # continue
-                else:
-                    break
-            n += 2 # safer
-            block = int(ceil(X.shape[0] * 2**(-n)))
-            for i in range(0, X.shape[0], block):
-                j = min(i+block, X2.size)
-                Di = np.dot(np.float32(-2.)* X[i:j], Y.T)
-                Di += X2[i:j]
-                Di += Y2.T
-                K[i:j] = np.argmin(Di, axis=1)
+        ncells = Y.shape[0]
+        if metric == 'euclidean' and not kwargs:
+            # the point-cell distance matrix is never formed;
+            # nearest neighbour queries are delegated to spatial indices instead
             D = None
+            K = self._nearest_cell(X)
         else:
-            K = None
+            D = cdist(X, Y, metric, **kwargs)
+            K = np.argmin(D, axis=1) # cell indices
+        _point_tree = {}
+        def point_tree():
+            try:
+                return _point_tree['tree']
+            except KeyError:
+                tree = _point_tree['tree'] = spatial.cKDTree(X)
+                return tree
+        def distance(cell, c):
+            # distances between points `cell` (row indices) and the center of cell `c`
+            if D is None:
+                d = X[cell] - Y[[c]]
+                return np.sqrt(np.sum(d * d, axis=1))
+            else:
+                return D[cell, c]
+        def nearest_points(c, k):
+            # `k` nearest points to the center of each cell in `c`, as a k-by-len(c) matrix
+            if D is None:
+                _, I = point_tree().query(Y[c], k=k)
+                return np.reshape(I, (len(c), k)).T
+            else:
+                return np.argsort(D[:,c], axis=0)[:k]
+        def within(c, r):
+            # points no further than `r` from the center of cell `c`
+            if D is None:
+                return np.asarray(point_tree().query_ball_point(Y[c], r), dtype=int)
+            else:
+                I, = (D[:,c] <= r).nonzero()
+                return I
         #
-        ncells = self._cell_centers.shape[0]
         if format == 'force array':
             min_nn = min_r = None
             format = 'array' # for later call to :func:`format_cell_index`
         if max_nn or min_nn or min_location_count or filter is not None or min_r or max_r:
-            if K is None:
-                # D should be defined
-                K = np.argmin(D, axis=1) # cell indices
             nonempty, positive_count = np.unique(K, return_counts=True)
+            # group the points by cell once for all;
+            # afterwards the points can only be dissociated from their cell (K[i] = -1)
+            _order = np.argsort(K, kind='mergesort')
+            _bounds = np.r_[0, np.cumsum(np.bincount(K, minlength=ncells))]
+            def members(c):
+                cell = _order[_bounds[c]:_bounds[c+1]]
+                return cell[K[cell] == c]
             if filter is not None:
                 for c in nonempty:
-                    cell = K == c
+                    cell = members(c)
                     if filter_descriptors_only:
                         x = X[cell]
+                    elif isinstance(points, (pd.Series, pd.DataFrame)):
+                        x = points.iloc[cell]
                     else:
                         x = points[cell]
                     if not filter(self, c, x):
@@ -1001,7 +1021,7 @@ class Delaunay(Tessellation):
                 excluded_cells = positive_count < min_location_count
                 if np.any(excluded_cells):
                     for c in nonempty[excluded_cells]:
-                        K[K == c] = -1
+                        K[members(c)] = -1
                     # remove the excluded cells from nonempty and positive_count
                     ok = np.ones(nonempty.size, dtype=bool)
                     ok[excluded_cells] = False
@@ -1014,24 +1034,17 @@ class Delaunay(Tessellation):
                         _, _max = knn(c)
                         if _max is None or positive_count[i] <= _max:
                             continue
-                        if D is None:
-                            raise memory_error
-                        cell = K == c
-                        I = np.argsort(D[cell, c])
-                        cell, = cell.nonzero()
+                        cell = members(c)
+                        I = np.argsort(distance(cell, c))
                         excess = cell[I[_max:]]
                         K[excess] = -1
                 else:
                     large, = (max_nn < positive_count).nonzero()
-                    if large.size:
-                        if D is None:
-                            raise memory_error
-                        for c in nonempty[large]:
-                            cell = K == c
-                            I = np.argsort(D[cell, c])
-                            cell, = cell.nonzero()
-                            excess = cell[I[max_nn:]]
-                            K[excess] = -1
+                    for c in nonempty[large]:
+                        cell = members(c)
+                        I = np.argsort(distance(cell, c))
+                        excess = cell[I[max_nn:]]
+                        K[excess] = -1
             # max radius:
             if max_r:
                 excluded_cells = []
@@ -1040,14 +1053,8 @@ class Delaunay(Tessellation):
                         _, max_r = radius(c)
                         if max_r is None:
                             continue
-                    cell = K == c
-                    if D is None:
-                        d = X[cell] - Y[[c]]
-                        d = np.sqrt(np.sum(d * d, axis=1))
-                    else:
-                        d = D[cell, c]
-                    cell, = cell.nonzero()
-                    discard = max_r < d
+                    cell = members(c)
+                    discard = max_r < distance(cell, c)
                     K[cell[discard]] = -1
                     if np.all(discard):
                         excluded_cells.append(i)
@@ -1065,12 +1072,10 @@ class Delaunay(Tessellation):
                     for i, c in enumerate(nonempty):
                         _min, _ = knn(c)
                         if _min is None or _min <= positive_count[i]:
-                            Ic, = (K == c).nonzero()
+                            Ic = members(c)
                         else:
                             any_small = True
-                            if D is None:
-                                raise memory_error
-                            Ic = np.argsort(D[:,c])[:_min]
+                            Ic = nearest_points([c], _min)[:,0]
                         I.append(Ic)
                         n.append(len(Ic))
                     if any_small:
@@ -1084,34 +1089,28 @@ class Delaunay(Tessellation):
                         small = np.ones(ncells, dtype=bool)
                     small[nonempty] = positive_count < min_nn
                     if np.any(small):
-                        if D is None:
-                            raise memory_error
                         # small and missing cells
-                        if D.shape[0] < min_nn:
+                        if X.shape[0] < min_nn:
                             # beware of the special case such that all the min_nn points are in a single bin
                             assert np.all(small[nonempty])
                             # the total number of points is lower than
                             # the desired minimum number of points per
                             # cell
-                            n = D.shape[0]
+                            n = X.shape[0]
                             I = np.repeat(np.arange(n), ncells)
                             J = np.tile(np.arange(ncells), n)
                             K = (I, J)
                         else:
-                            I = np.argsort(D[:,small], axis=0)[:min_nn].flatten()
+                            small_cell = small
                             small, = small.nonzero()
+                            I = nearest_points(small, min_nn).flatten()
                             J = np.tile(small, min_nn) # cell indices
                             assert I.size == J.size
                             # large-enough cells
-                            #if min_location_count:
-                            #    small = count < min_nn
-                            point_in_small_cells = np.any(
-                                small[:,np.newaxis] == K[np.newaxis,:], axis=0)
-                            Ic = np.logical_not(point_in_small_cells)
+                            Ic = 0 <= K
+                            Ic[Ic] = ~small_cell[K[Ic]]
                             Jc = K[Ic]
                             Ic, = Ic.nonzero()
-                            Ic = Ic[0 <= Jc]
-                            Jc = Jc[0 <= Jc]
                             #
                             K = (np.concatenate((I, Ic)), np.concatenate((J, Jc)))
             # min radius:
@@ -1119,51 +1118,45 @@ class Delaunay(Tessellation):
             if min_r:
                 if isinstance(K, tuple):
                     _I, _J = K
+                else:
+                    _I, = (0 <= K).nonzero()
+                    _J = K[_I]
+                association = sparse.csr_matrix((np.ones(_I.size, dtype=bool), (_I, _J)),
+                        shape=(X.shape[0], ncells))
                 I, n = [], []
                 for c in nonempty:
-                    if callable(knn):
-                        min_r, _ = knn(c)
+                    if callable(radius):
+                        min_r, _ = radius(c)
                         if min_r is None:
-                            if isinstance(K, tuple):
-                                Ic = I[J == c]
-                            else:
-                                Ic, = (K == c).nonzero()
+                            Ic, _ = association[:,c].nonzero()
+                            Ic = np.unique(Ic)
                             I.append(Ic)
+                            n.append(len(Ic))
                             continue
+                    # points in range, with the cells they are associated with
+                    Ic = within(c, min_r)
+                    _Ic, _Jc = association[Ic].nonzero()
+                    # include the cells that are connected to cell `c`
+                    # through cells with points in range
+                    cells_in_range = set(_Jc.tolist())
                     pending_cells = set([c])
                     visited_cells = set()
-                    included_points = np.zeros(X.shape[0], dtype=bool)
+                    included_cells = []
                     while pending_cells:
                         _pending_cells = set()
                         for _c in pending_cells:
                             visited_cells.add(_c)
-                            if isinstance(K, tuple):
-                                cell = _I[_J == _c]
-                            else:
-                                cell = K == _c
-                            if D is None:
-                                d = X[cell] - Y[[c]]
-                                d = np.sqrt(np.sum(d * d, axis=1))
-                            else:
-                                d = D[cell, c]
-                            _in = d <= min_r
-                            if np.any(_in):
-                                if np.all(_in):
-                                    included_points[cell] = True
-                                else:
-                                    cell, = cell.nonzero()
-                                    included_points[cell[_in]] = True
+                            if _c in cells_in_range:
+                                included_cells.append(_c)
                                 _pending_cells |= set(self.neighbours(_c).tolist())
                         pending_cells = _pending_cells - visited_cells
-                    Ic, = included_points.nonzero()
+                    Ic = np.unique(Ic[_Ic[np.isin(_Jc, included_cells)]])
                     I.append(Ic)
                     n.append(len(Ic))
                 I = np.concatenate(I)
                 J = np.repeat(nonempty, n)
                 K = (I, J)
 
-        elif K is None:
-            K = np.argmin(D, axis=1) # cell indices
         point_count = points.shape[0]
         #if isinstance(points, pd.DataFrame):
         #       point_count = max(point_count, points.index.max()+1) # NO!
@@ -1171,6 +1164,17 @@ class Delaunay(Tessellation):
         return format_cell_index(K, format=format, select=select,
             shape=(point_count, ncells))
 
+    def _nearest_cell(self, X):
+        """
+        Index of the cell with the nearest center (euclidean distance) for each row of `X`,
+        with `X` the (scaled) point descriptors as an array.
+
+        Meshes with a regular structure may compute the cell indices directly instead of
+        querying :attr:`cell_tree`.
+        """
+        _, K = self.cell_tree.query(X)
+        return K
+
     # cell_centers property
     @property
     def cell_centers(self):
@@ -1185,6 +1189,23 @@ class Delaunay(Tessellation):
     def cell_centers(self, centers):
         self._cell_centers = self.scaler.scale_point(centers)
 
+    @property
+    def cell_tree(self):
+        """
+        Spatial index (:class:`scipy.spatial.cKDTree`) of the scaled cell centers.
+
+        The index is built once and cached; it is rebuilt only if the cell centers change.
+        """
+        try:
+            tree = self._cell_tree
+        except AttributeError: # instance made without calling `__init__`
+            tree = None
+        centers = self._cell_centers
+        if tree is None or tree.n != centers.shape[0] or not np.array_equal(tree.data, centers):
+            # copy the centers, so that in-place changes invalidate the index
+            tree = self._cell_tree = spatial.cKDTree(centers, copy_data=True)
+        return tree
+
 
 class Voronoi(Delaunay):
     """
@@ -2069,57 +2090,43 @@ def boxed_voronoi_2d(points, bounding_box=None):
 
 
 def cell_index_by_radius(tessellation, points, radius, format=None, select=None, metric='euclidean',
-        **kwargs):
+        exact_radius=None, **kwargs):
     """
     See :meth:`Delaunay.cell_index`.
 
     Specialized routine to assign locations to cells which center is no further than `radius`.
+
+    For historical reasons, the point-cell distances are compared against `radius` squared,
+    unless `exact_radius` is ``True``.
+    This behaviour is deprecated; if `exact_radius` is ``None`` and `radius` is not ``1``,
+    a :class:`DeprecationWarning` is emitted.
+    `exact_radius=False` silently preserves the former behaviour.
     """
-    #if metric != 'euclidean':
-    #    raise NotImplementedError('%s metric not supported', metric)
-    r2 = radius * radius
+    if exact_radius is None:
+        exact_radius = False
+        if radius != 1:
+            warnings.warn('the point-cell distances are compared against radius**2; '
+                'pass exact_radius=True to compare them against radius instead, '
+                'which will become the default', DeprecationWarning)
+    max_distance = radius if exact_radius else radius * radius
     points = tessellation.scaler.scale_point(points, inplace=False)
     X = tessellation.descriptors(points, asarray=True)
     Y = tessellation._cell_centers
     ncells = Y.shape[0]
     shape = (X.shape[0], ncells)
-    try:
-        D = cdist(X, Y, metric, **kwargs)
-    except MemoryError:
-        # slice X to process less rows at a time
-        if metric != 'euclidean':
-            raise #NotImplementedError
-        X2 = np.sum(X * X, axis=1, keepdims=True).astype(np.float32)
-        Y2 = np.sum(Y * Y, axis=1, keepdims=True).astype(np.float32)
-        X, Y = X.astype(np.float32), Y.astype(np.float32)
-        n = 0
-        while True:
-            n += 1
-            block = int(ceil(X.shape[0] * 2**(-n)))
-            try:
-                np.empty((block, Y.shape[0]), dtype=X.dtype)
-            except MemoryError:
-                pass # continue
-            else:
-                break
-        n += 2 # safer
-        block = int(ceil(X.shape[0] * 2**(-n)))
-        P, C = [], []
-        for i in range(0, X.shape[0], block):
-            j = min(i+block, X2.size)
-            Di = np.dot(np.float32(-2.) * X[i:j], Y.T)
-            Di += X2[i:j]
-            Di += Y2.T
-            Pi, Ci = (Di <= r2).nonzero()
-            P.append(i+Pi)
-            C.append(Ci)
-        associations = (np.concatenate(P), np.concatenate(C))
+    if metric == 'euclidean' and not kwargs:
+        P = spatial.cKDTree(X).query_ball_point(Y, max_distance)
+        n = [ len(p) for p in P ]
+        P = np.concatenate([ np.asarray(p, dtype=int) for p in P ])
+        C = np.repeat(np.arange(ncells), n)
+        order = np.lexsort((C, P))
+        associations = (P[order], C[order])
     else:
-        associations = (D <= r2).nonzero()
+        D = cdist(X, Y, metric, **kwargs)
+        associations = (D <= max_distance).nonzero()
     return format_cell_index(associations, format=format, select=select, shape=shape)
 
 
-
 __all__ = ['Partition', 'CellStats', 'point_adjacency_matrix', 'Tessellation', 'Delaunay', 'Voronoi', \
     'format_cell_index', 'nearest_cell', 'dict_to_sparse', 'sparse_to_dict', \
     '_Voronoi', 'boxed_voronoi_2d', 'cell_index_by_radius']
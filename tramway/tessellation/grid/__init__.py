@@ -101,6 +101,21 @@ class RegularMesh(Voronoi):
         Voronoi._preprocess(self, points) # initialize `scaler`
         return points # ... but do not scale
 
+    def _nearest_cell(self, X):
+        # the nearest cell center is found independently along each dimension;
+        # points beyond the bounds go to the border cells
+        grid = getattr(self, 'grid', None)
+        if grid is None or np.prod([ len(g) - 1 for g in grid ]) != self._cell_centers.shape[0]:
+            return Voronoi._nearest_cell(self, X)
+        shape, K = [], []
+        for col, g in enumerate(grid):
+            n = len(g) - 1
+            step = (g[-1] - g[0]) / float(n)
+            k = np.floor((X[:,col] - g[0]) / step).astype(int)
+            K.append(np.clip(k, 0, n - 1, out=k))
+            shape.append(n)
+        return np.ravel_multi_index(K, shape)
+
     def _postprocess(self):
         pass
 
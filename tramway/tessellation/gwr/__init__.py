@@ -94,7 +94,7 @@ class GasMesh(Voronoi):
     def tessellate(self, points, pass_count=(), residual_factor=.7, error_count_tol=5e-3, \
         min_growth=1e-4, collapse_tol=.01, stopping_criterion=0, verbose=False, \
         plot=False, alpha_risk=1e-15, grab=None, max_frames=None, max_batches=None, axes=None, \
-        complete_delaunay=False, \
+        complete_delaunay=False, batch_mode='sequential', block_size=1000, \
         **kwargs):
         """Grow the tessellation.
 
@@ -121,6 +121,12 @@ class GasMesh(Voronoi):
             alpha_risk (float): location distributions of potential neighbor cells
                 are compared with a t-test
             complete_delaunay (bool): complete the Delaunay graph
+            batch_mode (str): either *'sequential'* (default) to train the gas one point at
+                a time, or *'minibatch'* to train the gas on blocks of points;
+                the *minibatch* mode is several times faster for large datasets and grows
+                slightly different gases
+                (see :meth:`~tramway.tessellation.gwr.gas.Gas.minibatch_train`).
+            block_size (int): number of points per block in *minibatch* mode
 
         Returns:
             See :meth:`~tramway.tessellation.Tessellation.tessellate`.
@@ -153,7 +159,8 @@ class GasMesh(Voronoi):
             collapse_tol=collapse_tol, \
             stopping_criterion=stopping_criterion, \
             verbose=verbose, plot=plot, \
-            grab=grab, max_frames=max_frames, max_batches=max_batches, axes=axes)
+            grab=grab, max_frames=max_frames, max_batches=max_batches, axes=axes, \
+            batch_mode=batch_mode, block_size=block_size)
         # build alternative representation of the gas (or Delaunay graph)
         [self._cell_adjacency, V, _] = self.gas.export()
         self._cell_centers = V['weight']
@@ -312,6 +319,8 @@ setup = {
         ('max_distance', ()),
         ('min_probability', ()),
         ('pass_count', dict(type=float, help='fraction of the data to be sampled; can be greater than 1 (recommended)')),
+        ('batch_mode', dict(choices=('sequential', 'minibatch'), help="'minibatch' trains the gas faster on blocks of points (default is 'sequential')")),
+        ('block_size', dict(type=int, help="number of points per block in 'minibatch' batch mode")),
         )),
     }
 
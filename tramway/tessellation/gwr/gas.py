@@ -20,11 +20,122 @@ import numpy.linalg as la
 from .graph import *
 #from .graph.array import ArrayGraph
 import time
+from scipy.spatial import cKDTree
 from scipy.spatial.distance import cdist
 from scipy.special import gamma
 from .dichotomy import Dichotomy
 
 
+class NodeGrid(object):
+    """Uniform grid hash of the node weights, for nearest-node queries.
+
+    The grid is updated incrementally as nodes are inserted, moved or deleted.
+    Each node is bucketed in the cubic cell of edge :attr:`edge` its weight falls in.
+    The nearest nodes to a sample point are searched in rings of cells of increasing size
+    around the cell of the sample point, until no closer node can lie further away.
+
+    Buckets hold few nodes each, and the search is implemented in plain Python, as numpy calls
+    on small arrays would be dominated by their overhead.
+    """
+    __slots__ = ['edge', 'buckets', 'weight', 'key', 'rings']
+
+    def __init__(self, edge):
+        self.edge = float(edge)
+        self.buckets = {} # cell key -> list of nodes
+        self.weight = {} # node -> weight as a tuple of floats
+        self.key = {} # node -> cell key
+        self.rings = {} # (radius, dimension) -> cell offsets
+
+    def cell_key(self, w):
+        return tuple( int(x // self.edge) for x in w )
+
+    def insert(self, node, weight):
+        w = tuple(weight.tolist())
+        k = self.cell_key(w)
+        self.buckets.setdefault(k, []).append(node)
+        self.weight[node] = w
+        self.key[node] = k
+
+    def move(self, node, weight):
+        w = tuple(weight.tolist())
+        self.weight[node] = w
+        k = self.cell_key(w)
+        k0 = self.key[node]
+        if k != k0:
+            self._unbucket(node, k0)
+            self.buckets.setdefault(k, []).append(node)
+            self.key[node] = k
+
+    def remove(self, node):
+        self._unbucket(node, self.key.pop(node))
+        del self.weight[node]
+
+    def _unbucket(self, node, k):
+        bucket = self.buckets[k]
+        bucket.remove(node)
+        if not bucket:
+            del self.buckets[k]
+
+    @property
+    def size(self):
+        return len(self.weight)
+
+    def ring(self, radius, dim):
+        """Offsets of the cells at Chebyshev distance `radius` from the central cell."""
+        try:
+            return self.rings[(radius, dim)]
+        except KeyError:
+            r = np.arange(-radius, radius + 1)
+            offsets = np.stack(np.meshgrid(*[r] * dim, indexing='ij'), axis=-1).reshape(-1, dim)
+            offsets = offsets[np.max(np.abs(offsets), axis=1) == radius]
+            offsets = [ tuple(offset) for offset in offsets.tolist() ]
+            self.rings[(radius, dim)] = offsets
+            return offsets
+
+    def nearest(self, eta, k=2):
+        """Returns the `k` nodes nearest to sample point `eta` and their square distances,
+        in increasing distance order."""
+        n = self.size
+        eta = eta.tolist()
+        dim = len(eta)
+        center = self.cell_key(eta)
+        # distance from `eta` to the closest bound of its cell
+        margin = self.edge
+        for x, c in zip(eta, center):
+            lower = x - c * self.edge
+            margin = min(margin, lower, self.edge - lower)
+        weight = self.weight
+        top = [] # (square distance, node) pairs
+        count = 0
+        radius = 0
+        while True:
+            for offset in self.ring(radius, dim):
+                bucket = self.buckets.get(tuple( c + o for c, o in zip(center, offset) ))
+                if bucket:
+                    count += len(bucket)
+                    for node in bucket:
+                        d2 = 0.
+                        for x, y in zip(weight[node], eta):
+                            d2 += (x - y) * (x - y)
+                        if len(top) < k or d2 < top[-1][0]:
+                            top.append((d2, node))
+                            top.sort()
+                            del top[k:]
+            if count == n:
+                break
+            # all the nodes in the unvisited cells are further than `margin`
+            if len(top) == k and top[-1][0] <= margin * margin:
+                break
+            # the next ring would cost more than a brute-force search
+            if n < (2 * radius + 3) ** dim - (2 * radius + 1) ** dim:
+                top = sorted( (sum( (x - y) * (x - y) for x, y in zip(w, eta) ), node)
+                        for node, w in weight.items() )[:k]
+                break
+            margin += self.edge
+            radius += 1
+        return [ node for _, node in top ], [ d2 for d2, _ in top ]
+
+
 class Gas(Graph):
     """Implementation of the *Grow(ing) When Required* clustering algorithm, first inspired from
     [Marsland02]_ and then extensively modified.
@@ -46,7 +157,8 @@ class Gas(Graph):
     """
     __slots__ = ['graph', 'insertion_threshold', 'trust', 'learning_rate', \
         'habituation_threshold', 'habituation_initial', 'habituation_alpha', \
-        'habituation_tau', 'edge_lifetime', 'batch_size', 'collapse_below', 'knn']
+        'habituation_tau', 'edge_lifetime', 'batch_size', 'collapse_below', 'knn', \
+        'node_index']
 
     def connect(self, n1, n2, **kwargs):
         self.graph.connect(n1, n2, **kwargs)
@@ -56,10 +168,23 @@ class Gas(Graph):
         return self.graph.get_node_attr(n, attr)
     def set_node_attr(self, n, **kwargs):
         self.graph.set_node_attr(n, **kwargs)
+        if 'weight' in kwargs and self._node_index() is not None:
+            self.node_index.move(n, kwargs['weight'])
     def get_edge_attr(self, e, attr):
         return self.graph.get_edge_attr(e, attr)
     def set_edge_attr(self, e, **kwargs):
         self.graph.set_edge_attr(e, **kwargs)
+    def get_node_attrs(self, nodes, attr):
+        return self.graph.get_node_attrs(nodes, attr)
+    def set_node_attrs(self, nodes, **kwargs):
+        self.graph.set_node_attrs(nodes, **kwargs)
+        if 'weight' in kwargs and self._node_index() is not None:
+            for n, w in zip(nodes, kwargs['weight']):
+                self.node_index.move(n, w)
+    def get_edge_attrs(self, edges, attr):
+        return self.graph.get_edge_attrs(edges, attr)
+    def set_edge_attrs(self, edges, **kwargs):
+        self.graph.set_edge_attrs(edges, **kwargs)
     @property
     def size(self):
         return self.graph.size
@@ -74,9 +199,14 @@ class Gas(Graph):
     def has_node(self, n):
         return self.graph.has_node(n)
     def add_node(self, **kwargs):
-        return self.graph.add_node(**kwargs)
+        n = self.graph.add_node(**kwargs)
+        if self._node_index() is not None:
+            self.node_index.insert(n, self.get_weight(n))
+        return n
     def del_node(self, n):
         self.graph.del_node(n)
+        if self._node_index() is not None:
+            self.node_index.remove(n)
     def stands_alone(self, n):
         return self.graph.stands_alone(n)
     def find_edge(self, n1, n2):
@@ -89,6 +219,7 @@ class Gas(Graph):
         return self.graph.square_distance(attr, eta, **kwargs)
 
     def __init__(self, sample, graph=None):
+        self.node_index = None
         if 1 < sample.shape[0]:
             w1 = sample[0]
             w2 = sample[-1]
@@ -127,6 +258,48 @@ class Gas(Graph):
         self.collapse_below = None
         self.knn = None
 
+    def _node_index(self):
+        # gases loaded from files written before `node_index` was introduced lack the slot
+        try:
+            return self.node_index
+        except AttributeError:
+            self.node_index = None
+            return None
+
+    def index_nodes(self, min_node_count=2000, sample_size=1000):
+        """Build the spatial index (:class:`NodeGrid`) that :meth:`batch_train` uses to find
+        the nearest nodes.
+
+        Below `min_node_count` nodes, no index is built, as the vectorized exhaustive search
+        is faster.
+        The grid cells are as large as the median edge length over the edges of (at most)
+        `sample_size` nodes, or the (lower) insertion threshold if the gas has no edges.
+        As the gas grows denser, the index should be rebuilt from time to time;
+        :meth:`train` rebuilds it at each batch.
+
+        The index is maintained as long as :attr:`node_index` is set; it is not meant to be
+        saved with the gas, and :meth:`train` unsets it on completion."""
+        self.node_index = None
+        if self.size < min_node_count:
+            return
+        nodes = list(self.iter_nodes())
+        if sample_size < len(nodes):
+            nodes = nodes[::int(ceil(len(nodes) / float(sample_size)))]
+        lengths = [ la.norm(self.get_weight(n) - self.get_weight(m))
+                for n in nodes for m in self.iter_neighbors(n) ]
+        if lengths:
+            edge = np.median(lengths)
+        else:
+            edge = self.insertion_threshold
+            if isinstance(edge, tuple):
+                edge = edge[0]
+        if not edge or edge <= 0:
+            return
+        index = NodeGrid(edge)
+        for n in self.iter_nodes():
+            index.insert(n, self.get_weight(n))
+        self.node_index = index
+
     def local_insertion_threshold(self, eta, node, *vargs):
         """
         """
@@ -160,7 +333,7 @@ class Gas(Graph):
             float or array: habituation.
         """
         return self.habituation_initial - \
-            (1 - exp(-self.habituation_alpha[i] * t / self.habituation_tau[i])) / \
+            (1 - np.exp(-self.habituation_alpha[i] * t / self.habituation_tau[i])) / \
             (self.habituation_alpha[i])
 
     def habituation(self, node, i=0):
@@ -205,11 +378,14 @@ class Gas(Graph):
         self.set_edge_attr(edge, age=age)
         return age
 
-    def habituate(self, node):
+    def max_edge_age(self):
         if self.edge_lifetime < 1:
-            max_age = max(20, self.edge_lifetime * float(self.size))
+            return max(20, self.edge_lifetime * float(self.size))
         else:
-            max_age = self.edge_lifetime
+            return self.edge_lifetime
+
+    def habituate(self, node):
+        max_age = self.max_edge_age()
         self.increment_habituation(node)
         for edge, neighbor in list(self.iter_edges_from(node)):
             age = self.increment_age(edge)
@@ -238,9 +414,15 @@ class Gas(Graph):
             if radius is not None:
                 r = [radius[k]]
             # find nearest and second nearest nodes
-            dist2, index_to_node = self.square_distance('weight', eta, eta2=eta_square[k])
-            i = np.argsort(dist2)
-            dist2_min = dist2[i[0]]
+            if self._node_index() is None:
+                dist2, index_to_node = self.square_distance('weight', eta, eta2=eta_square[k])
+                i = np.argpartition(dist2, 1)[:2]
+                i = i[np.argsort(dist2[i])]
+                dist2_min = dist2[i[0]]
+                nearest, second_nearest = index_to_node(i)
+            else:
+                (nearest, second_nearest), dist2 = self.node_index.nearest(eta)
+                dist2_min = dist2[0]
             try:
                 dist_min = sqrt(dist2_min)
             except ValueError:
@@ -250,7 +432,6 @@ class Gas(Graph):
                     warnings.warn('Rounding error: negative distance', RuntimeWarning)
                 else:
                     raise ValueError('Negative distance')
-            nearest, second_nearest = index_to_node(i[:2])
             errors.append(dist_min)
             # test activity and habituation against thresholds
             activity = dist_min
@@ -283,6 +464,150 @@ class Gas(Graph):
                     self.grab_frame(grab, **grab_kwargs)
         return errors
 
+    def minibatch_train(self, sample, radius=None, block_size=1000):
+        """Mini-batch variant of :meth:`batch_train`.
+
+        The batch of data is processed in blocks of `block_size` sample points, or as many
+        points as nodes in the gas if fewer.
+        For each block, the nearest and second nearest nodes of all the points are found at
+        once, with the node weights as at the beginning of the block.
+        New nodes are inserted where required, one at a time.
+        The points that do not trigger any insertion move their nearest node and the
+        neighbors of this node; the moves are accumulated over the block, and every node
+        moves towards the mean of the points that selected it, as if these points were all
+        the same. Last, habituation counters and edge ages are incremented once per block,
+        by the number of points each node was the nearest to.
+
+        The larger the blocks, the faster the training, and the more the gas departs from
+        what :meth:`batch_train` would grow. Especially, the nodes inserted in a block are not
+        visible to the other points in the block; a point that lies within the insertion
+        threshold of such a new node is discarded instead of triggering another insertion.
+        Similarly, edges age faster within a block, except the edges between the nearest
+        and second nearest nodes, that are reset at the end of the block.
+        `block_size` should remain small compared with the number of nodes.
+        """
+        errors = []
+        l = .5 + self.trust * .5 # mixing coefficient in the range [.5, 1]
+        start = 0
+        while start < sample.shape[0]:
+            stop = start + max(2, min(block_size, self.size))
+            block = sample[start:stop]
+            # find nearest and second nearest nodes
+            nodes = np.asarray(list(self.iter_nodes()))
+            W = np.asarray(self.get_node_attrs(nodes, 'weight'), dtype=float)
+            dist, i = cKDTree(W).query(block, k=2)
+            dist_min = dist[:,0]
+            nearest, second_nearest = i[:,0], i[:,1]
+            errors += dist_min.tolist()
+            # test activity and habituation against thresholds
+            counter = self.get_node_attrs(nodes, 'habituation_counter').ravel().astype(float)
+            habituation = self.habituation_function(counter[nearest])
+            if self.knn:
+                activity_threshold = np.clip(radius[start:stop], \
+                    self.insertion_threshold[0], self.insertion_threshold[1])
+            else:
+                activity_threshold = np.full(block.shape[0], self.insertion_threshold)
+            insert = (activity_threshold < dist_min) & \
+                (habituation < self.habituation_threshold)
+            discard = np.zeros_like(insert)
+            # insert new nodes and connect them with the two nearest nodes
+            new_weights = []
+            for k in np.flatnonzero(insert):
+                eta = block[k]
+                if new_weights and np.min(np.sum((np.vstack(new_weights) - eta) ** 2, axis=1)) \
+                        <= activity_threshold[k] * activity_threshold[k]:
+                    discard[k] = True
+                    continue
+                n1, n2 = nodes[nearest[k]], nodes[second_nearest[k]]
+                self.disconnect(n1, n2)
+                w = (1.0 - l) * W[nearest[k]] + l * eta
+                new_node = self.add_node(weight=w)
+                new_weights.append(w)
+                if self.knn:
+                    self.set_node_attr(new_node, radius=activity_threshold[k])
+                self.connect(new_node, n1)
+                self.connect(new_node, n2)
+            insert &= ~discard
+            move = ~insert & ~discard
+            # connect the nearest and second nearest nodes
+            pairs = set(zip(nodes[nearest[move]].tolist(), nodes[second_nearest[move]].tolist()))
+            for n1, n2 in pairs:
+                self.connect(n1, n2)
+            # move the nearest nodes and their neighbors towards the mean sample points
+            if np.any(move):
+                winners, j, count = np.unique(nearest[move], \
+                    return_inverse=True, return_counts=True)
+                mean = np.zeros((winners.size, W.shape[1]))
+                np.add.at(mean, j, block[move])
+                mean /= count[:,np.newaxis]
+                src, dst = [], []
+                for a, u in enumerate(nodes[winners].tolist()):
+                    neighbors = list(self.iter_neighbors(u))
+                    src += [a] * len(neighbors)
+                    dst += neighbors
+                src, dst = np.asarray(src, dtype=int), np.asarray(dst, dtype=int)
+                # nodes inserted in the block are not moved
+                position = np.full(max(nodes.max(), dst.max() if dst.size else 0) + 1, -1)
+                position[nodes] = np.arange(nodes.size)
+                dst = position[dst]
+                src, dst = src[0 <= dst], dst[0 <= dst]
+                # `count` successive moves towards the same point with rate `rate` add up to
+                # a single move with rate `1 - (1 - rate) ** count`
+                rate = self.learning_rate[0] * self.habituation_function(counter[winners])
+                rate = 1. - (1. - rate) ** count
+                dW = np.zeros_like(W)
+                dW[winners] = rate[:,np.newaxis] * (mean - W[winners])
+                rate = self.learning_rate[1] * self.habituation_function(counter[dst], 1)
+                rate = 1. - (1. - rate) ** count[src]
+                np.add.at(dW, dst, rate[:,np.newaxis] * (mean[src] - W[dst]))
+                moved = np.union1d(winners, dst)
+                self.set_node_attrs(nodes[moved], weight=W[moved] + dW[moved])
+            # update habituation counters
+            self.batch_habituate(nodes[nearest[~discard]])
+            # reset the age of the edges between the nearest and second nearest nodes
+            for n1, n2 in pairs:
+                if self.has_node(n1) and self.has_node(n2):
+                    self.connect(n1, n2, age=1)
+            start = stop
+        return errors
+
+    def batch_habituate(self, nodes):
+        """Habituates every node in `nodes` (with repetitions) at once, as would successive
+        calls to :meth:`habituate` with no edge age reset in between."""
+        max_age = self.max_edge_age()
+        winners, count = np.unique(nodes, return_counts=True)
+        winners = winners.tolist()
+        src, edges, neighbors = [], [], []
+        for a, u in enumerate(winners):
+            for e, v in self.iter_edges_from(u):
+                src.append(a)
+                edges.append(e)
+                neighbors.append(v)
+        # habituation counters of the nearest nodes and their neighbors
+        habituated, j = np.unique(np.r_[winners, neighbors].astype(int), return_inverse=True)
+        increment = np.bincount(j, weights=np.r_[count, count[src]])
+        counter = self.get_node_attrs(habituated, 'habituation_counter').ravel()
+        self.set_node_attrs(habituated, \
+            habituation_counter=counter + increment.astype(counter.dtype))
+        if not edges:
+            expired = []
+        else:
+            # an edge between two nearest nodes ages twice
+            edges, j = np.unique(edges, return_inverse=True)
+            age = self.get_edge_attrs(edges, 'age').ravel()
+            age = age + np.bincount(j, weights=count[src]).astype(age.dtype)
+            self.set_edge_attrs(edges, age=age)
+            expired = np.flatnonzero(max_age < age[j])
+        for k in expired:
+            u, v = winners[src[k]], neighbors[k]
+            if self.has_node(u) and self.has_node(v) and self.are_connected(u, v):
+                self.disconnect(u, v)
+                if self.stands_alone(v):
+                    self.del_node(v)
+        for u in winners:
+            if self.has_node(u) and self.stands_alone(u):
+                self.del_node(u)
+
     def grab_frame(self, grab, axes=None, color='r', **kwargs):
         assert axes is not None
         xlim = axes.get_xlim()
@@ -326,13 +651,16 @@ class Gas(Graph):
 
     def train(self, sample, pass_count=None, residual_max=None, error_count_tol=1e-6, \
         min_growth=None, collapse_tol=None, stopping_criterion=2, verbose=False, \
-        plot=False, grab=None, **kwargs):
+        plot=False, grab=None, batch_mode='sequential', block_size=1000, **kwargs):
         """
         Grow the gas.
 
         :meth:`train` splits the sample into batches, successively calls :meth:`batch_train`
-        on these batches of data, collapses the gas if necessary and stops if stopping criteria
-        are met.
+        (or :meth:`minibatch_train` if `batch_mode` is ``'minibatch'``) on these batches of
+        data, collapses the gas if necessary and stops if stopping criteria are met.
+
+        `block_size` is the number of sample points per block in *minibatch* mode;
+        see :meth:`minibatch_train` for the accuracy/speed trade-off.
 
         The input arguments that define the stopping criteria are:
 
@@ -366,6 +694,11 @@ class Gas(Graph):
 
         """
         ## TODO: clarify the code
+        if batch_mode not in ('sequential', 'minibatch'):
+            raise ValueError("unsupported batch mode: '{}'".format(batch_mode))
+        minibatch = batch_mode == 'minibatch'
+        if minibatch and grab is not None:
+            raise ValueError('cannot grab frames in minibatch mode')
         n = sample.shape[0]
         l = 0 # node count
         residuals = []
@@ -397,92 +730,101 @@ class Gas(Graph):
                 raise ValueError('cannot grab data that are not 2D')
             max_frames = kwargs.get('max_frames', None)
             max_batches = kwargs.get('max_batches', None)
-        # loop
-        t = []
-        i = 0
-        do = True
-        while do:
-            i += 1
-            if verbose:
-                t0 = time.time()
-            batch = np.random.choice(n, size=self.batch_size)
-            # grab
-            if grab is not None:
-                if max_batches is None or i <= max_batches:
-                    batch_kwargs.update(self.grab_batch_init(grab, sample, i, batch, **kwargs))
-                    if 1 < i and \
-                            (max_frames is None or \
-                                (max_batches is not None and \
-                                    max_frames <= (i-1)*self.batch_size)):
+        try:
+            # loop
+            t = []
+            i = 0
+            do = True
+            while do:
+                i += 1
+                if verbose:
+                    t0 = time.time()
+                batch = np.random.choice(n, size=self.batch_size)
+                # spatial index of the nodes, with cells adjusted to the current node spacing
+                if not minibatch:
+                    self.index_nodes()
+                # grab
+                if grab is not None:
+                    if max_batches is None or i <= max_batches:
+                        batch_kwargs.update(self.grab_batch_init(grab, sample, i, batch, **kwargs))
+                        if 1 < i and \
+                                (max_frames is None or \
+                                    (max_batches is not None and \
+                                        max_frames <= (i-1)*self.batch_size)):
+                            batch_kwargs = {}
+                    else:
                         batch_kwargs = {}
+                #
+                if minibatch:
+                    r = self.minibatch_train(sample[batch], \
+                        radius[batch] if self.knn else None, block_size)
+                elif self.knn:
+                    r = self.batch_train(sample[batch], eta_square[batch], radius[batch], **batch_kwargs)
                 else:
-                    batch_kwargs = {}
-            #
-            if self.knn:
-                r = self.batch_train(sample[batch], eta_square[batch], radius[batch], **batch_kwargs)
-            else:
-                r = self.batch_train(sample[batch], **batch_kwargs)
-            residuals += r
-            l_prev = l
-            l = self.size
-            txt = l
-            if self.collapse_below:
-                self.collapse()
-                dl = l - self.size
-                if verbose and 0 < dl:
-                    txt = '{} (-{})'.format(l, dl)
-            if verbose:
-                if i is 1:
-                    if self.collapse_below:
-                        print("\t#nodes (-#collapsed)")
-                    else:   print("\t#nodes")
-                ti = time.time() - t0
-                t.append(ti)
-                print("{}\t{}\tElapsed: {:.0f} ms".format(i, txt, ti * 1e3))
-            # enforce some stopping or continuing conditions
-            if pass_count:
-                k = i * self.batch_size
-                if pass_count[0] and k < pass_count[0] * k1:
-                    #print(('pass_count', k, pass_count[0] * k1))
-                    continue
-                elif pass_count[1] and pass_count[1] * k1 <= k:
-                    if verbose:
-                        print('stopping criterion: upper bound for `pass_count` reached')
-                    break # do = False
-            if residual_max:
-                error_count = len([ residual for residual in r
-                        if residual_max < residual ])
-                if error_count_tol < error_count:
-                    #print(('error_count_tol', error_count_tol, error_count))
-                    continue
-            if min_growth is not None:
-                growth = float(l - l_prev) / float(l_prev)
-                if growth < min_growth:
-                    if verbose:
-                        print('stopping criterion: relative growth: {:.0f}%'.format(growth * 100))
-                    break
-            if self.collapse_below and collapse_tol:
-                collapse_rel = float(dl) / float(l)
-                if collapse_tol < collapse_rel:
-                    if verbose:
-                        print('stopping criterion: relative collapse: {:.0f}%'.format(collapse_rel * 100))
-                    break
-            # exclusive criteria
-            if stopping_criterion is 1:
-                regression = sm.OLS(np.array(r), \
-                        sm.add_constant(np.linspace(0,1,len(r)))\
-                    ).fit()
-                if 0 < regression.params[1]:
-                    fit = 0
-                else:
-                    fit = 1/(1+exp((.1-regression.pvalues[1])/.01)) # invert p-value
-                do = tolerance < fit
-            elif stopping_criterion is 2:
-                residual_prev = residual_mean
-                #_, r = self.eval(sample[np.random.choice(n, size=self.validation_batch_size),:])
-                residual_mean = np.mean(r)
-                residual_std  = np.std(r)
-                do = (residual_mean - residual_prev) / residual_std < 0
+                    r = self.batch_train(sample[batch], **batch_kwargs)
+                residuals += r
+                l_prev = l
+                l = self.size
+                txt = l
+                if self.collapse_below:
+                    self.collapse()
+                    dl = l - self.size
+                    if verbose and 0 < dl:
+                        txt = '{} (-{})'.format(l, dl)
+                if verbose:
+                    if i is 1:
+                        if self.collapse_below:
+                            print("\t#nodes (-#collapsed)")
+                        else:   print("\t#nodes")
+                    ti = time.time() - t0
+                    t.append(ti)
+                    print("{}\t{}\tElapsed: {:.0f} ms".format(i, txt, ti * 1e3))
+                # enforce some stopping or continuing conditions
+                if pass_count:
+                    k = i * self.batch_size
+                    if pass_count[0] and k < pass_count[0] * k1:
+                        #print(('pass_count', k, pass_count[0] * k1))
+                        continue
+                    elif pass_count[1] and pass_count[1] * k1 <= k:
+                        if verbose:
+                            print('stopping criterion: upper bound for `pass_count` reached')
+                        break # do = False
+                if residual_max:
+                    error_count = len([ residual for residual in r
+                            if residual_max < residual ])
+                    if error_count_tol < error_count:
+                        #print(('error_count_tol', error_count_tol, error_count))
+                        continue
+                if min_growth is not None:
+                    growth = float(l - l_prev) / float(l_prev)
+                    if growth < min_growth:
+                        if verbose:
+                            print('stopping criterion: relative growth: {:.0f}%'.format(growth * 100))
+                        break
+                if self.collapse_below and collapse_tol:
+                    collapse_rel = float(dl) / float(l)
+                    if collapse_tol < collapse_rel:
+                        if verbose:
+                            print('stopping criterion: relative collapse: {:.0f}%'.format(collapse_rel * 100))
+                        break
+                # exclusive criteria
+                if stopping_criterion is 1:
+                    regression = sm.OLS(np.array(r), \
+                            sm.add_constant(np.linspace(0,1,len(r)))\
+                        ).fit()
+                    if 0 < regression.params[1]:
+                        fit = 0
+                    else:
+                        fit = 1/(1+exp((.1-regression.pvalues[1])/.01)) # invert p-value
+                    do = tolerance < fit
+                elif stopping_criterion is 2:
+                    residual_prev = residual_mean
+                    #_, r = self.eval(sample[np.random.choice(n, size=self.validation_batch_size),:])
+                    residual_mean = np.mean(r)
+                    residual_std  = np.std(r)
+                    do = (residual_mean - residual_prev) / residual_std < 0
+        finally:
+            self.node_index = None
         if verbose:
             t = np.asarray(t)
             print('Elapsed:  mean: {:.0f} ms  std: {:.0f} ms'.format(np.mean(t) * 1e3, \
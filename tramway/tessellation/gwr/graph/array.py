@@ -148,6 +148,37 @@ class ArrayGraph(Graph):
                 self.edges[attr][e] = val
             else: raise EdgeAttributeError(attr)
 
+    def get_node_attrs(self, nodes, attr):
+        """Does not check for node existence."""
+        try:
+            return self.nodes[attr][nodes]
+        except KeyError:
+            raise NodeAttributeError(attr)
+
+    def set_node_attrs(self, nodes, **kwargs):
+        """Does not check for node existence."""
+        for attr, val in kwargs.items():
+            if attr in self.nodes:
+                val = np.reshape(val, (len(nodes), -1))
+                self.nodes[attr][nodes] = val
+                if attr in self._fast_node:
+                    self._fast_node[attr][nodes] = np.sum(val * val, axis=1)
+            else: raise NodeAttributeError(attr)
+
+    def get_edge_attrs(self, edges, attr):
+        """Does not check for edge existence."""
+        try:
+            return self.edges[attr][edges]
+        except KeyError:
+            raise EdgeAttributeError(attr)
+
+    def set_edge_attrs(self, edges, **kwargs):
+        """Does not check for edge existence."""
+        for attr, val in kwargs.items():
+            if attr in self.edges:
+                self.edges[attr][edges] = np.reshape(val, (len(edges), -1))
+            else: raise EdgeAttributeError(attr)
+
     def iter_edges(self):
         """Potentially inefficient."""
         return [e - 1 for e in set(itertools.chain(self.adjacency.data))]
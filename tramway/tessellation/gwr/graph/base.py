@@ -12,6 +12,7 @@
 # knowledge of the CeCILL license and that you accept its terms.
 
 
+import numpy as np
 import scipy.sparse as sparse
 from .exception import *
 
@@ -39,6 +40,24 @@ class Graph(object):
         raise AbstractGraphError
     def set_edge_attr(self, e, **kwargs):
         raise AbstractGraphError
+    def get_node_attrs(self, nodes, attr):
+        '''Returns the values of attribute `attr` of several nodes, as an array with a row
+        per node.'''
+        return np.vstack([ np.atleast_1d(self.get_node_attr(n, attr)) for n in nodes ])
+    def set_node_attrs(self, nodes, **kwargs):
+        '''Sets attributes of several nodes; values are arrays with a row per node.'''
+        for attr, values in kwargs.items():
+            for n, val in zip(nodes, values):
+                self.set_node_attr(n, **{attr: val})
+    def get_edge_attrs(self, edges, attr):
+        '''Returns the values of attribute `attr` of several edges, as an array with a row
+        per edge.'''
+        return np.vstack([ np.atleast_1d(self.get_edge_attr(e, attr)) for e in edges ])
+    def set_edge_attrs(self, edges, **kwargs):
+        '''Sets attributes of several edges; values are arrays with a row per edge.'''
+        for attr, values in kwargs.items():
+            for e, val in zip(edges, values):
+                self.set_edge_attr(e, **{attr: val})
     @property
     def size(self):
         return len(list(self.iter_nodes))
@@ -62,6 +62,7 @@ class HexagonalMesh(Voronoi):
         self.avg_distance = avg_distance
 
     def tessellate(self, points, **kwargs):
+        self.hexagon_radius = self.hexagon_count = None
         if isinstance(points, pd.DataFrame):
             points = points.copy()
         points = self._preprocess(points)
@@ -175,6 +176,44 @@ class HexagonalMesh(Voronoi):
         Voronoi._preprocess(self, points) # initialize `scaler`
         return points # ... but do not scale
 
+    def _nearest_cell(self, X):
+        # the centers make a triangular lattice with basis (2r, 0) and (r, sqrt(3) r)
+        # in the frame of the first cell, with r the hexagon radius;
+        # the fractional lattice coordinates are rounded in cube coordinates
+        hex_radius = getattr(self, 'hexagon_radius', None)
+        hex_count = getattr(self, 'hexagon_count', None)
+        if hex_radius is None or hex_count is None:
+            return Voronoi._nearest_cell(self, X)
+        m, n = hex_count
+        n_cells = (n + 1) // 2 * (m + 1) + n // 2 * m
+        if n_cells != self._cell_centers.shape[0]:
+            return Voronoi._nearest_cell(self, X)
+        Y = X - self._cell_centers[[0]]
+        if self.tilt:
+            theta = self.tilt * pi / 6.
+            s, c = sin(-theta), cos(-theta)
+            Y = np.dot(Y, np.array([[c, -s], [s, c]]).T)
+        dy = 2. * hex_radius * cos(pi/6.)
+        r = Y[:,1] / dy
+        q = (Y[:,0] - hex_radius * r) / (2. * hex_radius)
+        s = -q - r
+        _q, _r, _s = np.round(q), np.round(r), np.round(s)
+        dq, dr, ds = np.abs(_q - q), np.abs(_r - r), np.abs(_s - s)
+        fix_q = (dr < dq) & (ds < dq)
+        fix_r = ~fix_q & (ds < dr)
+        _q[fix_q] = -_r[fix_q] - _s[fix_q]
+        _r[fix_r] = -_q[fix_r] - _s[fix_r]
+        # row and column indices
+        k = _r.astype(int)
+        j = _q.astype(int) + k // 2
+        row_length = m + 1 - k % 2
+        K = (k + 1) // 2 * (m + 1) + k // 2 * m + j
+        # points the nearest lattice node of which is not a cell center
+        outside = (k < 0) | (n <= k) | (j < 0) | (row_length <= j)
+        if np.any(outside):
+            K[outside] = Voronoi._nearest_cell(self, X[outside])
+        return K
+
     # cell_centers property
     @property
     def cell_centers(self):
@@ -20,6 +20,7 @@ import pandas as pd
 from threading import Lock
 import itertools
 import scipy.sparse as sparse
+from scipy.spatial import cKDTree
 from scipy.spatial.distance import cdist
 from .dichotomy import ConnectedDichotomy
 from collections import OrderedDict
@@ -41,6 +42,12 @@ class KDTreeMesh(Voronoi):
             and the level increments each time the cell size doubles.
         _min_distance (float, private): scaled minimum distance between neighbor cell centers.
         _avg_distance (float, private): scaled average distance between neighbor cell centers.
+        tree_origin (numpy.ndarray): scaled lower corner of the root hypercube.
+        tree_unit (float): scaled edge length of the smallest possible cells.
+        tree_depth (int): depth of the tree.
+        tree_children (numpy.ndarray): array representation of the tree, with a row per
+            internal node and a column per child; positive values are node indices,
+            negative values -i-1 are cell indices i.
     """
     def __init__(self, scaler=None, min_distance=None, avg_distance=None, \
         min_probability=None, max_probability=None, max_level=None, **kwargs):
@@ -52,57 +59,133 @@ class KDTreeMesh(Voronoi):
             max_probability = 10.0 * min_probability
         self.max_probability = max_probability
         self.max_level = max_level
+        self.tree_origin = None
+        self.tree_unit = None
+        self.tree_depth = None
+        self.tree_children = None
 
     def cell_index(self, points, format=None, select=None, knn=None,
         min_location_count=None, metric='chebyshev', filter=None,
         filter_descriptors_only=False, **kwargs):
+        """
+        See :meth:`~tramway.tessellation.base.Delaunay.cell_index`.
+
+        With the default *chebyshev* metric, each point is assigned to the cell that contains
+        it, as located by descending the tree of the dichotomy (see :meth:`locate`).
+        The `knn` nearest neighbours of the cell centers are also taken in the *chebyshev*
+        sense.
+        Other metrics fall back onto the nearest-center assignment of
+        :meth:`~tramway.tessellation.base.Delaunay.cell_index`.
+        """
+        if metric != 'chebyshev':
+            return Delaunay.cell_index(self, points, format=format, select=select, knn=knn,
+                min_location_count=min_location_count, metric=metric, filter=filter,
+                filter_descriptors_only=filter_descriptors_only, **kwargs)
         if isinstance(knn, tuple):
             min_nn, max_nn = knn
         else:
             min_nn, max_nn = knn, None
         if format == 'force array':
             min_nn = None
-        #if max_nn: # valid only if points are those the tessellation was grown with
-        #       max_location_count = int(floor(self.max_probability * points.shape[0]))
-        #       if max_nn < max_location_count:
-        #           max_nn = None
-        if metric == 'chebyshev':
-            if min_nn or max_nn:
-                raise NotImplementedError('knn support has evolved and KDTreeMesh still lacks a proper support for it. You can still call cell_index with argument metric=\'euclidean\'')
-            # TODO: pass relevant kwargs to cdist
-            points = self.scaler.scale_point(points, inplace=False)
-            X = self.descriptors(points, asarray=True)
-            D = cdist(X, self._cell_centers, metric) # , **kwargs
-            I, J = np.nonzero(D <= self.reference_length)
-            if min_location_count or filter is not None:
-                K, count = np.unique(J, return_counts=True)
+            format = 'array' # for :func:`format_cell_index`
+        points = self.scaler.scale_point(points, inplace=False)
+        X = self.descriptors(points, asarray=True)
+        Y = self._cell_centers
+        ncells = Y.shape[0]
+        K = self.locate(X)
+        if min_location_count or filter is not None or min_nn or max_nn:
+            # group the points by cell once for all
+            _order = np.argsort(K, kind='mergesort')
+            _bounds = np.searchsorted(K[_order], np.arange(ncells + 1))
+            def members(c):
+                cell = _order[_bounds[c]:_bounds[c+1]]
+                return cell[K[cell] == c]
+            def distance(cell, c):
+                return np.max(np.abs(X[cell] - Y[[c]]), axis=1)
+            nonempty, count = np.unique(K[0 <= K], return_counts=True)
+            if min_location_count:
+                for c in nonempty[count < min_location_count]:
+                    K[members(c)] = -1
+                nonempty = nonempty[min_location_count <= count]
+            if filter is not None:
+                for c in nonempty:
+                    cell = members(c)
+                    if filter_descriptors_only:
+                        x = X[cell]
+                    elif isinstance(points, (pd.Series, pd.DataFrame)):
+                        x = points.iloc[cell]
+                    else:
+                        x = points[cell]
+                    if not filter(self, c, x):
+                        K[cell] = -1
+            if max_nn:
+                for c in nonempty:
+                    cell = members(c)
+                    if max_nn < cell.size:
+                        K[cell[np.argsort(distance(cell, c))[max_nn:]]] = -1
+            if min_nn:
+                count = np.bincount(K[0 <= K], minlength=ncells)
                 if min_location_count:
-                    for k in K[count < min_location_count]:
-                        J[J == k] = -1
-                if filter is not None:
-                    if min_location_count:
-                        K = K[min_location_count <= K]
-                    for k in K:
-                        cell = J == k
-                        if filter_descriptors_only:
-                            x = X[cell]
-                        else:
-                            x = points[cell]
-                        if not filter(self, k, x):
-                            J[cell] = -1
-
-            if I[0] == 0 and I.size == points.shape[0] and I[-1] == points.shape[0] - 1:
-                K = J
-            else:
-                K = -np.ones(points.shape[0], dtype=J.dtype)
-                K[I] = J
-            if format == 'force array':
-                format = 'array' # for :func:`format_cell_index`
-            return format_cell_index(K, format=format, select=select,
-                shape=(points.shape[0], self.cell_adjacency.shape[0]))
-        else:
-            return Delaunay.cell_index(self, points, format=format, select=select, knn=knn,
-                min_location_count=min_location_count, metric=metric, **kwargs)
+                    # the excluded cells do not get points back
+                    small = np.zeros(ncells, dtype=bool)
+                    small[nonempty] = True
+                    small &= count < min_nn
+                else:
+                    small = count < min_nn
+                if np.any(small):
+                    small, = small.nonzero()
+                    k = min(min_nn, X.shape[0])
+                    _, I = cKDTree(X).query(Y[small], k=k, p=np.inf)
+                    I = np.reshape(I, (small.size, k))
+                    Ic, = (0 <= K).nonzero()
+                    Ic = Ic[~np.isin(K[Ic], small)]
+                    K = (np.concatenate((I.flatten(), Ic)),
+                        np.concatenate((np.repeat(small, k), K[Ic])))
+        return format_cell_index(K, format=format, select=select,
+            shape=(points.shape[0], ncells))
+
+    def locate(self, X):
+        """
+        Index of the cell that contains each point.
+
+        Arguments:
+
+            X (numpy.ndarray): scaled point coordinates.
+
+        Returns:
+
+            numpy.ndarray: cell indices, with ``-1`` for the points beyond the bounds.
+
+        """
+        tree = getattr(self, 'tree_children', None)
+        if tree is None:
+            # tessellations grown with earlier versions
+            D = cdist(X, self._cell_centers, 'chebyshev')
+            I, J = np.nonzero(D <= self.reference_length)
+            K = np.full(X.shape[0], -1, dtype=int)
+            K[I] = J
+            return K
+        depth = self.tree_depth
+        size = 2 ** depth
+        rel = (X - self.tree_origin) / self.tree_unit
+        inside = np.all((0 <= rel) & (rel <= size), axis=1)
+        K = np.full(X.shape[0], -1, dtype=int)
+        if tree.shape[0] == 0: # single cell
+            K[inside] = 0
+            return K
+        I, = inside.nonzero()
+        u = np.clip(np.floor(rel[I]).astype(int), 0, size - 1)
+        weights = 2 ** np.arange(X.shape[1])
+        node = np.zeros(I.size, dtype=int)
+        for level in range(depth):
+            node = tree[node, np.dot((u >> (depth - level - 1)) & 1, weights)]
+            leaf = node < 0
+            K[I[leaf]] = -node[leaf] - 1
+            descend = 0 < node
+            if not np.any(descend):
+                break
+            I, u, node = I[descend], u[descend], node[descend]
+        return K
 
     def tessellate(self, points, **kwargs):
         init = self.scaler.init
@@ -176,8 +259,40 @@ class KDTreeMesh(Voronoi):
             for i in range(n) }
         # for `cell_index` even after call to `freeze`
         self.reference_length = self.dichotomy.reference_length[level[np.newaxis,:] + 1]
+        self._grow_tree(origin, level)
         #self._postprocess()
 
+    def _grow_tree(self, origin, level):
+        # array representation of the dichotomy, for `locate`;
+        # the cells are described on an integer grid with the smallest cells as units;
+        # each row of `tree_children` is an internal node of the tree and each column
+        # a child hypercube; positive values refer to internal nodes (the root node 0
+        # is nobody's child) and negative values -i-1 refer to cells i
+        depth = int(level.max())
+        unit = self.dichotomy.reference_length[depth]
+        root = self.dichotomy.origin
+        dim = origin.shape[1]
+        weights = 2 ** np.arange(dim)
+        u = np.round((origin - root) / unit).astype(int)
+        tree = []
+        if 0 < depth:
+            tree.append(np.zeros(2 ** dim, dtype=int))
+        for i in range(origin.shape[0]):
+            node = 0
+            for l in range(level[i]):
+                child = np.dot((u[i] >> (depth - l - 1)) & 1, weights)
+                if l + 1 == level[i]:
+                    tree[node][child] = -i - 1
+                else:
+                    if tree[node][child] == 0:
+                        tree[node][child] = len(tree)
+                        tree.append(np.zeros(2 ** dim, dtype=int))
+                    node = tree[node][child]
+        self.tree_origin = np.asarray(root, dtype=float)
+        self.tree_unit = float(unit)
+        self.tree_depth = depth
+        self.tree_children = np.vstack(tree) if tree else np.zeros((0, 2 ** dim), dtype=int)
+
     def _postprocess(self):
         pass
 
@@ -20,8 +20,137 @@ import numpy as np
 import pandas as pd
 import scipy.sparse as sparse
 from scipy.cluster.vq import kmeans, kmeans2
+from scipy.spatial import cKDTree
 from scipy.spatial.distance import cdist
 from collections import OrderedDict
+from functools import partial
+from tramway.core.parallel import ItemPool
+
+
+def _lloyd_chunk(centers, chunk):
+    dist, assignment = cKDTree(centers).query(chunk)
+    k = centers.shape[0]
+    count = np.bincount(assignment, minlength=k)
+    total = np.column_stack([ np.bincount(assignment, weights=chunk[:,j], minlength=k)
+            for j in range(chunk.shape[1]) ])
+    return total, count, np.sum(dist)
+
+
+def lloyd_kmeans(points, centers, shift_tol=1e-3, max_iter=300, worker_count=None,
+        chunk_size=100000):
+    """
+    k-means clustering with Lloyd iterations.
+
+    At each iteration, the points are assigned to their nearest centers with a KD-tree
+    of the centers, by chunks of `chunk_size` points, in parallel processes
+    (:class:`~tramway.core.parallel.ItemPool`).
+    The iterations stop as soon as no center moves by more than `shift_tol` times the average
+    distance between the points and their nearest centers, or after `max_iter` iterations.
+
+    Like :func:`scipy.cluster.vq.kmeans`, the centers that are assigned no points are discarded.
+
+    Arguments:
+
+        points (numpy.ndarray): point coordinates.
+
+        centers (numpy.ndarray): initial centers.
+
+        shift_tol (float): relative tolerance on the largest center shift.
+
+        max_iter (int): maximum number of iterations.
+
+        worker_count (int): number of simultaneously working processes;
+            default is :func:`multiprocessing.cpu_count`;
+            see also :class:`~tramway.core.parallel.ItemPool`.
+
+        chunk_size (int): number of points per chunk.
+
+    Returns:
+
+        tuple: array of centers and average distance between the points and their nearest
+        centers.
+
+    """
+    points = np.asarray(points, dtype=float)
+    centers = np.array(centers, dtype=float)
+    n = points.shape[0]
+    chunks = [ points[start:start+chunk_size] for start in range(0, n, chunk_size) ]
+    # the chunks are handed over to the worker processes once, and the workers receive
+    # only the centers and the chunk indices afterwards
+    with ItemPool(chunks, worker_count) as pool:
+        for _ in range(max_iter):
+            results = pool.map(partial(_lloyd_chunk, centers))
+            total = sum( r[0] for r in results )
+            count = sum( r[1] for r in results )
+            distortion = sum( r[2] for r in results ) / float(n)
+            assigned = 0 < count
+            new_centers = total[assigned] / count[assigned,np.newaxis]
+            shift = np.sqrt(np.max(np.sum((new_centers - centers[assigned]) ** 2, axis=1)))
+            centers = new_centers
+            if shift <= shift_tol * distortion:
+                break
+    return centers, distortion
+
+
+def minibatch_kmeans(points, centers, batch_size=None, shift_tol=1e-3, max_iter=1000):
+    """
+    Mini-batch k-means clustering, after [Sculley10]_.
+
+    .. [Sculley10] Sculley, D. (2010). Web-scale k-means clustering. Proceedings of the 19th
+        International Conference on World Wide Web, 1177-1178. doi:10.1145/1772690.1772862
+
+    At each iteration, a random batch of `batch_size` points is assigned to the nearest centers
+    with a KD-tree of the centers, and each center moves towards the running average of all
+    the points it was assigned so far.
+    The iterations stop as soon as no center moves by more than `shift_tol` times the average
+    distance between the points of the batch and their nearest centers, or after `max_iter`
+    iterations.
+    As a consequence, each center sees about ``1 / shift_tol`` points.
+
+    The centers that are assigned no points are discarded.
+
+    Arguments:
+
+        points (numpy.ndarray): point coordinates.
+
+        centers (numpy.ndarray): initial centers.
+
+        batch_size (int): number of points per batch; default is 10 times the number of
+            centers, and at least 1000.
+
+        shift_tol (float): relative tolerance on the largest center shift.
+
+        max_iter (int): maximum number of iterations (batches).
+
+    Returns:
+
+        tuple: array of centers and average distance between the points of the last batch
+        and their nearest centers.
+
+    """
+    points = np.asarray(points, dtype=float)
+    centers = np.array(centers, dtype=float)
+    n = points.shape[0]
+    k = centers.shape[0]
+    if batch_size is None:
+        batch_size = max(1000, 10 * k)
+    seen = np.zeros(k, dtype=int)
+    for _ in range(max_iter):
+        batch = points[np.random.randint(n, size=batch_size)]
+        dist, assignment = cKDTree(centers).query(batch)
+        count = np.bincount(assignment, minlength=k)
+        total = np.column_stack([ np.bincount(assignment, weights=batch[:,j], minlength=k)
+                for j in range(batch.shape[1]) ])
+        assigned = 0 < count
+        seen[assigned] += count[assigned]
+        # per-center learning rate: inverse of the number of points seen so far
+        shift = (total[assigned] - count[assigned,np.newaxis] * centers[assigned]) / \
+            seen[assigned,np.newaxis]
+        centers[assigned] += shift
+        distortion = np.mean(dist)
+        if np.sqrt(np.max(np.sum(shift * shift, axis=1))) <= shift_tol * distortion:
+            break
+    return centers[0 < seen], distortion
 
 
 class KMeansMesh(Voronoi):
@@ -90,7 +219,8 @@ class KMeansMesh(Voronoi):
         self.roi_subset_count = 10
         return points
 
-    def tessellate(self, points, tol=1e-6, prune=2.5, plot=False, **kwargs):
+    def tessellate(self, points, tol=1e-6, prune=2.5, plot=False, engine='scipy', \
+        shift_tol=1e-3, max_iter=None, batch_size=None, worker_count=None, **kwargs):
         """Grow the tessellation.
 
         Attributes:
@@ -100,10 +230,29 @@ class KMeansMesh(Voronoi):
             prune (bool or float): prunes the Voronoi and removes the edges which length
                 is greater than `prune` times the median edge length;
                 ``True`` is translated to the default value.
+            engine (str): k-means implementation; either *'scipy'*
+                (:func:`scipy.cluster.vq.kmeans`; default), *'lloyd'* (:func:`lloyd_kmeans`;
+                parallel) or *'minibatch'* (:func:`minibatch_kmeans`; fastest on large
+                datasets).
+            shift_tol (float): relative tolerance on the largest center shift, for early
+                stopping with the *lloyd* and *minibatch* engines.
+            max_iter (int): maximum number of iterations with the *lloyd* and *minibatch*
+                engines.
+            batch_size (int): number of points per batch with the *minibatch* engine.
+            worker_count (int): number of processes with the *lloyd* engine.
         """
         points = self._preprocess(points, **kwargs)
-        self._cell_centers, _ = kmeans(np.asarray(points), self._cell_centers, \
-            thresh=tol)
+        if engine == 'scipy':
+            self._cell_centers, _ = kmeans(np.asarray(points), self._cell_centers, \
+                thresh=tol)
+        elif engine == 'lloyd':
+            self._cell_centers, _ = lloyd_kmeans(points, self._cell_centers, \
+                shift_tol=shift_tol, max_iter=max_iter or 300, worker_count=worker_count)
+        elif engine == 'minibatch':
+            self._cell_centers, _ = minibatch_kmeans(points, self._cell_centers, \
+                batch_size=batch_size, shift_tol=shift_tol, max_iter=max_iter or 1000)
+        else:
+            raise ValueError("unsupported k-means engine: '{}'".format(engine))
 
         if prune: # inter-center-distance-based pruning
             if prune is True: # backward compatibility
@@ -146,8 +295,13 @@ setup = {
         ('avg_probability', ()),
         ('avg_location_count', dict(args=('-c', '--location-count'), kwargs=dict(type=int, default=80, help='average number of locations per cell'), translate=True)),
         ('metric', dict(parse=_metric)),
+        ('engine', dict(choices=('scipy', 'lloyd', 'minibatch'), help="k-means implementation (default is 'scipy')")),
+        ('shift_tol', dict(type=float, help="relative tolerance on the center shift with the 'lloyd' and 'minibatch' engines")),
+        ('max_iter', dict(type=int, help="maximum number of iterations with the 'lloyd' and 'minibatch' engines")),
+        ('batch_size', dict(type=int, help="number of points per batch with the 'minibatch' engine")),
+        ('worker_count', dict(type=int, help="number of parallel processes with the 'lloyd' engine")),
         )),
     }
 
-__all__ = ['KMeansMesh', 'setup']
+__all__ = ['KMeansMesh', 'lloyd_kmeans', 'minibatch_kmeans', 'setup']
 
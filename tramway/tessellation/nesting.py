@@ -33,10 +33,10 @@ class NestedTessellations(Tessellation):
     """
     __slots__ = ('_parent', '_children', 'child_factory', \
         'parent_index_arguments', 'child_factory_arguments', \
-        '_cell_centers')
+        '_cell_centers', '_cell_volume')
 
     __lazy__ = Tessellation.__lazy__ + ('cell_label', 'cell_adjacency', 'adjacency_label', \
-        'cell_centers')
+        'cell_centers', 'cell_volume')
 
     def __init__(self, scaler=None, parent=None, factory=None, parent_index_arguments={}, **kwargs):
         Tessellation.__init__(self, scaler)
@@ -46,6 +46,7 @@ class NestedTessellations(Tessellation):
         self.parent_index_arguments = parent_index_arguments
         self.child_factory_arguments = kwargs
         self._cell_centers = None
+        self._cell_volume = None
 
     @property
     def parent(self):
@@ -67,6 +68,7 @@ class NestedTessellations(Tessellation):
         self.cell_adjacency = None
         self.adjacency_label = None
         self.cell_centers = None
+        self.cell_volume = None
         self._children = tessellations
 
     def _parent_index(self, points):
@@ -306,6 +308,23 @@ class NestedTessellations(Tessellation):
     def cell_centers(self, centers):
         self.__lazyassert__(centers)
 
+    @property
+    def cell_volume(self):
+        if self._cell_volume is None:
+            try:
+                volumes = []
+                for child in self.children.values():
+                    volumes.append(child.cell_volume)
+            except AttributeError:
+                raise AttributeError("'NestedTessellations' object has no attribute 'cell_volume'")
+            else:
+                self._cell_volume = np.concatenate(volumes)
+        return self.__returnlazy__('cell_volume', self._cell_volume)
+
+    @cell_volume.setter
+    def cell_volume(self, volumes):
+        self.__lazyassert__(volumes)
+
     def child_cell_indices(self, u):
         """
         Arguments:
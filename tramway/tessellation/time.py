@@ -20,6 +20,42 @@ import copy
 import scipy.sparse as sparse
 
 
+def _time_segment(sorted_ts, order, start, stop, center, min_n=None, max_n=None):
+    """
+    Select the points in a time segment.
+
+    Arguments:
+
+        sorted_ts (numpy.ndarray): sorted timestamps.
+
+        order (numpy.ndarray): row indices of the sorted timestamps.
+
+        start, stop (int): range of the segment in `sorted_ts`.
+
+        center (float): center of the segment.
+
+        min_n, max_n (int): minimum and maximum numbers of points;
+            missing points and excess points are taken or discarded by distance
+            to the center of the segment.
+
+    Returns:
+
+        numpy.ndarray: sorted row indices of the selected points.
+    """
+    n = stop - start
+    if max_n and max_n < n:
+        i = start + np.argsort(np.abs(sorted_ts[start:stop] - center))[:max_n]
+    elif min_n and n < min_n:
+        # the `min_n` nearest points are no further than `min_n` positions
+        # from the segment in the sorted timestamps
+        lower, upper = max(0, start - min_n), min(sorted_ts.size, stop + min_n)
+        i = lower + np.argsort(np.abs(sorted_ts[lower:upper] - center))[:min_n]
+        i = np.union1d(np.arange(start, stop), i)
+    else:
+        i = slice(start, stop)
+    return np.sort(order[i])
+
+
 class TimeLattice(Tessellation):
     """Proxy `Tessellation` for time lattice expansion.
 
@@ -144,9 +180,13 @@ class TimeLattice(Tessellation):
             ts = points[:,time_col]
         time = self.time_lattice
         nsegments = time.shape[0]
+        # sort the timestamps once for all;
+        # the points in a time segment are then found as a range of the sorted timestamps
+        order = np.argsort(ts, kind='mergesort')
+        sorted_ts = ts[order]
         if time.dtype == int:
             t0 = ts.min()
-            dt = np.unique(np.diff(np.sort(ts)))
+            dt = np.unique(np.diff(sorted_ts))
             if dt[0] == 0:
                 dt = dt[1]
             else:
@@ -164,19 +204,30 @@ class TimeLattice(Tessellation):
             location_count = np.zeros(count_shape, dtype=int)
         ps, cs = [], []
         if time_knn is None:
+            start = np.searchsorted(sorted_ts, time[:,0])
+            stop = np.searchsorted(sorted_ts, time[:,1])
+            spatial_index = None
+            if self.spatial_mesh is not None and not args and not any( kwargs.get(arg) \
+                    for arg in ('knn', 'radius', 'min_location_count', 'filter') ):
+                # the cell a point is assigned to does not depend on the other points;
+                # partition all the points once and slice the index for each segment
+                spatial_index = self.spatial_mesh.cell_index(points, **kwargs)
+                if not isinstance(spatial_index, np.ndarray):
+                    spatial_index = None
             for t in range(nsegments):
-                t0, t1 = time[t]
-                segment = np.logical_and(t0 <= ts, ts < t1)
-                pts, = np.nonzero(segment)
+                pts = np.sort(order[start[t]:stop[t]])
                 if pts.size:
                     if self.spatial_mesh is None:
                         ids = np.full_like(pts, t)
                     else:
-                        if isinstance(points, pd.DataFrame):
-                            points_t = points.iloc[segment]
+                        if spatial_index is None:
+                            if isinstance(points, pd.DataFrame):
+                                points_t = points.iloc[pts]
+                            else:
+                                points_t = points[pts]
+                            ids = self.spatial_mesh.cell_index(points_t, *args, **kwargs)
                         else:
-                            points_t = points[segment]
-                        ids = self.spatial_mesh.cell_index(points_t, *args, **kwargs)
+                            ids = spatial_index[pts]
                         if isinstance(ids, np.ndarray):
                             pass
                         elif isinstance(ids, tuple):
@@ -204,64 +255,47 @@ class TimeLattice(Tessellation):
             _strict_min_n = kwargs.get('min_location_count', None)
             if _strict_min_n is None:
                 _strict_min_n = 0
+            center = time.mean(axis=1)
             if self.spatial_mesh is None:
+                start = np.searchsorted(sorted_ts, time[:,0])
+                stop = np.searchsorted(sorted_ts, time[:,1])
                 for t in range(nsegments):
                     if callable(time_knn):
                         _min_n, _max_n = time_knn(t)
                         # assert _min_n <= _max_n
-                    t0, t1 = time[t]
-                    segment = np.logical_and(t0 <= ts, ts < t1)
-                    _n = np.count_nonzero(segment)
-                    if _n < _strict_min_n:
+                    if stop[t] - start[t] < _strict_min_n:
                         continue
-                    if _max_n and _n < _max_n:
-                        _ts = np.abs(ts[segment] - .5 * (t0 + t1))
-                        _i = np.argsort(_ts)
-                        _segment = np.zeros(_n, dtype=segment.dtype)
-                        _segment[_i[:_max_n]] = True
-                        segment[segment] = _segment
-                    elif _min_n and _n < _min_n:
-                        _ts = np.abs(ts - .5 * (t0 + t1))
-                        _i = np.argsort(_ts)
-                        segment[_i[:_min_n]] = True
-                    pts, = segment.nonzero()
+                    pts = _time_segment(sorted_ts, order, start[t], stop[t], center[t],
+                            _min_n, _max_n)
                     if 0 < pts.size:
                         ps.append(pts)
                         cs.append(np.full(pts.shape, t))
             else:
                 ids = self.spatial_mesh.cell_index(points, *args, **kwargs)
                 if isinstance(ids, np.ndarray):
-                    pts = None
+                    pts = np.arange(ids.size)
                 elif isinstance(ids, tuple):
                     pts, ids = ids
                 else:
                     raise NotImplementedError
+                # group the points by space cell
+                cell_order = np.argsort(ids, kind='mergesort')
+                cell_bounds = np.searchsorted(ids[cell_order], np.arange(ncells + 1))
                 for i in range(ncells):#np.unique(ids):
-                    if pts is None:
-                        pts_i, = (ids==i).nonzero()
-                    else:
-                        pts_i = pts[ids==i]
+                    pts_i = pts[cell_order[cell_bounds[i]:cell_bounds[i+1]]]
                     ts_i = ts[pts_i]
+                    order_i = np.argsort(ts_i, kind='mergesort')
+                    sorted_ts_i = ts_i[order_i]
+                    start = np.searchsorted(sorted_ts_i, time[:,0])
+                    stop = np.searchsorted(sorted_ts_i, time[:,1])
                     for t in range(nsegments):
                         if callable(time_knn):
                             _min_n, _max_n = time_knn(i,t) # i= space cell index, t= time segment index
                             # assert _min_n <= _max_n
-                        t0, t1 = time[t]
-                        segment = np.logical_and(t0 <= ts_i, ts_i < t1)
-                        _n = np.count_nonzero(segment)
-                        if _n < _strict_min_n:
+                        if stop[t] - start[t] < _strict_min_n:
                             continue
-                        if _max_n and _n < _max_n:
-                            _ts = np.abs(ts_i[segment] - .5 * (t0 + t1))
-                            _i = np.argsort(_ts)
-                            _segment = np.zeros(_n, dtype=segment.dtype)
-                            _segment[_i[:_max_n]] = True
-                            segment[segment] = _segment
-                        elif _min_n and _n < _min_n:
-                            _ts = np.abs(ts_i - .5 * (t0 + t1))
-                            _i = np.argsort(_ts)
-                            segment[_i[:_min_n]] = True
-                        pts_t, = segment.nonzero()
+                        pts_t = _time_segment(sorted_ts_i, order_i, start[t], stop[t], center[t],
+                                _min_n, _max_n)
                         if 0 < pts_t.size:
                             pts_t = pts_i[pts_t]
                             ps.append(pts_t)
@@ -277,9 +311,7 @@ class TimeLattice(Tessellation):
             cs = np.concatenate(cs)
             if exclude and count_shape[1:]:
                 i, t = exclude(location_count).nonzero()
-                ok = np.ones(cs.size, dtype=bool)
-                for c in t * ncells + i:
-                    ok[cs == c] = False
+                ok = ~np.isin(cs, t * ncells + i)
                 ps = ps[ok]
                 cs = cs[ok]
         return (ps, cs)